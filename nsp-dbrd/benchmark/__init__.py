@@ -0,0 +1,6 @@
+# Reproducible benchmarks for the dashboard backend.
+#
+#   python -m benchmark.generate --rows 1m --sqlite bench.db
+#   python -m benchmark.harness --sqlite bench.db --requests 50
+#
+# Run from nsp-dbrd/ so the flat backend modules are importable.
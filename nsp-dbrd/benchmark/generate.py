@@ -0,0 +1,410 @@
+import argparse
+import io
+import logging
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataset_engine import APPLICANT_COLUMNS
+from filters import INDEXES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# ----------------- Synthetic NSP Data -----------------
+# Fills the normalized schema the backend queries (mst_* master tables and
+# data_applicant_* fact tables) with
+# seeded, reproducible data shaped like nsp_dashboard.csv: applicants
+# concentrated in a few states, Zipf-distributed scheme popularity, a few
+# large institutions per district, and lognormal family income heaped on
+# round figures. Some applicants list an earlier qualification or a second
+# scheme, so the applicant join repeats them as the live data does. The
+# same 17-column flat file (one row per joined row) can be written with --csv.
+#
+#   python -m benchmark.generate --rows 1m --sqlite bench.db
+#   python -m benchmark.generate --rows 10m --dsn "host=localhost dbname=nsp_bench user=postgres"
+
+# (state, application id prefix, districts, share of applicants)
+STATES = [
+    ('BIHAR', 'BR', 38, 0.200), ('WEST BENGAL', 'WB', 23, 0.110), ('ASSAM', 'AS', 35, 0.080),
+    ('UTTAR PRADESH', 'UP', 75, 0.075), ('ODISHA', 'OR', 30, 0.045), ('KARNATAKA', 'KA', 31, 0.040),
+    ('MADHYA PRADESH', 'MP', 55, 0.035), ('RAJASTHAN', 'RJ', 50, 0.035), ('MAHARASHTRA', 'MH', 36, 0.035),
+    ('PUNJAB', 'PB', 23, 0.030), ('TAMIL NADU', 'TN', 38, 0.030), ('ANDHRA PRADESH', 'AP', 26, 0.028),
+    ('HARYANA', 'HR', 22, 0.025), ('TELANGANA', 'TG', 33, 0.025), ('JHARKHAND', 'JH', 24, 0.025),
+    ('GUJARAT', 'GJ', 33, 0.022), ('KERALA', 'KL', 14, 0.022), ('HIMACHAL PRADESH', 'HP', 12, 0.018),
+    ('JAMMU AND KASHMIR', 'JK', 20, 0.016), ('CHHATTISGARH', 'CG', 33, 0.015), ('UTTARAKHAND', 'UK', 13, 0.012),
+    ('MANIPUR', 'MN', 16, 0.010), ('TRIPURA', 'TR', 8, 0.008), ('NAGALAND', 'NL', 16, 0.006),
+    ('MIZORAM', 'MZ', 11, 0.005), ('MEGHALAYA', 'ML', 12, 0.005), ('DELHI', 'DL', 11, 0.005),
+    ('ARUNACHAL PRADESH', 'AR', 26, 0.003), ('GOA', 'GA', 2, 0.002), ('SIKKIM', 'SK', 6, 0.002),
+    ('PUDUCHERRY', 'PY', 4, 0.002), ('CHANDIGARH', 'CH', 1, 0.001), ('LADAKH', 'LA', 2, 0.001),
+    ('ANDAMAN AND NICOBAR ISLANDS', 'AN', 3, 0.001), ('LAKSHADWEEP', 'LD', 1, 0.0005),
+    ('DADRA AND NAGAR HAVELI AND DAMAN AND DIU', 'DD', 3, 0.0005),
+]
+
+# (id, name, share) as in the production master tables
+CATEGORIES = [(1, 'SC', 0.18), (2, 'ST', 0.05), (3, 'OBC', 0.51), (4, 'GENERAL', 0.26)]
+MARITAL_STATUSES = [(1, 'Married', 0.023), (2, 'Un Married', 0.976), (4, 'Widow', 0.001)]
+GENDERS = [('M', 0.605), ('F', 0.394), ('T', 0.001)]
+
+CENTRAL_SCHEMES = [
+    'CENTRAL SECTOR SCHEME OF SCHOLARSHIPS FOR COLLEGE AND UNIVERSITY STUDENTS',
+    'NATIONAL MEANS CUM MERIT SCHOLARSHIP',
+]
+SCHEME_FAMILIES = ['POST MATRIC SCHOLARSHIP FOR {} STUDENTS', 'PRE MATRIC SCHOLARSHIP FOR {} STUDENTS',
+                   'MERIT CUM MEANS SCHOLARSHIP FOR {} STUDENTS', 'TOP CLASS EDUCATION SCHEME FOR {} STUDENTS']
+SCHEME_GROUPS = ['SC', 'ST', 'OBC', 'MINORITY', 'DISABILITIES', 'EBC AND DNT', 'WARDS OF BEEDI/CINE WORKERS']
+STATE_SCHEMES = ['STATE MERIT SCHOLARSHIP - {}', 'STATE POST MATRIC SCHOLARSHIP - {}']
+SCHEME_ZIPF = 1.3
+
+# Per-scheme award amounts (centre share, and a state top-up for some schemes)
+CENTRE_AMOUNTS = ([12000, 0, 50000, 80000, 25000, 6000, 3000, 1500], [0.55, 0.15, 0.08, 0.06, 0.06, 0.04, 0.03, 0.03])
+STATE_AMOUNTS = ([8000, 5000, 1400, 13000], [0.35, 0.3, 0.2, 0.15])
+STATE_TOP_UP_SHARE = 0.15
+UNPAID_SHARE = 0.10
+
+# Income: lognormal around the sample median, reported as round figures
+INCOME_MEDIAN = 96000
+INCOME_SIGMA = 0.5
+INCOME_BOUNDS = (6000, 2500000)
+INCOME_ROUNDING = ([10000, 12000, 1000], [0.55, 0.25, 0.20])
+
+APPLICANTS_PER_INSTITUTION = 8
+MAX_INSTITUTIONS = 150000
+HOME_INSTITUTION_SHARE = 0.85
+# (extra rows per applicant, share): earlier qualifications, second schemes
+EXTRA_QUALIFICATIONS = ([0, 1, 2], [0.75, 0.2, 0.05])
+EXTRA_SCHEMES = ([0, 1], [0.93, 0.07])
+STREETS = np.array(['MAIN ROAD', 'STATION ROAD', 'COLLEGE ROAD', 'NEW COLONY', 'WARD NO 5', 'BAZAR',
+                    'NAGAR', 'MOHALLA', 'VILLAGE', 'PO', 'GANDHI ROAD', 'NEHRU NAGAR'])
+YEAR_START = np.datetime64('2024-07-01T00:00:00')
+YEAR_SECONDS = 274 * 86400
+
+ROW_SUFFIXES = {'k': 1000, 'm': 1000000}
+
+SCHEMA = [
+    "CREATE TABLE mst_states (state_id INTEGER PRIMARY KEY, state_name VARCHAR(100) NOT NULL)",
+    "CREATE TABLE mst_districts (district_id INTEGER PRIMARY KEY, district_name VARCHAR(100) NOT NULL, state_id INTEGER NOT NULL)",
+    "CREATE TABLE mst_category (category_id INTEGER PRIMARY KEY, category_name VARCHAR(50) NOT NULL)",
+    "CREATE TABLE mst_marital_status (marital_id INTEGER PRIMARY KEY, marital_status_name VARCHAR(50) NOT NULL)",
+    "CREATE TABLE mst_schemes (scheme_id INTEGER PRIMARY KEY, scheme_name VARCHAR(200) NOT NULL)",
+    "CREATE TABLE mst_institution (institution_id BIGINT PRIMARY KEY, institution_name VARCHAR(200), district_id INTEGER)",
+    """CREATE TABLE data_applicant_registration_details (
+        application_id VARCHAR(20) PRIMARY KEY, permanent_address VARCHAR(200), permanent_district_id INTEGER,
+        gender CHAR(1), category_id INTEGER, annual_family_income NUMERIC(12, 2), marital_status INTEGER,
+        fresh_renewal CHAR(1), created_on TIMESTAMP, updated_on TIMESTAMP)""",
+    "CREATE TABLE data_applicant_qualifications (application_id VARCHAR(20) NOT NULL, c_institution_id BIGINT)",
+    "CREATE TABLE data_applicant_applied_schemes (application_id VARCHAR(20) NOT NULL, scheme_id INTEGER)",
+    """CREATE TABLE data_applicant_payments_calculation (
+        application_id VARCHAR(20) NOT NULL, pay_amt_state_shr NUMERIC(12, 2), pay_amt_centre_shr NUMERIC(12, 2),
+        updated_on TIMESTAMP)""",
+]
+TABLES = ['mst_states', 'mst_districts', 'mst_category', 'mst_marital_status', 'mst_schemes', 'mst_institution',
+          'data_applicant_registration_details', 'data_applicant_qualifications',
+          'data_applicant_applied_schemes', 'data_applicant_payments_calculation']
+
+# Join keys and the data-version lookups, on top of the drill-down filter indexes.
+BENCHMARK_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_qualifications_application ON data_applicant_qualifications (application_id)",
+    "CREATE INDEX IF NOT EXISTS idx_applied_schemes_application ON data_applicant_applied_schemes (application_id)",
+    "CREATE INDEX IF NOT EXISTS idx_payments_application ON data_applicant_payments_calculation (application_id)",
+    "CREATE INDEX IF NOT EXISTS idx_registration_updated_on ON data_applicant_registration_details (updated_on)",
+    "CREATE INDEX IF NOT EXISTS idx_payments_updated_on ON data_applicant_payments_calculation (updated_on)",
+] + INDEXES
+
+
+def parse_rows(value: str):
+    """'10k', '1m', '10m' or a plain number."""
+    value = value.strip().lower()
+    if value[-1:] in ROW_SUFFIXES:
+        return int(float(value[:-1]) * ROW_SUFFIXES[value[-1]])
+    return int(value)
+
+
+def zipf_weights(n: int, exponent: float):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+# ----------------- Master Tables -----------------
+class SyntheticMasters:
+    """Master tables plus the sampling weights applicant rows are drawn with."""
+
+    def __init__(self, rows: int, rng):
+        self.states = pd.DataFrame({
+            'state_id': np.arange(1, len(STATES) + 1),
+            'state_name': [name for name, _, _, _ in STATES],
+        })
+
+        district_state = np.repeat(np.arange(len(STATES)), [count for _, _, count, _ in STATES])
+        self.districts = pd.DataFrame({
+            'district_id': np.arange(1, len(district_state) + 1),
+            'district_name': [f"{STATES[s][1]} DISTRICT {i + 1}" for s, i in zip(district_state, self._ordinals(district_state))],
+            'state_id': district_state + 1,
+        })
+        # Districts within a state differ a lot in size; the state shares are kept.
+        sizes = rng.lognormal(0, 0.8, len(district_state))
+        state_share = np.array([share for _, _, _, share in STATES])
+        self.district_p = sizes / np.bincount(district_state, weights=sizes)[district_state] * state_share[district_state]
+        self.district_p /= self.district_p.sum()
+        self.district_prefix = np.array([STATES[s][1] for s in district_state])
+
+        self.category = pd.DataFrame(CATEGORIES, columns=['category_id', 'category_name', 'share'])
+        self.marital_status = pd.DataFrame(MARITAL_STATUSES, columns=['marital_id', 'marital_status_name', 'share'])
+
+        names = list(CENTRAL_SCHEMES)
+        names += [family.format(group) for family in SCHEME_FAMILIES for group in SCHEME_GROUPS]
+        names += [template.format(state) for template in STATE_SCHEMES for state, _, _, _ in STATES]
+        self.schemes = pd.DataFrame({'scheme_id': np.arange(1, len(names) + 1), 'scheme_name': names})
+        self.scheme_p = zipf_weights(len(names), SCHEME_ZIPF)
+        self.scheme_centre = rng.choice(CENTRE_AMOUNTS[0], len(names), p=CENTRE_AMOUNTS[1]).astype(float)
+        self.scheme_centre[:len(CENTRAL_SCHEMES)] = 12000
+        self.scheme_state = np.where(rng.random(len(names)) < STATE_TOP_UP_SHARE,
+                                     rng.choice(STATE_AMOUNTS[0], len(names), p=STATE_AMOUNTS[1]), 0).astype(float)
+
+        # Institutions sit in districts in proportion to applicants, sorted by
+        # district so each district's institutions are one contiguous range.
+        count = int(np.clip(rows // APPLICANTS_PER_INSTITUTION, 100, MAX_INSTITUTIONS))
+        ids = rng.choice(np.int64(99999900000), count, replace=False) + 100000
+        district = np.sort(rng.choice(len(district_state), count, p=self.district_p))
+        self.institution = pd.DataFrame({
+            'institution_id': ids,
+            'institution_name': [f"INSTITUTE {i}" for i in ids],
+            'district_id': district + 1,
+        })
+        self.institution_offsets = np.searchsorted(district, np.arange(len(district_state) + 1))
+
+    @staticmethod
+    def _ordinals(groups):
+        # Position of each element within its (contiguous) group.
+        starts = np.searchsorted(groups, groups)
+        return np.arange(len(groups)) - starts
+
+    def tables(self):
+        return {
+            'mst_states': self.states,
+            'mst_districts': self.districts,
+            'mst_category': self.category[['category_id', 'category_name']],
+            'mst_marital_status': self.marital_status[['marital_id', 'marital_status_name']],
+            'mst_schemes': self.schemes,
+            'mst_institution': self.institution,
+        }
+
+
+# ----------------- Applicant Rows -----------------
+def timestamps(seconds):
+    return np.char.replace(np.datetime_as_string(YEAR_START + seconds.astype('timedelta64[s]'), unit='s'), 'T', ' ')
+
+
+def heaped_income(rng, size: int):
+    income = rng.lognormal(np.log(INCOME_MEDIAN), INCOME_SIGMA, size)
+    step = rng.choice(INCOME_ROUNDING[0], size, p=INCOME_ROUNDING[1])
+    return np.clip(np.round(income / step) * step, *INCOME_BOUNDS)
+
+
+def extra_rows(rng, size: int, extra):
+    """Applicant positions, each repeated once per extra row it has."""
+    return np.repeat(np.arange(size), rng.choice(extra[0], size, p=extra[1]))
+
+
+def institutions(masters: SyntheticMasters, district, rng):
+    # Most applicants study in their home district, at one of its larger institutions.
+    first = masters.institution_offsets[district]
+    available = masters.institution_offsets[district + 1] - first
+    home = (rng.random(len(district)) < HOME_INSTITUTION_SHARE) & (available > 0)
+    local = first + (rng.random(len(district)) ** 2 * available).astype(np.int64)
+    return np.where(home, local, rng.integers(0, len(masters.institution), len(district)))
+
+
+def applicant_chunk(masters: SyntheticMasters, start: int, size: int, rng, fresh_renewal: str = 'F'):
+    """One chunk of applications as {fact table: DataFrame}."""
+    district = rng.choice(len(masters.district_p), size, p=masters.district_p)
+    seq = np.arange(start + 1, start + size + 1)
+    application_id = np.array([f"{prefix}202425{n:09d}" for prefix, n in zip(masters.district_prefix[district], seq)])
+
+    institution = institutions(masters, district, rng)
+    scheme = rng.choice(len(masters.schemes), size, p=masters.scheme_p)
+    # Payments follow the first scheme applied for.
+    extra_qualification = extra_rows(rng, size, EXTRA_QUALIFICATIONS)
+    extra_scheme = extra_rows(rng, size, EXTRA_SCHEMES)
+    qualification_rows = np.r_[np.arange(size), extra_qualification]
+    scheme_rows = np.r_[np.arange(size), extra_scheme]
+    institution = np.r_[institution, institutions(masters, district[extra_qualification], rng)]
+    applied = np.r_[scheme, rng.choice(len(masters.schemes), len(extra_scheme), p=masters.scheme_p)]
+    category = rng.choice(masters.category['category_id'].to_numpy(), size, p=masters.category['share'].to_numpy())
+    marital = rng.choice(masters.marital_status['marital_id'].to_numpy(), size, p=masters.marital_status['share'].to_numpy())
+    gender = rng.choice([g for g, _ in GENDERS], size, p=[p for _, p in GENDERS])
+
+    paid = rng.random(size) >= UNPAID_SHARE
+    state_share = np.where(paid, masters.scheme_state[scheme], np.nan)
+    centre_share = np.where(paid, masters.scheme_centre[scheme], np.nan)
+
+    created = rng.integers(0, YEAR_SECONDS, size)
+    updated = created + rng.integers(0, 60 * 86400, size)
+    address = np.char.add(np.char.add(rng.integers(1, 1000, size).astype(str), ' '), rng.choice(STREETS, size))
+
+    registration = pd.DataFrame({
+        'application_id': application_id,
+        'permanent_address': address,
+        'permanent_district_id': district + 1,
+        'gender': gender,
+        'category_id': category,
+        'annual_family_income': heaped_income(rng, size),
+        'marital_status': marital,
+        'fresh_renewal': fresh_renewal,
+        'created_on': timestamps(created),
+        'updated_on': timestamps(updated),
+    })
+    facts = {
+        'data_applicant_registration_details': registration,
+        'data_applicant_qualifications': pd.DataFrame({
+            'application_id': application_id[qualification_rows],
+            'c_institution_id': masters.institution['institution_id'].to_numpy()[institution],
+        }),
+        'data_applicant_applied_schemes': pd.DataFrame({
+            'application_id': application_id[scheme_rows],
+            'scheme_id': applied + 1,
+        }),
+        'data_applicant_payments_calculation': pd.DataFrame({
+            'application_id': application_id,
+            'pay_amt_state_shr': state_share,
+            'pay_amt_centre_shr': centre_share,
+            'updated_on': timestamps(updated + rng.integers(0, 30 * 86400, size)),
+        }),
+    }
+    return facts
+
+
+def flat_chunk(masters: SyntheticMasters, facts: dict):
+    """The facts joined as nsp_dashboard.csv rows (APPLICANT_COLUMNS order)."""
+    df = facts['data_applicant_registration_details'].drop(columns=['created_on', 'updated_on'])
+    for table in ('data_applicant_qualifications', 'data_applicant_applied_schemes', 'data_applicant_payments_calculation'):
+        df = df.merge(facts[table].drop(columns=['updated_on'], errors='ignore'), on='application_id')
+
+    districts = masters.districts.set_index('district_id')
+    states = masters.states.set_index('state_id')['state_name']
+    institution_district = masters.institution.set_index('institution_id')['district_id']
+    df['district_name'] = districts['district_name'].reindex(df['permanent_district_id']).to_numpy()
+    df['state_name'] = states.reindex(districts['state_id'].reindex(df['permanent_district_id'])).to_numpy()
+    df['category_name'] = masters.category.set_index('category_id')['category_name'].reindex(df['category_id']).to_numpy()
+    df['marital_status_name'] = (masters.marital_status.set_index('marital_id')['marital_status_name']
+                                 .reindex(df['marital_status']).to_numpy())
+    df['institute_district'] = districts['district_name'].reindex(
+        institution_district.reindex(df['c_institution_id'])).to_numpy()
+    df['scheme_name'] = masters.schemes.set_index('scheme_id')['scheme_name'].reindex(df['scheme_id']).to_numpy()
+    return df[APPLICANT_COLUMNS]
+
+
+# ----------------- Targets -----------------
+class SQLiteTarget:
+    def __init__(self, path: str):
+        import sqlite3
+
+        self.name = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode = OFF")
+        self.conn.execute("PRAGMA synchronous = OFF")
+
+    def existing_tables(self):
+        rows = self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        return [name for (name,) in rows if name in TABLES]
+
+    def execute(self, statement: str):
+        self.conn.execute(statement)
+
+    def insert(self, table: str, df):
+        # sqlite3 takes Python scalars only; NaN becomes NULL.
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        placeholders = ", ".join("?" for _ in df.columns)
+        self.conn.executemany(f"INSERT INTO {table} ({', '.join(df.columns)}) VALUES ({placeholders})", rows)
+
+    def finish(self):
+        self.conn.execute("ANALYZE")
+        self.conn.commit()
+        self.conn.close()
+
+
+class PostgresTarget:
+    def __init__(self, dsn: str):
+        import psycopg2
+
+        self.name = dsn
+        self.conn = psycopg2.connect(dsn)
+
+    def existing_tables(self):
+        cur = self.conn.cursor()
+        cur.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = current_schema()")
+        return [name for (name,) in cur.fetchall() if name in TABLES]
+
+    def execute(self, statement: str):
+        self.conn.cursor().execute(statement)
+
+    def insert(self, table: str, df):
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        self.conn.cursor().copy_expert(f"COPY {table} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+    def finish(self):
+        self.conn.commit()
+        self.conn.autocommit = True
+        self.conn.cursor().execute("ANALYZE")
+        self.conn.close()
+
+
+# ----------------- Generation -----------------
+def generate(target, rows: int, seed: int = 2425, chunk_size: int = 200000, fresh_renewal: str = 'F',
+             replace: bool = False, csv_path: str = None):
+    existing = target.existing_tables()
+    if existing and not replace:
+        raise RuntimeError(f"{target.name} already has {', '.join(existing)}; pass --replace to drop them")
+    for table in existing:
+        target.execute(f"DROP TABLE {table}")
+    for statement in SCHEMA:
+        target.execute(statement)
+
+    started = time.monotonic()
+    rng = np.random.default_rng(seed)
+    masters = SyntheticMasters(rows, rng)
+    for table, df in masters.tables().items():
+        target.insert(table, df)
+
+    for start in range(0, rows, chunk_size):
+        size = min(chunk_size, rows - start)
+        facts = applicant_chunk(masters, start, size, rng, fresh_renewal)
+        for table, df in facts.items():
+            target.insert(table, df)
+        if csv_path:
+            flat_chunk(masters, facts).to_csv(csv_path, mode='w' if start == 0 else 'a', header=start == 0, index=False)
+        logger.info(f"Generated {start + size}/{rows} applications ({time.monotonic() - started:.1f}s)")
+
+    for statement in BENCHMARK_INDEXES:
+        target.execute(statement)
+    target.finish()
+    logger.info(f"Loaded {rows} applications into {target.name} in {time.monotonic() - started:.1f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic NSP database for benchmarking.")
+    parser.add_argument('--rows', default='10k', help="applications to generate, e.g. 10k, 1m, 10m")
+    destination = parser.add_mutually_exclusive_group(required=True)
+    destination.add_argument('--sqlite', help="SQLite database file")
+    destination.add_argument('--dsn', help="PostgreSQL connection string")
+    parser.add_argument('--seed', type=int, default=2425)
+    parser.add_argument('--chunk-size', type=int, default=200000)
+    parser.add_argument('--fresh-renewal', default='F', choices=['F', 'R'])
+    parser.add_argument('--csv', help="also write the flat 17-column file (as nsp_dashboard.csv)")
+    parser.add_argument('--replace', action='store_true', help="drop existing benchmark tables first")
+    args = parser.parse_args(argv)
+
+    target = SQLiteTarget(args.sqlite) if args.sqlite else PostgresTarget(args.dsn)
+    try:
+        generate(target, parse_rows(args.rows), seed=args.seed, chunk_size=args.chunk_size,
+                 fresh_renewal=args.fresh_renewal, replace=args.replace, csv_path=args.csv)
+    except RuntimeError as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
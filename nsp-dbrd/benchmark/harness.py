@@ -0,0 +1,198 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# ----------------- Benchmark Harness -----------------
+# Points the Flask app's connection pools at a generated database and
+# measures, per GET /api/* endpoint, the cold first request (master data and
+# dataset loads included) and then latency percentiles and throughput over
+# repeated requests from concurrent clients. The aggregation functions are
+# timed directly on the same data: the joined-frame load, frame_result and
+# build_payload per widget, the streaming pass and the pushed-down SQL.
+#
+#   python -m benchmark.harness --sqlite bench.db --source sql --requests 50 --concurrency 4
+#   python -m benchmark.harness --dsn "host=localhost dbname=nsp_bench" --json results.json
+SOURCES = ['sql', 'frame', 'stream', 'rollup', 'snapshot']
+# Endpoints that write snapshots, dump the whole dataset or only report internal state.
+SKIPPED_ENDPOINTS = {'/api/snapshot', '/api/export', '/api/health', '/api/pool-stats', '/api/coalescing-stats'}
+# Parameters an endpoint cannot be requested without.
+ENDPOINT_PARAMS = {'/api/payment-slice': 'by=category&by=gender'}
+
+
+def connection_factory(args):
+    if args.sqlite:
+        from benchmark.sqlite_backend import SQLiteConnection
+
+        return lambda config: SQLiteConnection(args.sqlite)
+
+    import psycopg2
+    from psycopg2.extras import DictCursor
+
+    return lambda config: psycopg2.connect(args.dsn, cursor_factory=DictCursor)
+
+
+def load_app(args):
+    # nsp_dash reads its configuration at import time. Pre-warming would
+    # answer unfiltered requests from memory; set NSP_PREWARM_INTERVAL to
+    # benchmark that instead of the metric source.
+    os.environ['NSP_METRIC_SOURCE'] = args.source
+    os.environ.setdefault('NSP_PREWARM_INTERVAL', '0')
+    # Connections come from the target below, not from db_config.
+    for prefix in ('MAIN_DB', 'NSP_FRESH_DB', 'NSP_RENEWAL_DB'):
+        os.environ.setdefault(f'{prefix}_PASSWORD', '')
+    import nsp_dash
+    from db_pool import PoolRegistry
+
+    nsp_dash.pools = PoolRegistry(nsp_dash.DB_CONFIGS, factory=connection_factory(args),
+                                  maxconn=max(args.concurrency, 2), timeout=60)
+    if args.source == 'snapshot':
+        # Served from files (NSP_SNAPSHOT_DIR); write them from the target first.
+        conn = nsp_dash.pools.get_connection('nsp_fresh')
+        try:
+            nsp_dash.snapshots.write(conn, 'nsp_fresh')
+        finally:
+            conn.close()
+    return nsp_dash
+
+
+def api_endpoints(app):
+    return sorted(
+        rule.rule for rule in app.url_map.iter_rules()
+        if rule.rule.startswith('/api/') and 'GET' in rule.methods and not rule.arguments
+        and rule.rule not in SKIPPED_ENDPOINTS
+    )
+
+
+def summarize(latencies, wall: float = None):
+    latencies = np.asarray(latencies, dtype=float) * 1000
+    summary = {
+        "n": int(latencies.size),
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "max_ms": float(latencies.max()),
+    }
+    if wall:
+        summary["throughput_rps"] = latencies.size / wall
+    return summary
+
+
+# ----------------- Endpoints -----------------
+def bench_endpoint(app, path: str, requests: int, concurrency: int):
+    local = threading.local()
+
+    def one(_):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        started = time.perf_counter()
+        response = client.get(path)
+        elapsed = time.perf_counter() - started
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        return elapsed
+
+    cold = one(None)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(one, range(requests)))
+    summary = summarize(latencies, time.perf_counter() - started)
+    summary["cold_ms"] = cold * 1000
+    return summary
+
+
+def bench_endpoints(nsp_dash, args):
+    results = {}
+    for path in api_endpoints(nsp_dash.app):
+        query = "&".join(part for part in (ENDPOINT_PARAMS.get(path), args.query) if part)
+        results[path] = bench_endpoint(nsp_dash.app, f"{path}?{query}" if query else path, args.requests, args.concurrency)
+    return results
+
+
+# ----------------- Aggregation Functions -----------------
+def repeat(fn, repeats: int):
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies), result
+
+
+def bench_aggregations(nsp_dash, args):
+    from dataset_engine import load_dataset, prepare_frame
+    from master_data import MasterData
+    from metrics import METRICS, build_payload, frame_result
+    from sql_metrics import fetch_metric
+    from stream_engine import stream_aggregates
+
+    results = {}
+    conn = nsp_dash.pools.get_connection('nsp_fresh')
+    try:
+        results['MasterData.load'], masters = repeat(lambda: MasterData.load(conn), args.repeats)
+        results['load_dataset'], df = repeat(lambda: load_dataset(conn, masters=masters), args.repeats)
+        df = prepare_frame(df)
+        results['stream_aggregates'], _ = repeat(lambda: stream_aggregates(conn, masters=masters), args.repeats)
+        for name in METRICS:
+            results[f"frame_result[{name}]"], result = repeat(lambda: frame_result(df, name), args.repeats)
+            results[f"build_payload[{name}]"], _ = repeat(lambda: build_payload(name, result), args.repeats)
+            results[f"fetch_metric[{name}]"], _ = repeat(lambda: fetch_metric(conn, name, masters), args.repeats)
+    finally:
+        conn.close()
+    return results
+
+
+# ----------------- Report -----------------
+def print_table(title: str, results: dict):
+    columns = ['n', 'cold_ms', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'throughput_rps']
+    shown = [column for column in columns if any(column in summary for summary in results.values())]
+    width = max(len(name) for name in results)
+    print(f"\n{title}")
+    print(f"{'':{width}}  " + "  ".join(f"{column:>14}" for column in shown))
+    for name, summary in results.items():
+        cells = [f"{summary[column]:>14.1f}" if column in summary else f"{'':>14}" for column in shown]
+        print(f"{name:{width}}  " + "  ".join(cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard API and aggregation functions.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--sqlite', help="SQLite database written by benchmark.generate")
+    target.add_argument('--dsn', help="PostgreSQL connection string")
+    parser.add_argument('--source', default='sql', choices=SOURCES, help="NSP_METRIC_SOURCE to serve from")
+    parser.add_argument('--requests', type=int, default=20, help="timed requests per endpoint after the cold one")
+    parser.add_argument('--concurrency', type=int, default=1, help="concurrent clients per endpoint")
+    parser.add_argument('--repeats', type=int, default=3, help="runs per aggregation function")
+    parser.add_argument('--query', default='', help="query string added to every endpoint, e.g. 'state=BIHAR'")
+    parser.add_argument('--skip-endpoints', action='store_true')
+    parser.add_argument('--skip-aggregations', action='store_true')
+    parser.add_argument('--json', help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    nsp_dash = load_app(args)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = {"source": args.source, "target": args.sqlite or 'postgresql'}
+    if not args.skip_endpoints:
+        results["endpoints"] = bench_endpoints(nsp_dash, args)
+        print_table(f"Endpoints (source={args.source}, concurrency={args.concurrency})", results["endpoints"])
+    if not args.skip_aggregations:
+        results["aggregations"] = bench_aggregations(nsp_dash, args)
+        print_table("Aggregation functions", results["aggregations"])
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
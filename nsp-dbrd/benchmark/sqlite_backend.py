@@ -0,0 +1,72 @@
+import sqlite3
+
+# ----------------- SQLite Target -----------------
+# Lets the backend run against a generated SQLite file instead of
+# PostgreSQL: psycopg2-style %s placeholders become ?, and named
+# (server-side) cursors become ordinary cursors that still honour
+# fetchmany/itersize. Only what the backend calls is provided.
+
+
+class SQLiteCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.itersize = 2000
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, query, params=None):
+        self._cursor.execute(query.replace('%s', '?'), tuple(params or ()))
+        return self
+
+    def executemany(self, query, rows):
+        self._cursor.executemany(query.replace('%s', '?'), rows)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self.itersize)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        while True:
+            rows = self._cursor.fetchmany(self.itersize)
+            if not rows:
+                return
+            yield from rows
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+    # SQLite has no GROUPING SETS; fused metric queries fall back to UNION ALL.
+    grouping_sets = False
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self.closed = 0
+
+    def cursor(self, name=None, **kwargs):
+        return SQLiteCursor(self._conn.cursor())
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        if not self.closed:
+            self._conn.close()
+            self.closed = 1
@@ -0,0 +1,217 @@
+import logging
+import threading
+import time
+
+import pandas as pd
+
+from db_pool import DatabaseUnavailable
+from instrumentation import timed
+from master_data import current_masters
+from schema import apply_schema
+
+logger = logging.getLogger(__name__)
+
+# ----------------- Applicant Join -----------------
+# Only the data_applicant_* fact tables are joined in SQL; master-table
+# labels (district, state, category, marital status, institute district,
+# scheme) are resolved in memory from the master-data cache.
+APPLICANT_COLUMNS = [
+    'application_id', 'permanent_address', 'district_name', 'state_name', 'gender', 'category_name',
+    'category_id', 'pay_amt_state_shr', 'pay_amt_centre_shr', 'annual_family_income', 'marital_status',
+    'marital_status_name', 'fresh_renewal', 'c_institution_id', 'institute_district', 'scheme_id', 'scheme_name',
+]
+
+FACT_COLUMNS = {
+    'application_id': "r.application_id",
+    'permanent_address': "r.permanent_address",
+    'permanent_district_id': "r.permanent_district_id",
+    'gender': "r.gender",
+    'category_id': "r.category_id",
+    'pay_amt_state_shr': "pay.pay_amt_state_shr",
+    'pay_amt_centre_shr': "pay.pay_amt_centre_shr",
+    'annual_family_income': "r.annual_family_income",
+    'marital_status': "r.marital_status",
+    'fresh_renewal': "r.fresh_renewal",
+    'c_institution_id': "q.c_institution_id",
+    'scheme_id': "sch.scheme_id",
+    # Last-modified timestamps of the fact tables, used by incremental refreshes.
+    'registration_updated_on': "r.updated_on as registration_updated_on",
+    'payment_updated_on': "pay.updated_on as payment_updated_on",
+}
+
+# Ids every row needs so labels can be resolved (and unmatched rows dropped).
+KEY_COLUMNS = ['permanent_district_id', 'category_id', 'marital_status', 'c_institution_id', 'scheme_id']
+
+NUMERIC_COLS = ["pay_amt_state_shr", "pay_amt_centre_shr", "annual_family_income"]
+
+APPLICANT_TABLE = "FROM data_applicant_registration_details r"
+APPLICANT_JOINS = """
+    join data_applicant_qualifications q on q.application_id = r.application_id
+    join data_applicant_applied_schemes sch on sch.application_id = r.application_id
+    join data_applicant_payments_calculation pay on pay.application_id = r.application_id
+"""
+
+
+def fact_columns(columns=None):
+    selected = list(KEY_COLUMNS)
+    for col in columns or APPLICANT_COLUMNS:
+        if col in FACT_COLUMNS and col not in selected:
+            selected.append(col)
+    return selected
+
+
+def applicant_query(columns=None, limit: int = None, where: str = None, order_by: str = None, ids: str = None):
+    select = ",\n        ".join(FACT_COLUMNS[col] for col in fact_columns(columns))
+    source = APPLICANT_TABLE
+    if ids:
+        # Only the applications listed by the ``ids`` subquery (one
+        # application_id column), joined before the fact tables.
+        source = (f"FROM ({ids}) selected\n"
+                  f"    join data_applicant_registration_details r on r.application_id = selected.application_id")
+    query = f"\n    SELECT {select}\n    {source}{APPLICANT_JOINS}"
+    if where:
+        query += f"    WHERE {where}\n"
+    if order_by:
+        query += f"    ORDER BY {order_by}\n"
+    if limit:
+        query += f"    limit {int(limit)}\n"
+    return query
+
+
+def resolve_rows(results, columns, masters):
+    """Turns fact rows fetched with ``applicant_query(columns)`` into the
+    requested applicant columns, labels resolved from ``masters``."""
+    raw = pd.DataFrame(results, columns=fact_columns(columns))
+    return masters.resolve(raw, columns)
+
+
+def build_frame(results, columns, masters):
+    return apply_schema(prepare_frame(resolve_rows(results, columns, masters)))
+
+
+def prepare_frame(df):
+    for col in NUMERIC_COLS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+
+    df = df.dropna(subset=["pay_amt_state_shr", "pay_amt_centre_shr"], how="all")
+    df['payment_amt_share'] = df[['pay_amt_state_shr', 'pay_amt_centre_shr']].sum(axis=1)
+    return df
+
+
+def load_dataset(conn, limit: int = None, masters=None):
+    data = current_masters(conn, masters)
+    cur = conn.cursor()
+    with timed('query'):
+        cur.execute(applicant_query(limit=limit))
+    with timed('fetch'):
+        results = cur.fetchall()
+    with timed('frame'):
+        return build_frame(results, APPLICANT_COLUMNS, data)
+
+
+# ----------------- TTL Cache -----------------
+class DatasetCache:
+    """Shares one joined applicant frame per database across requests.
+
+    The frame is rebuilt when it is older than ``ttl`` seconds or after
+    ``invalidate()``. Concurrent misses for the same database wait on a
+    per-key lock, so only one of them runs the join. ``loader(conn)``
+    builds the cached value; any loader returning a sized object works.
+
+    With ``serve_stale`` an expired or invalidated value is still returned
+    while a background thread reloads it; only the very first load blocks
+    (peek() does not wait even for that).
+    """
+
+    def __init__(self, connect, ttl: float = 300, loader=load_dataset, serve_stale: bool = False):
+        self._connect = connect
+        self._loader = loader
+        self.ttl = ttl
+        self.serve_stale = serve_stale
+        self._entries = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, db_key: str):
+        with self._guard:
+            return self._locks.setdefault(db_key, threading.Lock())
+
+    def _fresh(self, db_key: str):
+        entry = self._entries.get(db_key)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    def get(self, db_key: str):
+        df = self._fresh(db_key)
+        if df is not None:
+            return df
+
+        entry = self._entries.get(db_key)
+        if self.serve_stale and entry is not None:
+            self._reload_in_background(db_key)
+            return entry[1]
+
+        with self._lock_for(db_key):
+            df = self._fresh(db_key)
+            if df is not None:
+                return df
+            return self._load(db_key)
+
+    def _load(self, db_key: str):
+        conn = self._connect(db_key)
+        if not conn:
+            raise DatabaseUnavailable(db_key)
+        try:
+            started = time.monotonic()
+            df = self._loader(conn)
+            logger.info(f"Loaded {len(df)} applicant rows from {db_key} in {time.monotonic() - started:.2f}s")
+        finally:
+            conn.close()
+
+        self._entries[db_key] = (time.monotonic(), df, time.time())
+        return df
+
+    def _reload_in_background(self, db_key: str):
+        lock = self._lock_for(db_key)
+        if not lock.acquire(blocking=False):
+            return  # already reloading
+
+        def reload():
+            try:
+                self._load(db_key)
+            except Exception as e:
+                logger.error(f"Reloading {db_key} failed, still serving the previous load: {e}")
+            finally:
+                lock.release()
+
+        threading.Thread(target=reload, name=f'nsp-reload-{db_key}', daemon=True).start()
+
+    def peek(self, db_key: str):
+        """get() without waiting: the cached value (an expired one too, with
+        ``serve_stale``), or None while a background thread loads it."""
+        df = self._fresh(db_key)
+        if df is not None:
+            return df
+        self._reload_in_background(db_key)
+        entry = self._entries.get(db_key)
+        return entry[1] if self.serve_stale and entry is not None else None
+
+    def version(self, db_key: str):
+        """Wall-clock load time of the cached value, or None if it is
+        missing or expired (the next get() reloads it). With
+        ``serve_stale``, the load time of whatever get() serves."""
+        entry = self._entries.get(db_key)
+        if entry and (self.serve_stale or time.monotonic() - entry[0] < self.ttl):
+            return entry[2]
+        return None
+
+    def invalidate(self, db_key: str = None):
+        with self._guard:
+            for key in list(self._entries) if db_key is None else [db_key]:
+                if self.serve_stale and key in self._entries:
+                    # Kept, but expired: get() serves it while reloading.
+                    self._entries[key] = (float('-inf'),) + self._entries[key][1:]
+                else:
+                    self._entries.pop(key, None)
@@ -0,0 +1,40 @@
+import os
+
+try:
+    from dotenv import load_dotenv
+except ImportError:  # settings come from the environment only
+    load_dotenv = None
+
+# ----------------- DB Config -----------------
+# Connection settings shared by the Flask app (nsp_dash.py), the async
+# server (nsp_async.py) and the backend app, read from the environment (or
+# a .env file when python-dotenv is installed): <PREFIX>_HOST, _PORT,
+# _USER, _PASSWORD and _DBNAME per database, e.g. NSP_FRESH_DB_PASSWORD.
+# Passwords have no default: a missing one stops the server at startup
+# rather than surfacing later as failed connections.
+if load_dotenv is not None:
+    load_dotenv()
+
+
+def _required(name: str):
+    value = os.getenv(name)
+    if value is None:
+        raise RuntimeError(f"{name} is not set")
+    return value
+
+
+def _db_config(prefix: str, host: str, dbname: str):
+    return {
+        'host': os.getenv(f'{prefix}_HOST', host),
+        'port': int(os.getenv(f'{prefix}_PORT', '5432')),
+        'user': os.getenv(f'{prefix}_USER', 'nspquery'),
+        'password': _required(f'{prefix}_PASSWORD'),
+        'dbname': os.getenv(f'{prefix}_DBNAME', dbname)
+    }
+
+
+DB_CONFIGS = {
+    'main': _db_config('MAIN_DB', '10.192.145.144', 'otrapi_db'),
+    'nsp_fresh': _db_config('NSP_FRESH_DB', '10.192.145.137', 'nsp_fresh_2425'),
+    'nsp_renewal': _db_config('NSP_RENEWAL_DB', '10.192.145.139', 'nsp_renewal_2425')
+}
@@ -0,0 +1,215 @@
+import logging
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2.extras import DictCursor
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseUnavailable(Exception):
+    pass
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def connect(config: dict):
+    return psycopg2.connect(
+        host=config['host'],
+        port=config['port'],
+        user=config['user'],
+        password=config['password'],
+        dbname=config['dbname'],
+        cursor_factory=DictCursor
+    )
+
+
+# ----------------- Pooled Connection -----------------
+class PooledConnection:
+    """Proxy handed to callers. ``close()`` returns the underlying
+    connection to its pool instead of closing the socket, so existing
+    ``finally: conn.close()`` blocks keep working unchanged."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def __del__(self):
+        # A caller that never closed it would otherwise hold its pool slot
+        # for good.
+        if self.__dict__.get('_conn') is not None:
+            logger.warning(f"Returning a leaked connection to {self._pool.db_key}")
+            self.close()
+
+
+# ----------------- Pool -----------------
+class ConnectionPool:
+    def __init__(self, db_key: str, config: dict, minconn: int = 1, maxconn: int = 10,
+                 timeout: float = 10, health_check_after: float = 30, factory=connect):
+        self.db_key = db_key
+        self.config = config
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_after = health_check_after
+        self._factory = factory
+        self._idle = deque()
+        self._size = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+        self.checkouts = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+        for _ in range(minconn):
+            try:
+                self._idle.append((self._factory(config), time.monotonic()))
+                self._size += 1
+            except Exception as e:
+                logger.error(f"Failed to pre-open connection to {db_key}: {e}")
+                break
+
+    def _healthy(self, conn, idle_since: float):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_after:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            conn.rollback()
+            return True
+        except Exception as e:
+            logger.warning(f"Discarding broken connection to {self.db_key}: {e}")
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self.discarded += 1
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        with self._cond:
+            self._waiting += 1
+            try:
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(f"No connection to {self.db_key} available after {self.timeout}s")
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    conn, idle_since = None, None
+                    self._size += 1
+            finally:
+                self._waiting -= 1
+
+            waited = time.monotonic() - started
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+        try:
+            if conn is not None and not self._healthy(conn, idle_since):
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._factory(self.config)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        try:
+            if not conn.closed:
+                conn.rollback()
+        except Exception:
+            self._discard(conn)
+
+        with self._cond:
+            if conn.closed:
+                self._size -= 1
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            in_use = self._size - len(self._idle)
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": in_use,
+                "waiting": self._waiting,
+                "max_size": self.maxconn,
+                "saturation": round(in_use / self.maxconn, 3),
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "discarded": self.discarded,
+                "avg_wait_ms": round(self.wait_seconds / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 3),
+            }
+
+    def closeall(self):
+        with self._cond:
+            while self._idle:
+                conn, _ = self._idle.pop()
+                conn.close()
+                self._size -= 1
+
+
+# ----------------- Registry -----------------
+class PoolRegistry:
+    """One lazily created ConnectionPool per DB_CONFIGS entry."""
+
+    def __init__(self, configs: dict, **pool_options):
+        self.configs = configs
+        self.pool_options = pool_options
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def pool(self, db_key: str):
+        with self._lock:
+            if db_key not in self._pools:
+                self._pools[db_key] = ConnectionPool(db_key, self.configs[db_key], **self.pool_options)
+            return self._pools[db_key]
+
+    def get_connection(self, db_key: str):
+        return self.pool(db_key).acquire()
+
+    def stats(self):
+        with self._lock:
+            pools = dict(self._pools)
+        return {db_key: pool.stats() for db_key, pool in pools.items()}
+
+    def closeall(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.closeall()
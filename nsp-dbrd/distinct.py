@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+
+# ----------------- Distinct Applications -----------------
+# The applicant join repeats an application once per qualification x
+# applied-scheme row, carrying its (single) payment row along, so counts
+# and payment sums are taken over distinct application_ids, not rows.
+# Registration columns (state, gender, category, ...) are the same on every
+# row of an application: grouped by them, an application counts once.
+# Grouped by a fan-out column (institute district, scheme), it counts once
+# per label it has. first_rows() marks one representative row per
+# (application_id, fan-out labels) with a hashed duplicate check, and every
+# count and sum is taken over the marked rows.
+FANOUT_COLUMNS = ['institute_district', 'c_institution_id', 'scheme_name', 'scheme_id']
+
+
+def grain(columns=()):
+    """The fan-out columns among ``columns``: with application_id, the key a
+    group over ``columns`` counts each application once per."""
+    return tuple(col for col in FANOUT_COLUMNS if col in (columns or ()))
+
+
+def application_codes(df):
+    return pd.factorize(df['application_id'])[0].astype(np.int64)
+
+
+def first_rows(df, columns=(), codes=None):
+    """Boolean mask of the first row per (application_id, grain(columns)).
+    ``codes`` are application_codes(df), if already computed. All True for
+    frames without application_id (already one row each)."""
+    if 'application_id' not in df.columns:
+        return np.ones(len(df), dtype=bool)
+    # Integer keys (application code, then each label code) hash much
+    # faster than the application_id strings.
+    key = application_codes(df) if codes is None else codes
+    for col in grain(columns):
+        label_codes, labels = pd.factorize(df[col])
+        key = key * (len(labels) + 1) + (label_codes + 1)
+    return ~pd.Series(key).duplicated().to_numpy()
+
+
+def distinct_rows(df, columns=(), codes=None):
+    mask = first_rows(df, columns, codes)
+    return df if mask.all() else df[mask]
+
+
+class DistinctFrames:
+    """distinct_rows(frame, columns) per grain, each computed once. When no
+    application repeats (``unique``, checked on first use unless given)
+    every grain is the frame itself."""
+
+    def __init__(self, frame, unique: bool = None, codes=None):
+        self.frame = frame
+        self._unique = unique
+        self._codes = codes
+        self._frames = {}
+
+    def take(self, positions):
+        """DistinctFrames over the rows at ``positions``, reusing the codes."""
+        if self.unique:
+            return DistinctFrames(self.frame.iloc[positions], unique=True)
+        return DistinctFrames(self.frame.iloc[positions], codes=self.codes[positions])
+
+    @property
+    def codes(self):
+        if self._codes is None and 'application_id' in self.frame.columns:
+            self._codes = application_codes(self.frame)
+        return self._codes
+
+    @property
+    def unique(self):
+        if self._unique is None:
+            self._frames[()] = distinct_rows(self.frame, codes=self.codes)
+            self._unique = self._frames[()] is self.frame
+        return self._unique
+
+    def first_rows(self, columns=()):
+        if self.unique:
+            return np.ones(len(self.frame), dtype=bool)
+        return first_rows(self.frame, columns, self.codes)
+
+    def get(self, columns=()):
+        if self.unique:
+            return self.frame
+        key = grain(columns)
+        if key not in self._frames:
+            self._frames[key] = distinct_rows(self.frame, key, self.codes)
+        return self._frames[key]
+
+
+# ----------------- Chunked Reads -----------------
+def whole_applications(chunks):
+    """Re-yields frames read in application_id order so that no application
+    is split across two of them: the rows of each chunk's last application
+    are held back and prepended to the next chunk."""
+    pending = None
+    for chunk in chunks:
+        if pending is not None:
+            chunk = pd.concat([pending, chunk], ignore_index=True)
+        if not len(chunk):
+            continue
+        ids = chunk['application_id'].to_numpy()
+        earlier = np.flatnonzero(ids != ids[-1])
+        cut = earlier[-1] + 1 if len(earlier) else 0
+        pending = chunk.iloc[cut:]
+        if cut:
+            yield chunk.iloc[:cut]
+    if pending is not None and len(pending):
+        yield pending
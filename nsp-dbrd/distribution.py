@@ -0,0 +1,228 @@
+import math
+
+import numpy as np
+
+from metrics import HISTOGRAM_BINS, KDE_POINTS
+
+# ----------------- Streaming Distributions -----------------
+# Everything here is built chunk by chunk and is mergeable, so partial
+# results from cursor chunks, workers or other databases combine exactly
+# (histograms, moments) or within the sketch's relative error (quantiles).
+FINE_BINS_PER_BIN = 50
+SKETCH_RELATIVE_ACCURACY = 0.01
+
+
+def rank_bounds(values, q: float):
+    """The values either side of quantile ``q`` (0-1): np.quantile's
+    'lower' and 'higher' methods, which numpy < 1.22 does not have."""
+    ordered = np.sort(np.asarray(values, dtype=float))
+    rank = q * (len(ordered) - 1)
+    return float(ordered[math.floor(rank)]), float(ordered[math.ceil(rank)])
+
+
+class QuantileSketch:
+    """DDSketch-style quantile sketch: values fall into logarithmic buckets
+    of relative width ``accuracy``, so any quantile is returned within that
+    relative error and two sketches merge by adding bucket counts."""
+
+    def __init__(self, accuracy: float = SKETCH_RELATIVE_ACCURACY):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        positive = values[values > 0]
+        self.zeros += int((values <= 0).sum())
+        self.count += len(values)
+        if len(positive):
+            keys, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def merge(self, other):
+        if other.accuracy != self.accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def quantile(self, q: float):
+        if not self.count:
+            raise ValueError("empty sketch")
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {"accuracy": self.accuracy, "zeros": self.zeros, "count": self.count,
+                "buckets": {str(k): v for k, v in self.buckets.items()}}
+
+    @classmethod
+    def from_dict(cls, state: dict):
+        sketch = cls(state["accuracy"])
+        sketch.zeros = state["zeros"]
+        sketch.count = state["count"]
+        sketch.buckets = {int(k): v for k, v in state["buckets"].items()}
+        return sketch
+
+
+class FixedHistogram:
+    """Histogram over fixed edges; values outside the range are clamped
+    into the end bins so the counts always add up to ``n``."""
+
+    def __init__(self, lower: float, upper: float, bins: int):
+        if upper <= lower:
+            upper = lower + 1
+        self.lower = float(lower)
+        self.upper = float(upper)
+        self.edges = np.linspace(self.lower, self.upper, bins + 1)
+        self.counts = np.zeros(bins, dtype=np.int64)
+
+    def add(self, values):
+        values = np.clip(np.asarray(values, dtype=float), self.lower, self.upper)
+        self.counts += np.histogram(values, bins=self.edges)[0]
+
+    def merge(self, other):
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Cannot merge histograms with different edges")
+        self.counts += other.counts
+        return self
+
+    def rebin(self, factor: int):
+        return self.edges[::factor], self.counts.reshape(-1, factor).sum(axis=1)
+
+
+def binned_kde(edges, counts, bandwidth: float, xs):
+    """Gaussian KDE of binned data by FFT convolution of the bin counts
+    with the kernel sampled at the bin spacing; O(bins log bins) instead of
+    O(n * len(xs)) for an exact KDE."""
+    n = counts.sum()
+    centers = (edges[:-1] + edges[1:]) / 2
+    dx = edges[1] - edges[0]
+
+    half = min(len(counts) - 1, int(math.ceil(4 * bandwidth / dx)))
+    offsets = np.arange(-half, half + 1) * dx
+    kernel = np.exp(-0.5 * (offsets / bandwidth) ** 2)
+    kernel /= kernel.sum() * dx
+
+    size = len(counts) + len(kernel) - 1
+    fft_size = 1 << (size - 1).bit_length()
+    smoothed = np.fft.irfft(np.fft.rfft(counts, fft_size) * np.fft.rfft(kernel, fft_size), fft_size)
+    density = np.clip(smoothed[half:half + len(counts)], 0, None) / n
+    return np.interp(xs, centers, density)
+
+
+class IncomeDistribution:
+    """Mergeable summary behind the income widget: exact moments, min/max
+    and histogram, a quantile sketch for the median and percentiles, and a
+    binned KDE evaluated from the fine histogram."""
+
+    def __init__(self, lower: float, upper: float):
+        self.histogram = FixedHistogram(lower, upper, HISTOGRAM_BINS * FINE_BINS_PER_BIN)
+        self.sketch = QuantileSketch()
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        self.histogram.add(values)
+        self.sketch.add(values)
+        self.n += len(values)
+        self.total += float(values.sum())
+        self.total_sq += float(np.square(values).sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other):
+        self.histogram.merge(other.histogram)
+        self.sketch.merge(other.sketch)
+        self.n += other.n
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def std(self):
+        if self.n < 2:
+            return 0.0
+        variance = (self.total_sq - self.total ** 2 / self.n) / (self.n - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    def payload(self):
+        if not self.n:
+            raise ValueError("no income values")
+
+        bins, counts = self.histogram.rebin(FINE_BINS_PER_BIN)
+        xs = np.linspace(self.min, self.max, KDE_POINTS)
+        # Scott's rule, as used by scipy.stats.gaussian_kde.
+        bandwidth = max(self.std() * self.n ** (-1 / 5), self.histogram.edges[1] - self.histogram.edges[0])
+        ys = binned_kde(self.histogram.edges, self.histogram.counts, bandwidth, xs)
+
+        return {
+            "stats": {
+                "mean": int(self.total / self.n),
+                "median": int(self.sketch.quantile(0.5)),
+                "p25": int(self.sketch.quantile(0.25)),
+                "p75": int(self.sketch.quantile(0.75)),
+                "p90": int(self.sketch.quantile(0.9))
+            },
+            "histogram": {
+                "bins": bins.tolist(),
+                "counts": counts.tolist()
+            },
+            "kde": {
+                "x": xs.tolist(),
+                "y": ys.tolist()
+            }
+        }
+
+    def to_dict(self):
+        return {
+            "lower": self.histogram.lower, "upper": self.histogram.upper,
+            "counts": self.histogram.counts.tolist(), "sketch": self.sketch.to_dict(),
+            "n": self.n, "total": self.total, "total_sq": self.total_sq,
+            "min": self.min, "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict):
+        distribution = cls(state["lower"], state["upper"])
+        distribution.histogram.counts = np.asarray(state["counts"], dtype=np.int64)
+        distribution.sketch = QuantileSketch.from_dict(state["sketch"])
+        distribution.n = state["n"]
+        distribution.total = state["total"]
+        distribution.total_sq = state["total_sq"]
+        distribution.min = state["min"]
+        distribution.max = state["max"]
+        return distribution
+
+
+def income_bounds_query(query: str):
+    # ``query`` selects the incomes to bound (an income metric query).
+    return f"SELECT MIN(annual_family_income), MAX(annual_family_income) FROM ({query}) AS incomes"
+
+
+def income_bounds(conn, query: str, params=None):
+    cur = conn.cursor()
+    cur.execute(income_bounds_query(query), params)
+    lower, upper = cur.fetchone()
+    return float(lower or 0), float(upper or 0)
@@ -0,0 +1,131 @@
+import io
+import logging
+
+from dataset_engine import APPLICANT_COLUMNS, applicant_query, resolve_rows
+from filters import FilterError, compile_filters
+from instrumentation import timed
+from snapshot import CATEGORICAL_COLS, applicant_schema, chunk_table, pq
+
+logger = logging.getLogger(__name__)
+
+# ----------------- Streaming Export -----------------
+# /api/export streams the joined applicant dataset straight from a
+# server-side cursor: each fetched chunk is resolved against the master
+# data, encoded and handed to the response before the next one is read,
+# so memory stays at one chunk whatever the row count.
+#
+#   /api/export?format=parquet&columns=application_id,state_name&state=BIHAR
+CHUNK_SIZE = 50000
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+def parse_columns(args):
+    """Requested applicant columns (?columns=a,b), in request order."""
+    requested = [part.strip() for value in args.getlist('columns') for part in value.split(',') if part.strip()]
+    if not requested:
+        return list(APPLICANT_COLUMNS)
+    unknown = [col for col in requested if col not in APPLICANT_COLUMNS]
+    if unknown:
+        raise FilterError(f"Unknown columns: {', '.join(unknown)}")
+    return list(dict.fromkeys(requested))
+
+
+def parse_format(args):
+    export_format = args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        raise FilterError(f"Unknown format: {export_format} (expected {', '.join(EXPORT_FORMATS)})")
+    if export_format == 'parquet' and pq is None:
+        raise FilterError("Parquet export needs pyarrow on the server")
+    return export_format
+
+
+def applicant_chunks(conn, columns, filters=None, masters=None, chunk_size: int = CHUNK_SIZE):
+    """Yields the filtered applicant join as resolved frames of at most
+    ``chunk_size`` rows, read through a named (server-side) cursor."""
+    # applicant_query already joins every fact table, so the filter joins are not needed.
+    _, where, params = compile_filters(filters, masters)
+    cur = conn.cursor(name='nsp_export')
+    cur.itersize = chunk_size
+    try:
+        with timed('query'):
+            cur.execute(applicant_query(columns, where=" AND ".join(where) or None), params or None)
+        while True:
+            with timed('fetch'):
+                results = cur.fetchmany(chunk_size)
+            if not results:
+                break
+            with timed('frame'):
+                yield resolve_rows(results, columns, masters)
+    finally:
+        cur.close()
+
+
+# ----------------- Encoders -----------------
+def csv_stream(chunks, columns):
+    header = True
+    for df in chunks:
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=header)
+        header = False
+        yield buffer.getvalue()
+    if header:
+        yield ",".join(columns) + "\n"
+
+
+class _StreamSink(io.RawIOBase):
+    """Write-only file for ParquetWriter whose bytes are taken as they are
+    written. tell() keeps counting, since Parquet records column-chunk
+    offsets from it."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def parquet_stream(chunks, columns):
+    # One row group per chunk; the footer goes out when the cursor is exhausted.
+    schema = applicant_schema(columns)
+    sink = _StreamSink()
+    with pq.ParquetWriter(sink, schema, use_dictionary=[col for col in columns if col in CATEGORICAL_COLS]) as writer:
+        for df in chunks:
+            writer.write_table(chunk_table(df, schema))
+            yield sink.take()
+    yield sink.take()
+
+
+ENCODERS = {
+    'csv': csv_stream,
+    'parquet': parquet_stream,
+}
+
+
+def export_stream(export_format: str, sources, columns, filters=None, chunk_size: int = CHUNK_SIZE):
+    """Encoded export of ``sources``, [(db_key, conn, masters)], read one
+    after another into a single file."""
+    def chunks():
+        for db_key, conn, masters in sources:
+            rows = 0
+            for df in applicant_chunks(conn, columns, filters, masters, chunk_size):
+                rows += len(df)
+                yield df
+            logger.info(f"Exported {rows} applicant rows from {db_key}")
+
+    return ENCODERS[export_format](chunks(), columns)
@@ -0,0 +1,121 @@
+import contextvars
+import copy
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db_pool import DatabaseUnavailable
+from filters import FilterError
+from metrics import METRICS, rank_pairs
+from sql_metrics import fetch_income_bounds, fetch_metrics
+
+logger = logging.getLogger(__name__)
+
+# ----------------- Federation -----------------
+# Runs the pushed-down metric queries against several databases (e.g.
+# nsp_fresh and nsp_renewal) in parallel and merges the partial aggregates:
+# counts and sums add per label before the top-N cut, and income
+# distributions merge because every shard bins over the same global range.
+# Distinct institutions do not add up across shards (an institution can
+# appear in both), so shards return HyperLogLog sketches that merge instead.
+# Wall time is that of the slowest shard, not the sum.
+
+
+def parse_sources(args, allowed):
+    """Database keys from ?sources=nsp_fresh,nsp_renewal, or None."""
+    raw = [part.strip() for value in args.getlist('sources') for part in value.split(',') if part.strip()]
+    if not raw:
+        return None
+    unknown = [db_key for db_key in raw if db_key not in allowed]
+    if unknown:
+        raise FilterError(f"Unknown sources: {', '.join(unknown)}")
+    return [db_key for db_key in allowed if db_key in raw]
+
+
+def merge_results(name: str, partials):
+    metric = METRICS[name]
+    if metric.measure in ('funding', 'summary'):
+        return tuple(sum(values) for values in zip(*partials))
+    if metric.measure in ('income', 'institutions'):
+        merged = copy.deepcopy(partials[0])
+        for partial in partials[1:]:
+            merged.merge(partial)
+        return merged if metric.measure == 'income' else finalize_result(name, merged)
+
+    totals = {}
+    for partial in partials:
+        for label, value in partial:
+            totals[label] = totals.get(label, 0.0) + value
+    return finalize_result(name, list(totals.items()))
+
+
+def finalize_result(name: str, result):
+    # Partial grouped results are complete (no top-N cut); rank and cut
+    # them the way a single-database query would.
+    metric = METRICS[name]
+    if metric.measure in ('funding', 'summary', 'income'):
+        return result
+    if metric.measure == 'institutions':
+        result = result.counts()
+    return rank_pairs(result, metric.limit)
+
+
+class Federation:
+    def __init__(self, connect, masters: dict, max_workers: int = 8):
+        self._connect = connect
+        self.masters = masters
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='nsp-federation')
+
+    def _run(self, db_key: str, work):
+        conn = self._connect(db_key)
+        if not conn:
+            raise DatabaseUnavailable(db_key)
+        try:
+            started = time.monotonic()
+            result = work(conn, self.masters[db_key].get(conn))
+            logger.info(f"Federated query on {db_key} took {time.monotonic() - started:.2f}s")
+            return result
+        finally:
+            conn.close()
+
+    def _map(self, db_keys, work):
+        # Each shard runs in a copy of the caller's context so its phase
+        # timings are added to the request that started it.
+        futures = {
+            db_key: self._executor.submit(contextvars.copy_context().run, self._run, db_key, work)
+            for db_key in db_keys
+        }
+        return {db_key: future.result() for db_key, future in futures.items()}
+
+    def _income_bounds(self, names, db_keys, filters):
+        # Histograms only merge over identical edges, so the income range
+        # is agreed across shards before any of them streams incomes.
+        income = [name for name in names if METRICS[name].measure == 'income']
+        if not income:
+            return {}
+        shard_bounds = self._map(db_keys, lambda conn, masters: {
+            name: fetch_income_bounds(conn, name, filters, masters) for name in income
+        })
+        merged = {}
+        for name in income:
+            # (0, 0) is what an empty shard reports; it must not widen the range.
+            ranges = [bounds[name] for bounds in shard_bounds.values() if bounds[name] != (0.0, 0.0)] or [(0.0, 0.0)]
+            merged[name] = (min(lower for lower, _ in ranges), max(upper for _, upper in ranges))
+        return merged
+
+    def partials(self, names, db_keys, filters=None):
+        """{db_key: {name: partial result}} with grouped results uncut."""
+        bounds = self._income_bounds(names, db_keys, filters)
+        return self._map(db_keys, lambda conn, masters: fetch_metrics(
+            conn, names, masters, filters, partial=True, bounds=bounds
+        ))
+
+    def results(self, names, db_keys, filters=None):
+        """(combined {name: result}, per-source {db_key: {name: result}})."""
+        partials = self.partials(names, db_keys, filters)
+        combined = {name: merge_results(name, [partials[db_key][name] for db_key in db_keys]) for name in names}
+        per_source = {
+            db_key: {name: finalize_result(name, result) for name, result in results.items()}
+            for db_key, results in partials.items()
+        }
+        return combined, per_source
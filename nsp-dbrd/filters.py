@@ -0,0 +1,155 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from master_data import LABEL_KEYS
+
+# ----------------- Filter Grammar -----------------
+# Every metric accepts the same drill-down filters as query parameters,
+# e.g. ?state=WEST BENGAL&scheme_id=76&gender=F. Repeating a parameter ORs
+# its values (?gender=M&gender=F); different parameters are ANDed. Label
+# filters (state, district, ...) are resolved to fact-table ids through the
+# master-data cache, so the SQL they compile to hits the id indexes below.
+FilterField = namedtuple('FilterField', ['column', 'key', 'joins', 'cast'])
+
+FILTER_FIELDS = {
+    'state': FilterField('state_name', 'r.permanent_district_id', [], str),
+    'district': FilterField('district_name', 'r.permanent_district_id', [], str),
+    'institute_district': FilterField('institute_district', 'q.c_institution_id', ['qualification'], str),
+    'category': FilterField('category_name', 'r.category_id', [], str),
+    'category_id': FilterField('category_id', 'r.category_id', [], int),
+    'scheme': FilterField('scheme_name', 'sch.scheme_id', ['scheme'], str),
+    'scheme_id': FilterField('scheme_id', 'sch.scheme_id', ['scheme'], int),
+    'institution_id': FilterField('c_institution_id', 'q.c_institution_id', ['qualification'], int),
+    'gender': FilterField('gender', 'r.gender', [], str),
+    'fresh_renewal': FilterField('fresh_renewal', 'r.fresh_renewal', [], str),
+}
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_registration_district ON data_applicant_registration_details (permanent_district_id)",
+    "CREATE INDEX IF NOT EXISTS idx_registration_category ON data_applicant_registration_details (category_id)",
+    "CREATE INDEX IF NOT EXISTS idx_registration_gender ON data_applicant_registration_details (gender)",
+    "CREATE INDEX IF NOT EXISTS idx_registration_fresh_renewal ON data_applicant_registration_details (fresh_renewal)",
+    "CREATE INDEX IF NOT EXISTS idx_applied_schemes_scheme ON data_applicant_applied_schemes (scheme_id, application_id)",
+    "CREATE INDEX IF NOT EXISTS idx_qualifications_institution ON data_applicant_qualifications (c_institution_id, application_id)",
+]
+
+
+class FilterError(ValueError):
+    pass
+
+
+def parse_filters(args, reserved=()):
+    """{field: sorted tuple of values} from request args, in field order so
+    equal filters compare equal. Unknown parameters are rejected."""
+    unknown = [key for key in args.keys() if key not in FILTER_FIELDS and key not in reserved]
+    if unknown:
+        raise FilterError(f"Unknown filters: {', '.join(unknown)}")
+
+    filters = {}
+    for field, spec in FILTER_FIELDS.items():
+        values = [value.strip() for value in args.getlist(field) if value.strip()]
+        if not values:
+            continue
+        try:
+            filters[field] = tuple(sorted(set(spec.cast(value) for value in values)))
+        except ValueError:
+            raise FilterError(f"Invalid {field}: {', '.join(values)}")
+    return filters
+
+
+def filter_columns(filters):
+    return [FILTER_FIELDS[field].column for field in filters or ()]
+
+
+# ----------------- SQL -----------------
+def compile_filters(filters, masters):
+    """(joins, where clauses, params) for parameterised SQL over the
+    data_applicant_* tables aliased as in dataset_engine."""
+    joins, where, params = [], [], []
+    for field, values in (filters or {}).items():
+        spec = FILTER_FIELDS[field]
+        if spec.column in LABEL_KEYS:
+            values = masters.ids(spec.column, values)
+        if not len(values):
+            where.append("1 = 0")
+            continue
+        joins.extend(spec.joins)
+        where.append(f"{spec.key} IN ({', '.join(['%s'] * len(values))})")
+        params.extend(v.item() if isinstance(v, np.generic) else v for v in values)
+    return joins, where, params
+
+
+# ----------------- In-Memory Index -----------------
+class IndexedFrame:
+    """The cached applicant frame plus an inverted index per filter column
+    (value code -> sorted row positions), built on first use. A filtered
+    request unions the postings of each field's values and intersects across
+    fields, so it touches only matching rows instead of rescanning."""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self._postings = {}
+
+    def __len__(self):
+        return len(self.frame)
+
+    def _index(self, column: str):
+        if column not in self._postings:
+            values = self.frame[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+            else:
+                codes, uniques = pd.factorize(values)
+                uniques = pd.Index(uniques)
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            self._postings[column] = (uniques, order, bounds)
+        return self._postings[column]
+
+    def positions(self, column: str, values):
+        uniques, order, bounds = self._index(column)
+        codes = uniques.get_indexer(list(values))
+        parts = [order[bounds[code]:bounds[code + 1]] for code in codes if code >= 0]
+        return np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=np.int64)
+
+    def selection(self, filters):
+        """Sorted positions of the rows matching ``filters``."""
+        selected = None
+        for field, values in filters.items():
+            rows = self.positions(FILTER_FIELDS[field].column, values)
+            selected = rows if selected is None else np.intersect1d(selected, rows, assume_unique=True)
+            if not len(selected):
+                break
+        return selected
+
+    def select(self, filters=None):
+        if not filters:
+            return self.frame
+        return self.frame.iloc[self.selection(filters)]
+
+
+def concurrent_index(statement: str):
+    # On the live tables the index is built without blocking writes.
+    return statement.replace("CREATE INDEX IF NOT EXISTS", "CREATE INDEX CONCURRENTLY IF NOT EXISTS", 1)
+
+
+if __name__ == "__main__":
+    import sys
+
+    from db_config import DB_CONFIGS
+    from db_pool import connect
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, so this
+    # uses its own autocommit connection rather than a pooled one. A build
+    # that fails leaves an INVALID index behind: drop it and run again.
+    db_key = sys.argv[1] if len(sys.argv) > 1 else 'nsp_fresh'
+    conn = connect(DB_CONFIGS[db_key])
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        for statement in INDEXES:
+            cur.execute(concurrent_index(statement))
+    finally:
+        conn.close()
@@ -0,0 +1,94 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# ----------------- Phase Timing -----------------
+# Hot-path code wraps its steps in ``timed(phase)``. While a request is
+# being served the elapsed time is added to that request's timings; outside
+# a request (CLIs, background refreshes) ``timed`` only costs two clock
+# reads. At the end of the request every phase is observed into a latency
+# histogram per (endpoint, phase), exposed in Prometheus text format.
+PHASES = ['connect', 'query', 'fetch', 'frame', 'aggregate', 'jsonify']
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+_timings = contextvars.ContextVar('nsp_timings', default=None)
+_timings_lock = threading.Lock()
+
+
+@contextmanager
+def timed(phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _timings.get()
+        if timings is not None:
+            elapsed = time.perf_counter() - started
+            # Federated shards report from worker threads into the same dict.
+            with _timings_lock:
+                timings[phase] = timings.get(phase, 0.0) + elapsed
+
+
+def start_request():
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def end_request():
+    timings = _timings.get()
+    _timings.set(None)
+    return timings or {}
+
+
+def timing_header(timings: dict, total: float):
+    # Server-Timing syntax, e.g. "connect;dur=0.4, query;dur=12.1, total;dur=15.0"
+    parts = [f"{phase};dur={timings[phase] * 1000:.1f}" for phase in PHASES if phase in timings]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+# ----------------- Histograms -----------------
+class LatencyHistograms:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = list(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint: str, phase: str, seconds: float):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get((endpoint, phase))
+            if series is None:
+                series = self._series[(endpoint, phase)] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def exposition(self, name: str = 'nsp_phase_duration_seconds'):
+        lines = [
+            f"# HELP {name} Time spent per request in each phase, by endpoint.",
+            f"# TYPE {name} histogram",
+        ]
+        with self._lock:
+            series = sorted((key, (list(counts), total, n)) for key, (counts, total, n) in self._series.items())
+        for (endpoint, phase), (counts, total, n) in series:
+            labels = f'endpoint="{endpoint}",phase="{phase}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ['+Inf'], counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {total}")
+            lines.append(f"{name}_count{{{labels}}} {n}")
+        return "\n".join(lines) + "\n"
+
+
+histograms = LatencyHistograms()
+
+
+def record_request(endpoint: str, timings: dict, total: float):
+    for phase, seconds in timings.items():
+        histograms.observe(endpoint, phase, seconds)
+    histograms.observe(endpoint, 'total', total)
@@ -0,0 +1,233 @@
+import hashlib
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from db_pool import DatabaseUnavailable
+
+logger = logging.getLogger(__name__)
+
+# ----------------- Master Tables -----------------
+# The mst_* tables change a few times a season, so they are loaded once into
+# memory and fact queries select only ids. Ids are resolved with array
+# lookups and labels come out as Categorical codes, never Python strings.
+MASTER_QUERIES = {
+    'states': "SELECT state_id, state_name FROM mst_states",
+    'districts': "SELECT district_id, district_name, state_id FROM mst_districts",
+    'category': "SELECT category_id, category_name FROM mst_category",
+    'marital_status': "SELECT marital_id, marital_status_name FROM mst_marital_status",
+    'schemes': "SELECT scheme_id, scheme_name FROM mst_schemes",
+    'institution': "SELECT institution_id, district_id FROM mst_institution",
+}
+
+# Label column -> fact id column it is resolved from / master table holding the label.
+# KEY_TABLES names the master table each fact id column refers to.
+LABEL_KEYS = {
+    'district_name': 'permanent_district_id',
+    'state_name': 'permanent_district_id',
+    'category_name': 'category_id',
+    'marital_status_name': 'marital_status',
+    'institute_district': 'c_institution_id',
+    'scheme_name': 'scheme_id',
+}
+LABEL_TABLES = {
+    'district_name': 'districts',
+    'state_name': 'states',
+    'category_name': 'category',
+    'marital_status_name': 'marital_status',
+    'institute_district': 'districts',
+    'scheme_name': 'schemes',
+}
+
+KEY_TABLES = {
+    'permanent_district_id': 'districts',
+    'category_id': 'category',
+    'marital_status': 'marital_status',
+    'c_institution_id': 'institution',
+    'scheme_id': 'schemes',
+}
+
+DENSE_ID_LIMIT = 1 << 24
+
+
+class IdLookup:
+    """Maps master-table ids to row positions: a dense array indexed by id
+    when ids are small, otherwise a hash index."""
+
+    def __init__(self, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        self._dense = None
+        self._index = None
+        if len(ids) and ids.min() >= 0 and ids.max() < DENSE_ID_LIMIT:
+            self._dense = np.full(int(ids.max()) + 1, -1, dtype=np.int64)
+            self._dense[ids] = np.arange(len(ids))
+        else:
+            self._index = pd.Index(ids)
+
+    def positions(self, values):
+        values = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=float)
+        positions = np.full(len(values), -1, dtype=np.int64)
+        known = ~np.isnan(values)
+        ids = values[known].astype(np.int64)
+        if self._dense is not None:
+            found = np.full(len(ids), -1, dtype=np.int64)
+            in_range = (ids >= 0) & (ids < len(self._dense))
+            found[in_range] = self._dense[ids[in_range]]
+        else:
+            found = self._index.get_indexer(ids)
+        positions[known] = found
+        return positions
+
+
+class MasterTable:
+    def __init__(self, rows, columns):
+        self.frame = pd.DataFrame(rows, columns=columns)
+        self.lookup = IdLookup(self.frame[columns[0]])
+        self._labels = {}
+
+    def labels(self, column: str):
+        """(categories, code of each master row) for a label column; names
+        repeated across rows (e.g. districts in two states) share a code."""
+        if column not in self._labels:
+            values = self.frame[column]
+            categories = pd.Index(sorted(values.dropna().unique()))
+            self._labels[column] = (categories, categories.get_indexer(values))
+        return self._labels[column]
+
+
+def take(array, positions):
+    # positions of -1 (no master row) stay -1
+    result = np.full(len(positions), -1, dtype=np.int64)
+    found = positions >= 0
+    result[found] = array[positions[found]]
+    return result
+
+
+class MasterData:
+    def __init__(self, tables: dict):
+        self.tables = tables
+        self.loaded_at = time.time()
+        # Content hash, so reloading unchanged tables keeps the same version.
+        digest = hashlib.sha1()
+        for name in sorted(tables):
+            digest.update(pd.util.hash_pandas_object(tables[name].frame, index=False).to_numpy().tobytes())
+        self.version = digest.hexdigest()[:16]
+
+    @classmethod
+    def load(cls, conn):
+        cur = conn.cursor()
+        tables = {}
+        for name, query in MASTER_QUERIES.items():
+            cur.execute(query)
+            columns = [desc[0] for desc in cur.description]
+            tables[name] = MasterTable(cur.fetchall(), columns)
+        return cls(tables)
+
+    def get(self, conn=None):
+        # Lets a loaded MasterData stand in wherever a MasterCache is accepted.
+        return self
+
+    def sizes(self):
+        return {name: len(table.frame) for name, table in self.tables.items()}
+
+    def _district_positions(self, district_ids):
+        return self.tables['districts'].lookup.positions(district_ids)
+
+    def _positions(self, column: str, ids):
+        tables = self.tables
+        if column == 'district_name':
+            return self._district_positions(ids)
+        if column == 'state_name':
+            home = self._district_positions(ids)
+            state_ids = take(tables['districts'].frame['state_id'].to_numpy(dtype=np.int64), home)
+            return tables['states'].lookup.positions(state_ids)
+        if column == 'institute_district':
+            institutions = tables['institution'].lookup.positions(ids)
+            district_ids = take(tables['institution'].frame['district_id'].to_numpy(dtype=np.int64), institutions)
+            return self._district_positions(district_ids)
+        return tables[LABEL_TABLES[column]].lookup.positions(ids)
+
+    def positions(self, raw):
+        """Master-row positions for every label column of ``raw`` (fact
+        rows carrying the id columns); -1 where the id has no master row."""
+        return {column: self._positions(column, raw[key]) for column, key in LABEL_KEYS.items()}
+
+    def resolve(self, raw, columns):
+        """Builds the applicant columns from fact rows. Rows whose ids have no
+        master row are dropped, matching the inner joins they replace."""
+        positions = self.positions(raw)
+        matched = np.logical_and.reduce([pos >= 0 for pos in positions.values()])
+
+        out = {}
+        for column in columns:
+            if column in positions:
+                categories, codes = self._labels(column)
+                out[column] = pd.Categorical.from_codes(take(codes, positions[column][matched]), categories=categories)
+            else:
+                out[column] = raw[column].to_numpy()[matched]
+        return pd.DataFrame(out, columns=columns)
+
+    def _labels(self, column: str):
+        table_name = LABEL_TABLES[column]
+        label = 'district_name' if table_name == 'districts' else column
+        return self.tables[table_name].labels(label)
+
+    def labels(self, column: str, ids):
+        """Label of each id (None where unknown) for one label column, keyed
+        the same way as the fact tables, e.g. state_name by district id."""
+        categories, codes = self._labels(column)
+        codes = take(codes, self._positions(column, ids))
+        return [categories[code] if code >= 0 else None for code in codes]
+
+    def ids(self, column: str, labels):
+        """Fact-table ids whose label is one of ``labels``, e.g. the district
+        ids of a state for state_name."""
+        table = self.tables[KEY_TABLES[LABEL_KEYS[column]]]
+        ids = table.frame[table.frame.columns[0]].to_numpy()
+        wanted = set(labels)
+        return [int(i) for i, label in zip(ids, self.labels(column, ids)) if label in wanted]
+
+
+def current_masters(conn, masters=None):
+    return masters.get(conn) if masters is not None else MasterData.load(conn)
+
+
+# ----------------- Cache -----------------
+class MasterCache:
+    def __init__(self, connect, db_key: str = 'nsp_fresh', refresh_interval: float = 3600):
+        self._connect = connect
+        self.db_key = db_key
+        self.refresh_interval = refresh_interval
+        self._data = None
+        self._lock = threading.Lock()
+
+    def _stale(self):
+        return self._data is None or time.time() - self._data.loaded_at >= self.refresh_interval
+
+    def refresh(self, conn=None, only_if_stale: bool = False):
+        with self._lock:
+            if only_if_stale and not self._stale():
+                return self._data
+            own = conn is None
+            if own:
+                conn = self._connect(self.db_key)
+                if not conn:
+                    raise DatabaseUnavailable(self.db_key)
+            try:
+                self._data = MasterData.load(conn)
+            finally:
+                if own:
+                    conn.close()
+            logger.info(f"Loaded {self.db_key} master tables {self._data.sizes()}")
+            return self._data
+
+    def version(self):
+        return self._data.version if self._data is not None else None
+
+    def get(self, conn=None):
+        if self._stale():
+            return self.refresh(conn, only_if_stale=True)
+        return self._data
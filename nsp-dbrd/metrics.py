@@ -0,0 +1,160 @@
+from collections import namedtuple
+
+import numpy as np
+from scipy import stats
+
+from distinct import DistinctFrames, distinct_rows
+
+# ----------------- Metric Definitions -----------------
+# Every dashboard widget is either a ranking of one dimension by a measure
+# ("count" of applications or "payment" = state + centre share), or one of
+# the whole-population metrics below. Both the pandas and the SQL paths
+# produce the same intermediate results, so payloads are built in one place.
+# Counts and payment sums are over distinct applications (see distinct.py),
+# "institutions" counts the distinct institutions (c_institution_id) per label.
+Metric = namedtuple('Metric', ['dimension', 'measure', 'label', 'value_key', 'limit', 'percentage'])
+
+METRICS = {
+    'top-states': Metric('state_name', 'count', 'state', 'applications', 8, False),
+    'gender-distribution': Metric('gender', 'count', 'gender', 'count', None, True),
+    'categories': Metric('category_name', 'count', 'category', 'applications', None, False),
+    'funding-breakdown': Metric(None, 'funding', None, None, None, False),
+    'income-distribution': Metric(None, 'income', None, None, None, False),
+    'top-districts-payments': Metric('institute_district', 'payment', 'district', 'payment', 8, True),
+    'top-schemes-payments': Metric('scheme_name', 'payment', 'scheme', 'payment', 8, True),
+    'category-payments': Metric('category_name', 'payment', 'category', 'payment', None, False),
+    'gender-payments': Metric('gender', 'payment', 'gender', 'payment', None, False),
+    'top-schemes-applications': Metric('scheme_name', 'count', 'scheme', 'applications', 8, False),
+    'summary': Metric(None, 'summary', None, None, None, False),
+    'top-districts-institutions': Metric('institute_district', 'institutions', 'district', 'institutions', 8, False),
+    'top-schemes-institutions': Metric('scheme_name', 'institutions', 'scheme', 'institutions', 8, False),
+}
+
+KDE_POINTS = 200
+HISTOGRAM_BINS = 20
+PAYMENT_COLUMNS = ['pay_amt_state_shr', 'pay_amt_centre_shr']
+
+
+def metric_columns(names):
+    """Applicant-frame columns needed to compute ``names``."""
+    columns = ['application_id'] + PAYMENT_COLUMNS
+    for name in names:
+        metric = METRICS[name]
+        needed = 'annual_family_income' if metric.measure == 'income' else metric.dimension
+        for col in [needed] + (['c_institution_id'] if metric.measure == 'institutions' else []):
+            if col and col not in columns:
+                columns.append(col)
+    return columns
+
+
+def rank_pairs(pairs, limit: int = None):
+    """(label, value) pairs by value, ties by label, cut to ``limit``. Every
+    source ranks with it so tied labels come out in the same order."""
+    ranked = sorted(((label, float(value)) for label, value in pairs), key=lambda kv: (-kv[1], kv[0]))
+    return ranked[:limit] if limit else ranked
+
+
+def grain_columns(name: str):
+    """Columns the rows_result of ``name`` needs one row per application per."""
+    metric = METRICS[name]
+    return [metric.dimension] + (['c_institution_id'] if metric.measure == 'institutions' else [])
+
+
+# ----------------- Pandas Path -----------------
+def frame_result(df, name: str):
+    return rows_result(distinct_rows(df, grain_columns(name)), name)
+
+
+def frame_results(df, names):
+    """frame_result for each of ``names``, deduplicating ``df`` once per grain."""
+    distinct = DistinctFrames(df)
+    return {name: rows_result(distinct.get(grain_columns(name)), name) for name in names}
+
+
+def rows_result(df, name: str):
+    # ``df`` holds one row per application (per label of a fan-out dimension).
+    metric = METRICS[name]
+
+    # observed=True and the > 0 filter keep categorical columns from
+    # reporting categories that have no rows.
+    if metric.measure == 'count':
+        grouped = df[metric.dimension].value_counts()
+        grouped = grouped[grouped > 0]
+    elif metric.measure == 'payment':
+        grouped = df.groupby(metric.dimension, observed=True)['payment_amt_share'].sum()
+    elif metric.measure == 'funding':
+        funding_data = df[['pay_amt_state_shr', 'pay_amt_centre_shr']].sum()
+        return float(funding_data['pay_amt_state_shr']), float(funding_data['pay_amt_centre_shr'])
+    elif metric.measure == 'summary':
+        return len(df), float(df['payment_amt_share'].sum())
+    elif metric.measure == 'institutions':
+        grouped = df.groupby(metric.dimension, observed=True)['c_institution_id'].nunique()
+        grouped = grouped[grouped > 0]
+    else:
+        return df['annual_family_income'].dropna().to_numpy(dtype=float)
+    return rank_pairs(grouped.items(), metric.limit)
+
+
+# ----------------- Payloads -----------------
+def income_payload(income_data):
+    counts, bins = np.histogram(income_data, bins=HISTOGRAM_BINS)
+
+    xs = np.linspace(income_data.min(), income_data.max(), KDE_POINTS)
+    # gaussian_kde needs some spread; a filtered slice may hold one value.
+    ys = stats.gaussian_kde(income_data)(xs) if np.ptp(income_data) > 0 else np.zeros(KDE_POINTS)
+
+    return {
+        "stats": {
+            "mean": int(np.mean(income_data)),
+            "median": int(np.median(income_data)),
+            "p25": int(np.percentile(income_data, 25)),
+            "p75": int(np.percentile(income_data, 75)),
+            "p90": int(np.percentile(income_data, 90))
+        },
+        "histogram": {
+            "bins": bins.tolist(),
+            "counts": counts.tolist()
+        },
+        "kde": {
+            "x": xs.tolist(),
+            "y": ys.tolist()
+        }
+    }
+
+
+def empty_income_payload():
+    return {"stats": {}, "histogram": {"bins": [], "counts": []}, "kde": {"x": [], "y": []}}
+
+
+def build_payload(name: str, result):
+    metric = METRICS[name]
+
+    if metric.measure == 'funding':
+        state_share, centre_share = result
+        return {
+            "state_share": int(state_share),
+            "centre_share": int(centre_share),
+            "total": int(state_share + centre_share)
+        }
+    if metric.measure == 'summary':
+        total_applications, total_funding = result
+        return {
+            "total_applications": int(total_applications),
+            "total_funding": int(total_funding),
+            "avg_payment": int(total_funding / total_applications) if total_applications else 0
+        }
+    if metric.measure == 'income':
+        # A drill-down filter can match no incomes at all.
+        if isinstance(result, np.ndarray):
+            return income_payload(result) if len(result) else empty_income_payload()
+        return result.payload() if result.n else empty_income_payload()
+
+    total = sum(v for _, v in result)
+    data = []
+    for k, v in result:
+        row = {metric.label: k, metric.value_key: int(v)}
+        if metric.percentage:
+            # Every value may be zero (e.g. an institution paid nothing).
+            row["percentage"] = round(v / total * 100, 1) if total else 0.0
+        data.append(row)
+    return data
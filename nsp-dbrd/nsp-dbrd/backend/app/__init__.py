@@ -1,6 +1,7 @@
 from flask import Flask
 from .config import Config
 from .routes import api
+from .database import close_db_connection
 
 def create_app():
     app = Flask(__name__)
@@ -8,5 +9,6 @@ def create_app():
     
     # Register blueprints or routes
     app.register_blueprint(api)
+    app.teardown_appcontext(close_db_connection)
 
     return app
\ No newline at end of file
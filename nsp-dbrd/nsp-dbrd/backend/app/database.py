@@ -1,22 +1,32 @@
+import logging
+
 from flask import g
-import psycopg2
-from psycopg2.extras import DictCursor
-from app.config import DB_CONFIGS
+from app.config import Config
+from db_config import DB_CONFIGS
+from db_pool import PoolRegistry
+
+logger = logging.getLogger(__name__)
+
+pools = PoolRegistry(
+    DB_CONFIGS,
+    minconn=Config.DB_POOL_MIN,
+    maxconn=Config.DB_POOL_MAX,
+    timeout=Config.DB_POOL_TIMEOUT
+)
+
+def get_connection(db_key: str):
+    try:
+        return pools.get_connection(db_key)
+    except Exception as e:
+        logger.error(f"Failed to connect to {db_key}: {e}")
+        return None
 
 def get_db_connection():
     if 'db_conn' not in g:
-        config = DB_CONFIGS['nsp_fresh']
-        g.db_conn = psycopg2.connect(
-            host=config['host'],
-            port=config['port'],
-            user=config['user'],
-            password=config['password'],
-            dbname=config['dbname'],
-            cursor_factory=DictCursor
-        )
+        g.db_conn = pools.get_connection('nsp_fresh')
     return g.db_conn
 
 def close_db_connection(e=None):
     db_conn = g.pop('db_conn', None)
     if db_conn is not None:
-        db_conn.close()
\ No newline at end of file
+        db_conn.close()
@@ -3,7 +3,7 @@ import { BrowserRouter as Router, Route, Switch } from 'react-router-dom';
 import BarChart from './components/BarChart';
 import PieChart from './components/PieChart';
 import SummaryCard from './components/SummaryCard';
-import api from './services/api';
+import { fetchDashboard } from './services/api';
 
 function App() {
     const [summaryData, setSummaryData] = useState({});
@@ -13,14 +13,10 @@ function App() {
     useEffect(() => {
         const fetchData = async () => {
             try {
-                const summaryResponse = await api.get('/api/summary');
-                setSummaryData(summaryResponse.data);
-
-                const barChartResponse = await api.get('/api/top-schemes-payments');
-                setBarChartData(barChartResponse.data);
-
-                const pieChartResponse = await api.get('/api/gender-distribution');
-                setPieChartData(pieChartResponse.data);
+                const dashboard = await fetchDashboard(['summary', 'top-schemes-payments', 'gender-distribution']);
+                setSummaryData(dashboard['summary']);
+                setBarChartData(dashboard['top-schemes-payments']);
+                setPieChartData(dashboard['gender-distribution']);
             } catch (error) {
                 console.error('Error fetching data:', error);
             }
@@ -110,4 +110,15 @@ export const fetchSummary = async () => {
         console.error('Error fetching summary:', error);
         throw error;
     }
+};
+
+export const fetchDashboard = async (widgets = []) => {
+    try {
+        const params = widgets.length ? { widgets: widgets.join(',') } : {};
+        const response = await axios.get(`${API_BASE_URL}/dashboard`, { params });
+        return response.data;
+    } catch (error) {
+        console.error('Error fetching dashboard:', error);
+        throw error;
+    }
 };
\ No newline at end of file
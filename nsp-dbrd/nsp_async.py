@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qsl
+
+import numpy as np
+from werkzeug.datastructures import MultiDict
+
+try:
+    import asyncpg
+except ImportError:  # the async mode is optional; nsp_dash.py needs only psycopg2
+    asyncpg = None
+
+from db_config import DB_CONFIGS
+from distribution import IncomeDistribution, income_bounds_query
+from filters import FilterError, parse_filters
+from master_data import LABEL_KEYS, MASTER_QUERIES, MasterData, MasterTable
+from metrics import METRICS, build_payload
+from serialization import VARY, encode_payload, negotiate
+from sql_metrics import (INCOME_CHUNK_SIZE, compile_fused, compile_metric, fused_results, fusable, grouped_result,
+                         totals_result)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# ----------------- Async Serving Mode -----------------
+# ASGI app serving the same /api/<widget> and /api/dashboard responses as
+# nsp_dash.py from the pushed-down SQL metrics, on an asyncpg pool. Every
+# widget of a batch runs concurrently on its own pooled connection, and
+# income payloads (binned KDE) are built in a process pool so the event
+# loop keeps serving while they compute.
+#
+#   uvicorn nsp_async:app --host 0.0.0.0 --port 5000
+POOL_MIN = int(os.getenv('NSP_POOL_MIN', '1'))
+POOL_MAX = int(os.getenv('NSP_POOL_MAX', '10'))
+CPU_WORKERS = int(os.getenv('NSP_ASYNC_CPU_WORKERS', '0')) or None
+MASTER_REFRESH = float(os.getenv('NSP_MASTER_REFRESH', '3600'))
+CONNECTION_ERRORS = (OSError,) + ((asyncpg.PostgresConnectionError, asyncpg.InterfaceError) if asyncpg else ())
+
+
+def asyncpg_query(query: str):
+    # sql_metrics emits psycopg2-style %s placeholders; asyncpg wants $1..$n.
+    counter = iter(range(1, query.count('%s') + 1))
+    return re.sub(r'%s', lambda _: f"${next(counter)}", query)
+
+
+def require_asyncpg():
+    if asyncpg is None:
+        raise RuntimeError("asyncpg is required for the async serving mode (pip install asyncpg)")
+
+
+class AsyncMetrics:
+    def __init__(self, db_key: str = 'nsp_fresh', minconn: int = POOL_MIN, maxconn: int = POOL_MAX,
+                 cpu_workers: int = CPU_WORKERS):
+        self.db_key = db_key
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.cpu_workers = cpu_workers
+        self.pool = None
+        self.executor = None
+        self._masters = None
+        self._in_flight = {}
+        self._start_lock = asyncio.Lock()
+        self._masters_lock = asyncio.Lock()
+
+    async def start(self):
+        async with self._start_lock:
+            if self.pool is not None:
+                return
+            require_asyncpg()
+            config = DB_CONFIGS[self.db_key]
+            self.pool = await asyncpg.create_pool(
+                host=config['host'],
+                port=config['port'],
+                user=config['user'],
+                password=config['password'],
+                database=config['dbname'],
+                min_size=self.minconn,
+                max_size=self.maxconn
+            )
+            self.executor = ProcessPoolExecutor(self.cpu_workers)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    # ----------------- Master Data -----------------
+    async def masters(self):
+        async with self._masters_lock:
+            if self._masters is None or time.time() - self._masters.loaded_at >= MASTER_REFRESH:
+                async with self.pool.acquire() as conn:
+                    tables = {}
+                    for name, query in MASTER_QUERIES.items():
+                        statement = await conn.prepare(query)
+                        columns = [attribute.name for attribute in statement.get_attributes()]
+                        tables[name] = MasterTable([tuple(record) for record in await statement.fetch()], columns)
+                self._masters = MasterData(tables)
+                logger.info(f"Loaded {self.db_key} master tables {self._masters.sizes()}")
+            return self._masters
+
+    # ----------------- Queries -----------------
+    async def fetch_income(self, name: str, filters, masters):
+        query, params = compile_metric(name, filters, masters)
+        params = params or ()
+        async with self.pool.acquire() as conn:
+            lower, upper = await conn.fetchrow(asyncpg_query(income_bounds_query(query)), *params)
+            distribution = IncomeDistribution(float(lower or 0), float(upper or 0))
+
+            async with conn.transaction():
+                cursor = await conn.cursor(asyncpg_query(query), *params)
+                while True:
+                    records = await cursor.fetch(INCOME_CHUNK_SIZE)
+                    if not records:
+                        break
+                    distribution.add(np.array([record[0] for record in records], dtype=float))
+        return distribution
+
+    async def fetch_metric(self, name: str, filters=None):
+        metric = METRICS[name]
+        masters = await self.masters() if filters or metric.dimension in LABEL_KEYS else None
+        if metric.measure == 'income':
+            return await self.fetch_income(name, filters, masters)
+
+        query, params = compile_metric(name, filters, masters)
+        async with self.pool.acquire() as conn:
+            if metric.measure in ('funding', 'summary'):
+                return totals_result(await conn.fetchrow(asyncpg_query(query), *(params or ())))
+            rows = await conn.fetch(asyncpg_query(query), *(params or ()))
+        return grouped_result(name, rows, masters)
+
+    async def fetch_fused(self, names, filters=None):
+        # PostgreSQL has GROUPING SETS: the fusable widgets share one scan.
+        masters = await self.masters()
+        fused = compile_fused(names, filters, masters)
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(asyncpg_query(fused.query), *(fused.params or ()))
+        return fused_results(fused, names, [tuple(row) for row in rows], masters)
+
+    async def payload(self, name: str, filters=None):
+        result = await self.fetch_metric(name, filters)
+        if METRICS[name].measure == 'income':
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, build_payload, name, result)
+        return build_payload(name, result)
+
+    async def compute(self, names, filters=None):
+        await self.start()
+        fused = fusable(names) if len(fusable(names)) > 1 else []
+        rest = [name for name in names if name not in fused]
+        results, *payloads = await asyncio.gather(
+            self.fetch_fused(fused, filters) if fused else asyncio.sleep(0, {}),
+            *(self.payload(name, filters) for name in rest)
+        )
+        payloads = dict(zip(rest, payloads))
+        payloads.update({name: build_payload(name, result) for name, result in results.items()})
+        return {name: payloads[name] for name in names}
+
+    async def coalesced(self, names, filters=None):
+        # Single flight, as in nsp_dash: concurrent identical requests await
+        # one shared task.
+        key = (tuple(names), tuple((filters or {}).items()))
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.compute(names, filters))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+
+metrics = AsyncMetrics()
+
+
+# ----------------- ASGI -----------------
+async def send_json(send, status: int, body, headers=None):
+    # Negotiated like nsp_dash.py when the request ``headers`` are given.
+    headers = headers or {}
+    mimetype, encoding = negotiate(headers.get('accept'), headers.get('accept-encoding'))
+    payload, encoding = encode_payload(body, mimetype, encoding)
+    response_headers = [(b'content-type', mimetype.encode()), (b'content-length', str(len(payload)).encode()),
+                        (b'vary', ", ".join(VARY).encode())]
+    if encoding:
+        response_headers.append((b'content-encoding', encoding.encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await metrics.start()
+            except Exception as e:
+                # Keep serving; the pool is retried on the first request.
+                logger.error(f"Failed to start async pool for {metrics.db_key}: {e}")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await metrics.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    if scope['method'] != 'GET':
+        return await send_json(send, 405, {"error": "Method not allowed"})
+    args = MultiDict(parse_qsl(scope['query_string'].decode(), keep_blank_values=True))
+    path = scope['path'].rstrip('/')
+
+    if path == '/api/dashboard':
+        widgets = args.get('widgets')
+        names = [w.strip() for w in widgets.split(',') if w.strip()] if widgets else list(METRICS)
+        unknown = [name for name in names if name not in METRICS]
+        if unknown:
+            return await send_json(send, 400, {"error": f"Unknown widgets: {', '.join(unknown)}"})
+        reserved = ('widgets',)
+    elif path.startswith('/api/') and path[len('/api/'):] in METRICS:
+        names = [path[len('/api/'):]]
+        reserved = ()
+    else:
+        return await send_json(send, 404, {"error": "Not found"})
+
+    try:
+        filters = parse_filters(args, reserved=reserved)
+    except FilterError as e:
+        return await send_json(send, 400, {"error": str(e)})
+
+    try:
+        payloads = await metrics.coalesced(names, filters)
+    except CONNECTION_ERRORS as e:
+        logger.error(f"Failed to connect to {metrics.db_key}: {e}")
+        return await send_json(send, 500, {"error": "Database connection failed"})
+    except Exception as e:
+        logger.error(f"Error: {e}")
+        return await send_json(send, 500, {"error": str(e)})
+
+    headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    await send_json(send, 200, payloads if path == '/api/dashboard' else payloads[names[0]], headers)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv('NSP_ASYNC_HOST', '127.0.0.1'), port=int(os.getenv('NSP_ASYNC_PORT', '5000')))
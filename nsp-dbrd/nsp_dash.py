@@ -1,810 +1,614 @@
-from flask import Flask, request, jsonify, Response, send_file
+from flask import Flask, request, jsonify, Response, g
 import psycopg2
-from psycopg2.extras import DictCursor
 import logging
-import pandas as pd
-import io
-import numpy as np
-from scipy import stats
+import os
+import time
+
+from functools import partial
+
+from db_config import DB_CONFIGS
+from db_pool import PoolRegistry
+from dataset_engine import DatasetCache, DatabaseUnavailable, load_dataset
+from export import EXPORT_FORMATS, export_stream, parse_columns, parse_format
+from federation import Federation, parse_sources
+from filters import FilterError, IndexedFrame, filter_columns, parse_filters
+from master_data import MasterCache
+from metrics import METRICS, frame_results, build_payload, metric_columns
+from payment_cube import CubedFrame, parse_limit, parse_slice, slice_payload
+from sql_metrics import fetch_metrics
+from stream_engine import stream_aggregates
+from rollup_store import RollupStore
+from response_cache import DataVersion, conditional_response
+from single_flight import SingleFlight
+from prewarm import Prewarmer
+from preview import PREVIEW_PER_STRATUM, draw_preview
+from instrumentation import end_request, histograms, record_request, start_request, timed, timing_header
+from snapshot import SnapshotStore
+from serialization import compress_stream, negotiate, payload_response
 
 #----------------- Logging -----------------
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# ----------------- DB Config -----------------
-DB_CONFIGS = {
-    'main': {
-        'host': '10.192.145.144',
-        'port': 5432,
-        'user': 'nspquery',
-        'password': 'nic123',
-        'dbname': 'otrapi_db'
-    },
-    'nsp_fresh': {
-        'host': '10.192.145.137',
-        'port': 5432,
-        'user': 'nspquery',
-        'password': 'nic123',
-        'dbname': 'nsp_fresh_2425'
-    },
-    'nsp_renewal': {
-        'host': '10.192.145.139',
-        'port': 5432,
-        'user': 'nspquery',
-        'password': 'nic123',
-        'dbname': 'nsp_renewal_2425'
-    }
-}
-
 # ----------------- DB Helpers -----------------
+# Connections come from one pool per DB_CONFIGS entry; callers still
+# close() them, which hands them back to the pool.
+pools = PoolRegistry(
+    DB_CONFIGS,
+    minconn=int(os.getenv('NSP_POOL_MIN', '1')),
+    maxconn=int(os.getenv('NSP_POOL_MAX', '10')),
+    timeout=float(os.getenv('NSP_POOL_TIMEOUT', '10')),
+    health_check_after=float(os.getenv('NSP_POOL_HEALTH_CHECK_AFTER', '30'))
+)
+
 def get_connection(db_key: str):
     try:
-        config = DB_CONFIGS[db_key]
-        conn = psycopg2.connect(
-            host=config['host'],
-            port=config['port'],
-            user=config['user'],
-            password=config['password'],
-            dbname=config['dbname'],
-            cursor_factory=DictCursor
-        )
-        return conn
+        with timed('connect'):
+            return pools.get_connection(db_key)
     except Exception as e:
         logger.error(f"Failed to connect to {db_key}: {e}")
         return None
 
 app = Flask(__name__)
 
-@app.route('/api/top-states', methods=['GET'])
-def top_states():
+# ----------------- Master Data -----------------
+# mst_* lookup tables, held in memory so fact queries select ids only.
+MASTER_REFRESH_SECONDS = float(os.getenv('NSP_MASTER_REFRESH', '3600'))
+masters = MasterCache(get_connection, 'nsp_fresh', refresh_interval=MASTER_REFRESH_SECONDS)
+
+# ----------------- Dataset Cache -----------------
+DATASET_TTL_SECONDS = float(os.getenv('NSP_DATASET_TTL', '300'))
+# Optional cap on the rows pulled into the in-memory frame; unset means the
+# full population (use the 'stream' metric source for large databases).
+FRAME_ROW_LIMIT = int(os.getenv('NSP_FRAME_ROW_LIMIT', '0')) or None
+def load_indexed_dataset(conn):
+    return CubedFrame(load_dataset(conn, limit=FRAME_ROW_LIMIT, masters=masters))
+
+datasets = DatasetCache(get_connection, ttl=DATASET_TTL_SECONDS, loader=load_indexed_dataset)
+population = DatasetCache(get_connection, ttl=DATASET_TTL_SECONDS, loader=partial(stream_aggregates, masters=masters))
+# Stratified sample (by state and scheme) behind /api/preview. Its draw is
+# started by the pre-warm thread and redrawn in the background, the previous
+# sample being served meanwhile, so requests never wait on a draw.
+previews = DatasetCache(get_connection, ttl=float(os.getenv('NSP_PREVIEW_TTL', '3600')),
+                        loader=partial(draw_preview, per_stratum=int(os.getenv('NSP_PREVIEW_PER_STRATUM',
+                                                                                str(PREVIEW_PER_STRATUM))),
+                                       masters=masters),
+                        serve_stale=True)
+rollups = RollupStore(get_connection, 'nsp_fresh', refresh_interval=float(os.getenv('NSP_ROLLUP_REFRESH', '60')),
+                      masters=masters, lag=float(os.getenv('NSP_ROLLUP_LAG', '300')),
+                      rebuild_interval=float(os.getenv('NSP_ROLLUP_REBUILD', '3600')))
+
+# Columnar copy of the applicant join, served when the database is down.
+SNAPSHOT_DIR = os.getenv('NSP_SNAPSHOT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots'))
+snapshots = SnapshotStore(SNAPSHOT_DIR, masters=masters)
+
+# ----------------- Federation -----------------
+# ?sources=nsp_fresh,nsp_renewal runs the pushed-down metrics on each listed
+# database in parallel and merges them; &breakdown=sources also returns
+# every database's own payload.
+FEDERATED_DBS = [db_key.strip() for db_key in os.getenv('NSP_FEDERATED_DBS', 'nsp_fresh,nsp_renewal').split(',')
+                 if db_key.strip()]
+federation = Federation(get_connection, {
+    db_key: masters if db_key == masters.db_key else MasterCache(get_connection, db_key, refresh_interval=MASTER_REFRESH_SECONDS)
+    for db_key in FEDERATED_DBS
+}, max_workers=int(os.getenv('NSP_FEDERATION_WORKERS', '8')))
+
+# ----------------- Response Cache -----------------
+# Metric responses carry an ETag derived from the version of the data they
+# were computed from, so repeat polls revalidate with a 304 instead of
+# recomputing, and browsers/proxies may serve them for max-age seconds
+# (and stale while revalidating).
+CACHE_MAX_AGE = int(os.getenv('NSP_CACHE_MAX_AGE', '60'))
+CACHE_STALE_WHILE_REVALIDATE = int(os.getenv('NSP_CACHE_STALE_WHILE_REVALIDATE', '300'))
+fact_versions = {
+    db_key: DataVersion(get_connection, db_key, ttl=float(os.getenv('NSP_VERSION_TTL', '10')))
+    for db_key in set(FEDERATED_DBS) | {'nsp_fresh'}
+}
+
+def db_error_response():
+    return jsonify({"error": "Database connection failed"}), 500
+
+@app.after_request
+def default_cache_headers(response):
+    if request.path.startswith('/api/') and 'Cache-Control' not in response.headers:
+        response.cache_control.no_store = True
+    return response
+
+# ----------------- Instrumentation -----------------
+# Per-request phase timings (connect, query, fetch, frame, aggregate,
+# jsonify) feed per-endpoint histograms at /metrics; NSP_TIMING_HEADER=1
+# also returns them in an X-Timing header.
+TIMING_HEADER = os.getenv('NSP_TIMING_HEADER', '0') == '1'
+
+@app.before_request
+def start_timing():
+    g.request_started = time.perf_counter()
+    start_request()
+
+@app.after_request
+def record_timing(response):
+    total = time.perf_counter() - g.request_started
+    timings = end_request()
+    record_request(request.url_rule.rule if request.url_rule else 'unmatched', timings, total)
+    if TIMING_HEADER:
+        response.headers['X-Timing'] = timing_header(timings, total)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(histograms.exposition(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    db_key = request.args.get('db')
+    datasets.invalidate(db_key)
+    population.invalidate(db_key)
+    if db_key in (None, rollups.db_key):
+        rollups.reset()
+    for version in fact_versions.values():
+        version.invalidate()
+    prewarmer.trigger()
+    return jsonify({"invalidated": db_key or "all"})
+
+@app.route('/api/masters/refresh', methods=['POST'])
+def refresh_masters():
+    try:
+        data = masters.refresh()
+    except DatabaseUnavailable:
+        return db_error_response()
+    prewarmer.trigger()
+    return jsonify(data.sizes())
+
+@app.route('/api/rollups/refresh', methods=['POST'])
+def refresh_rollups():
+    try:
+        rollups.refresh()
+    except DatabaseUnavailable:
+        return db_error_response()
+    prewarmer.trigger()
+    return jsonify({"watermark": str(rollups.watermark), "groups": len(rollups.rollup)})
+
+@app.route('/api/snapshot', methods=['GET'])
+def snapshot_info():
+    return jsonify(snapshots.info('nsp_fresh'))
+
+@app.route('/api/snapshot', methods=['POST'])
+def write_snapshot():
     conn = get_connection('nsp_fresh')
     if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
+        return db_error_response()
     try:
-        cur = conn.cursor()
-        query = """
-            SELECT r.application_id,
-                r.permanent_address,
-                d.district_name,
-                s.state_name, 
-                r.gender, 
-                cat.category_name, 
-                r.category_id,
-                pay.pay_amt_state_shr,
-                pay.pay_amt_centre_shr,
-                r.annual_family_income,
-                r.marital_status,
-                marr.marital_status_name, 
-                r.fresh_renewal,
-                q.c_institution_id,
-                dis.district_name as institute_district,                  
-                sch.scheme_id, 
-                mst.scheme_name
-            FROM data_applicant_registration_details r 
-            join mst_districts d 
-            on d.district_id = r.permanent_district_id
-            join mst_states s on s.state_id = d.state_id 
-            join mst_category cat on cat.category_id = r.category_id
-            join mst_marital_status marr on marr.marital_id = r.marital_status
-            join data_applicant_qualifications q on q.application_id = r.application_id
-            join data_applicant_applied_schemes sch on sch.application_id = r.application_id 
-            join mst_schemes mst on mst.scheme_id = sch.scheme_id 
-            join mst_institution inst on inst.institution_id = q.c_institution_id
-            join mst_districts dis on dis.district_id= inst.district_id
-            join data_applicant_payments_calculation pay on pay.application_id = r.application_id
-            limit 1000
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        colnames = [desc[0] for desc in cur.description]
-        df = pd.DataFrame(results, columns=colnames)
-        
-        numeric_cols = ["pay_amt_state_shr", "pay_amt_centre_shr", "annual_family_income"]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-        
-        df = df.dropna(subset=["pay_amt_state_shr", "pay_amt_centre_shr"], how="all")
-        df['payment_amt_share'] = df[['pay_amt_state_shr', 'pay_amt_centre_shr']].sum(axis=1)
-        
-        state_counts = df['state_name'].value_counts().head(8)
-        data = [{"state": k, "applications": int(v)} for k, v in state_counts.items()]
-        
-        return jsonify(data)
-    
+        snapshots.write(conn, 'nsp_fresh')
+        prewarmer.trigger()
+        return jsonify(snapshots.info('nsp_fresh'))
     except Exception as e:
         logger.error(f"Error: {e}")
         return jsonify({"error": str(e)}), 500
     finally:
-        if conn:
-            conn.close()
+        conn.close()
 
-@app.route('/api/gender-distribution', methods=['GET'])
-def gender_distribution():
-    conn = get_connection('nsp_fresh')
+@app.route('/api/pool-stats', methods=['GET'])
+def pool_stats():
+    return jsonify(pools.stats())
+
+@app.route('/api/coalescing-stats', methods=['GET'])
+def coalescing_stats():
+    return jsonify(flights.stats())
+
+# ----------------- Metrics -----------------
+# 'sql' pushes each aggregation down into PostgreSQL; 'frame' aggregates
+# the cached applicant frame in pandas; 'stream' folds the full applicant
+# join through a server-side cursor into cached running aggregates;
+# 'rollup' reads incrementally refreshed rollups (income stays on SQL);
+# 'snapshot' reads the local columnar snapshot only.
+# Drill-down filters are answered from the frame's inverted indexes under
+# 'frame'/'snapshot' and pushed down as SQL otherwise, since stream
+# aggregates and rollups no longer hold individual applications.
+METRIC_SOURCE = os.getenv('NSP_METRIC_SOURCE', 'sql')
+
+def query_metrics(names, db_key: str = 'nsp_fresh', filters=None):
+    conn = get_connection(db_key)
     if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
+        raise DatabaseUnavailable(db_key)
     try:
-        cur = conn.cursor()
-        query = """
-            SELECT r.application_id,
-                r.permanent_address,
-                d.district_name,
-                s.state_name, 
-                r.gender, 
-                cat.category_name, 
-                r.category_id,
-                pay.pay_amt_state_shr,
-                pay.pay_amt_centre_shr,
-                r.annual_family_income,
-                r.marital_status,
-                marr.marital_status_name, 
-                r.fresh_renewal,
-                q.c_institution_id,
-                dis.district_name as institute_district,                  
-                sch.scheme_id, 
-                mst.scheme_name
-            FROM data_applicant_registration_details r 
-            join mst_districts d 
-            on d.district_id = r.permanent_district_id
-            join mst_states s on s.state_id = d.state_id 
-            join mst_category cat on cat.category_id = r.category_id
-            join mst_marital_status marr on marr.marital_id = r.marital_status
-            join data_applicant_qualifications q on q.application_id = r.application_id
-            join data_applicant_applied_schemes sch on sch.application_id = r.application_id 
-            join mst_schemes mst on mst.scheme_id = sch.scheme_id 
-            join mst_institution inst on inst.institution_id = q.c_institution_id
-            join mst_districts dis on dis.district_id= inst.district_id
-            join data_applicant_payments_calculation pay on pay.application_id = r.application_id
-            limit 1000
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        colnames = [desc[0] for desc in cur.description]
-        df = pd.DataFrame(results, columns=colnames)
-        
-        numeric_cols = ["pay_amt_state_shr", "pay_amt_centre_shr", "annual_family_income"]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-        
-        df = df.dropna(subset=["pay_amt_state_shr", "pay_amt_centre_shr"], how="all")
-        df['payment_amt_share'] = df[['pay_amt_state_shr', 'pay_amt_centre_shr']].sum(axis=1)
-        
-        gender_counts = df['gender'].value_counts()
-        total = gender_counts.sum()
-        data = [{"gender": k, "count": int(v), "percentage": round(v / total * 100, 1)} for k, v in gender_counts.items()]
-        
-        return jsonify(data)
-    
-    except Exception as e:
-        logger.error(f"Error: {e}")
-        return jsonify({"error": str(e)}), 500
+        return fetch_metrics(conn, names, masters, filters)
     finally:
-        if conn:
-            conn.close()
+        conn.close()
 
-@app.route('/api/categories', methods=['GET'])
-def categories():
-    conn = get_connection('nsp_fresh')
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
+def snapshot_results(names, db_key: str = 'nsp_fresh', filters=None):
+    columns = metric_columns(names)
+    columns += [col for col in filter_columns(filters) if col not in columns]
+    with timed('frame'):
+        df = IndexedFrame(snapshots.frame(db_key, columns)).select(filters)
+    with timed('aggregate'):
+        return frame_results(df, names)
+
+def source_results(names, filters=None):
+    # One dataset per call: the cached frame or aggregates, or a single
+    # connection shared by every pushed-down query.
+    if METRIC_SOURCE == 'frame':
+        indexed = datasets.get('nsp_fresh')
+        with timed('aggregate'):
+            return indexed.results(names, filters)
+    if METRIC_SOURCE == 'snapshot':
+        return snapshot_results(names, filters=filters)
+    if filters:
+        return query_metrics(names, filters=filters)
+    if METRIC_SOURCE == 'stream':
+        aggregates = population.get('nsp_fresh')
+        with timed('aggregate'):
+            return {name: aggregates.result(name) for name in names}
+    if METRIC_SOURCE == 'rollup':
+        pushed = [name for name in names if METRICS[name].measure in ('income', 'institutions')]
+        results = query_metrics(pushed) if pushed else {}
+        rollups.get()
+        with timed('aggregate'):
+            results.update({name: rollups.result(name) for name in names if name not in pushed})
+        return results
+    return query_metrics(names)
+
+def data_version(filters=None, sources=None):
+    # Pre-warmed responses carry the version they were computed from.
+    if not filters and not sources and prewarmer.version() is not None:
+        return prewarmer.version()
+    return source_version(filters, sources)
+
+def source_version(filters=None, sources=None):
+    # The frame and (unfiltered) stream sources serve their cached load;
+    # everything else reflects the database (or the snapshot file) as of
+    # now. None means "unknown until computed", e.g. before the master
+    # tables are loaded.
+    if sources:
+        versions = [fact_versions[db_key].get() for db_key in sources]
+        if None in versions or masters.version() is None:
+            return None
+        return f"federated|{'|'.join(versions)}|{masters.version()}"
+    if METRIC_SOURCE == 'snapshot':
+        return f"snapshot|{snapshots.version('nsp_fresh')}" if snapshots.available('nsp_fresh') else None
+    if METRIC_SOURCE == 'frame':
+        base = datasets.version('nsp_fresh')
+    elif METRIC_SOURCE == 'stream' and not filters:
+        base = population.version('nsp_fresh')
+    else:
+        base = fact_versions['nsp_fresh'].get()
+    if base is None or masters.version() is None:
+        return None
+    return f"{METRIC_SOURCE}|{base}|{masters.version()}"
+
+def cached_response(build, filters=None, sources=None):
+    return conditional_response(partial(data_version, filters, sources), build,
+                                CACHE_MAX_AGE, CACHE_STALE_WHILE_REVALIDATE)
+
+# Concurrent identical requests (same source, widgets and filters) share
+# one computation instead of each taking a connection and running it.
+flights = SingleFlight()
+
+def compute_metrics(names, filters=None, sources=None, breakdown=False):
+    if not filters and not sources:
+        prewarmed = prewarmer.get(names)
+        if prewarmed is not None:
+            return prewarmed
+    key = (METRIC_SOURCE, tuple(names), tuple((filters or {}).items()), tuple(sources or ()), breakdown)
+    if sources:
+        return flights.do(key, partial(federated_metrics, names, filters, sources, breakdown))
+    return flights.do(key, partial(evaluate_metrics, names, filters))
+
+def federated_metrics(names, filters, sources, breakdown=False):
+    combined, per_source = federation.results(names, sources, filters)
+    with timed('aggregate'):
+        payloads = {name: build_payload(name, result) for name, result in combined.items()}
+    if not breakdown:
+        return payloads
+    return {
+        name: {
+            "combined": payload,
+            "sources": {db_key: build_payload(name, per_source[db_key][name]) for db_key in sources},
+        }
+        for name, payload in payloads.items()
+    }
+
+def evaluate_metrics(names, filters=None):
+    try:
+        results = source_results(names, filters)
+    except (DatabaseUnavailable, psycopg2.OperationalError) as e:
+        if not snapshots.available('nsp_fresh'):
+            raise
+        logger.warning(f"Serving {', '.join(names)} from snapshot: {e}")
+        results = snapshot_results(names, filters=filters)
+    with timed('aggregate'):
+        return {name: build_payload(name, result) for name, result in results.items()}
+
+# ----------------- Pre-warming -----------------
+# The unfiltered metric set is recomputed on a background thread every
+# NSP_PREWARM_INTERVAL seconds (0 disables), or as soon as the fact tables
+# change, and swapped in whole. Unfiltered requests are answered from it,
+# stale while it revalidates, so they never wait on the database;
+# filtered and federated requests are computed on demand.
+def reload_cached_sources():
+    # New data: the cached frame/aggregates reload on the pre-warm thread.
+    datasets.invalidate('nsp_fresh')
+    population.invalidate('nsp_fresh')
+    previews.invalidate('nsp_fresh')
+
+def prewarm():
+    # The preview sample is drawn on its own thread first, so it is ready
+    # long before the exact metrics below.
+    previews.peek('nsp_fresh')
+    return evaluate_metrics(list(METRICS))
+
+prewarmer = Prewarmer(
+    prewarm,
+    version=source_version,
+    fingerprint=lambda: fact_versions['nsp_fresh'].get(),
+    on_change=reload_cached_sources,
+    interval=float(os.getenv('NSP_PREWARM_INTERVAL', '60')),
+    check_interval=float(os.getenv('NSP_PREWARM_CHECK_INTERVAL', '10'))
+)
+
+@app.before_request
+def start_prewarming():
+    prewarmer.start()
+
+@app.before_request
+def load_masters():
+    # Response versions include the masters version, so the master tables
+    # are loaded before the first response rather than on first use (under
+    # a WSGI server the __main__ block below never runs).
+    if masters.version() is None:
+        try:
+            masters.get()
+        except (DatabaseUnavailable, psycopg2.OperationalError) as e:
+            logger.warning(f"Master tables not loaded: {e}")
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    state = prewarmer.health()
+    if not state["enabled"]:
+        status = "ok"
+    elif state["last_refresh"] is None:
+        status = "warming"
+    else:
+        status = "stale" if state["stale"] or state["last_error"] else "ok"
+    return jsonify({"status": status, "metric_source": METRIC_SOURCE, "masters_version": masters.version(),
+                    "prewarm": state})
+
+def compute_metric(name: str, filters=None, sources=None, breakdown=False):
+    return compute_metrics([name], filters, sources, breakdown)[name]
+
+def request_scope(reserved=()):
+    # (filters, sources, breakdown) shared by every metric route.
+    filters = parse_filters(request.args, reserved=reserved + ('sources', 'breakdown'))
+    sources = parse_sources(request.args, FEDERATED_DBS)
+    return filters, sources, request.args.get('breakdown') == 'sources'
+
+def metric_response(name: str):
+    try:
+        filters, sources, breakdown = request_scope()
+    except FilterError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return cached_response(lambda: metric_json(name, filters, sources, breakdown), filters, sources)
+
+def metric_json(name: str, filters, sources=None, breakdown=False):
     try:
-        cur = conn.cursor()
-        query = """
-            SELECT r.application_id,
-                r.permanent_address,
-                d.district_name,
-                s.state_name, 
-                r.gender, 
-                cat.category_name, 
-                r.category_id,
-                pay.pay_amt_state_shr,
-                pay.pay_amt_centre_shr,
-                r.annual_family_income,
-                r.marital_status,
-                marr.marital_status_name, 
-                r.fresh_renewal,
-                q.c_institution_id,
-                dis.district_name as institute_district,                  
-                sch.scheme_id, 
-                mst.scheme_name
-            FROM data_applicant_registration_details r 
-            join mst_districts d 
-            on d.district_id = r.permanent_district_id
-            join mst_states s on s.state_id = d.state_id 
-            join mst_category cat on cat.category_id = r.category_id
-            join mst_marital_status marr on marr.marital_id = r.marital_status
-            join data_applicant_qualifications q on q.application_id = r.application_id
-            join data_applicant_applied_schemes sch on sch.application_id = r.application_id 
-            join mst_schemes mst on mst.scheme_id = sch.scheme_id 
-            join mst_institution inst on inst.institution_id = q.c_institution_id
-            join mst_districts dis on dis.district_id= inst.district_id
-            join data_applicant_payments_calculation pay on pay.application_id = r.application_id
-            limit 1000
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        colnames = [desc[0] for desc in cur.description]
-        df = pd.DataFrame(results, columns=colnames)
-        
-        numeric_cols = ["pay_amt_state_shr", "pay_amt_centre_shr", "annual_family_income"]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-        
-        df = df.dropna(subset=["pay_amt_state_shr", "pay_amt_centre_shr"], how="all")
-        df['payment_amt_share'] = df[['pay_amt_state_shr', 'pay_amt_centre_shr']].sum(axis=1)
-        
-        category_counts = df['category_name'].value_counts()
-        data = [{"category": k, "applications": int(v)} for k, v in category_counts.items()]
-        
-        return jsonify(data)
-    
+        payload = compute_metric(name, filters, sources, breakdown)
+        with timed('jsonify'):
+            return payload_response(payload, request.headers)
+    except DatabaseUnavailable:
+        return db_error_response()
     except Exception as e:
         logger.error(f"Error: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
-@app.route('/api/funding-breakdown', methods=['GET'])
-def funding_breakdown():
-    conn = get_connection('nsp_fresh')
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
+@app.route('/api/dashboard', methods=['GET'])
+def dashboard():
+    widgets = request.args.get('widgets')
+    names = [w.strip() for w in widgets.split(',') if w.strip()] if widgets else list(METRICS)
+    unknown = [name for name in names if name not in METRICS]
+    if unknown:
+        return jsonify({"error": f"Unknown widgets: {', '.join(unknown)}"}), 400
     try:
-        cur = conn.cursor()
-        query = """
-            SELECT r.application_id,
-                r.permanent_address,
-                d.district_name,
-                s.state_name, 
-                r.gender, 
-                cat.category_name, 
-                r.category_id,
-                pay.pay_amt_state_shr,
-                pay.pay_amt_centre_shr,
-                r.annual_family_income,
-                r.marital_status,
-                marr.marital_status_name, 
-                r.fresh_renewal,
-                q.c_institution_id,
-                dis.district_name as institute_district,                  
-                sch.scheme_id, 
-                mst.scheme_name
-            FROM data_applicant_registration_details r 
-            join mst_districts d 
-            on d.district_id = r.permanent_district_id
-            join mst_states s on s.state_id = d.state_id 
-            join mst_category cat on cat.category_id = r.category_id
-            join mst_marital_status marr on marr.marital_id = r.marital_status
-            join data_applicant_qualifications q on q.application_id = r.application_id
-            join data_applicant_applied_schemes sch on sch.application_id = r.application_id 
-            join mst_schemes mst on mst.scheme_id = sch.scheme_id 
-            join mst_institution inst on inst.institution_id = q.c_institution_id
-            join mst_districts dis on dis.district_id= inst.district_id
-            join data_applicant_payments_calculation pay on pay.application_id = r.application_id
-            limit 1000
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        colnames = [desc[0] for desc in cur.description]
-        df = pd.DataFrame(results, columns=colnames)
-        
-        numeric_cols = ["pay_amt_state_shr", "pay_amt_centre_shr", "annual_family_income"]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-        
-        df = df.dropna(subset=["pay_amt_state_shr", "pay_amt_centre_shr"], how="all")
-        df['payment_amt_share'] = df[['pay_amt_state_shr', 'pay_amt_centre_shr']].sum(axis=1)
-        
-        funding_data = df[['pay_amt_state_shr', 'pay_amt_centre_shr']].sum()
-        data = {
-            "state_share": int(funding_data['pay_amt_state_shr']),
-            "centre_share": int(funding_data['pay_amt_centre_shr']),
-            "total": int(funding_data.sum())
-        }
-        
-        return jsonify(data)
-    
+        filters, sources, breakdown = request_scope(reserved=('widgets',))
+    except FilterError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return cached_response(lambda: dashboard_json(names, filters, sources, breakdown), filters, sources)
+
+def dashboard_json(names, filters, sources=None, breakdown=False):
+    try:
+        payloads = compute_metrics(names, filters, sources, breakdown)
+        with timed('jsonify'):
+            return payload_response(payloads, request.headers)
+    except DatabaseUnavailable:
+        return db_error_response()
     except Exception as e:
         logger.error(f"Error: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
-@app.route('/api/income-distribution', methods=['GET'])
-def income_distribution():
-    conn = get_connection('nsp_fresh')
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
+# ----------------- Preview -----------------
+# Every widget estimated from the cached stratified sample, with a 95%
+# confidence interval ("<key>_ci": [low, high]) per value, so a dashboard
+# can render at once and swap in /api/dashboard when it arrives.
+# Unfiltered requests are answered exactly once the pre-warmed metrics
+# exist; "exact" says which one the client got. Until the first sample is
+# drawn, requests get 503 {"warming": true} with a Retry-After.
+PREVIEW_RETRY_AFTER = int(os.getenv('NSP_PREVIEW_RETRY_AFTER', '5'))
+
+def preview_version():
+    base = previews.version('nsp_fresh')
+    if base is None or masters.version() is None:
+        return None
+    return f"preview|{base}|{prewarmer.version()}|{masters.version()}"
+
+@app.route('/api/preview', methods=['GET'])
+def preview():
+    widgets = request.args.get('widgets')
+    names = [w.strip() for w in widgets.split(',') if w.strip()] if widgets else list(METRICS)
+    unknown = [name for name in names if name not in METRICS]
+    if unknown:
+        return jsonify({"error": f"Unknown widgets: {', '.join(unknown)}"}), 400
     try:
-        cur = conn.cursor()
-        query = """
-            SELECT r.application_id,
-                r.permanent_address,
-                d.district_name,
-                s.state_name, 
-                r.gender, 
-                cat.category_name, 
-                r.category_id,
-                pay.pay_amt_state_shr,
-                pay.pay_amt_centre_shr,
-                r.annual_family_income,
-                r.marital_status,
-                marr.marital_status_name, 
-                r.fresh_renewal,
-                q.c_institution_id,
-                dis.district_name as institute_district,                  
-                sch.scheme_id, 
-                mst.scheme_name
-            FROM data_applicant_registration_details r 
-            join mst_districts d 
-            on d.district_id = r.permanent_district_id
-            join mst_states s on s.state_id = d.state_id 
-            join mst_category cat on cat.category_id = r.category_id
-            join mst_marital_status marr on marr.marital_id = r.marital_status
-            join data_applicant_qualifications q on q.application_id = r.application_id
-            join data_applicant_applied_schemes sch on sch.application_id = r.application_id 
-            join mst_schemes mst on mst.scheme_id = sch.scheme_id 
-            join mst_institution inst on inst.institution_id = q.c_institution_id
-            join mst_districts dis on dis.district_id= inst.district_id
-            join data_applicant_payments_calculation pay on pay.application_id = r.application_id
-            limit 1000
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        colnames = [desc[0] for desc in cur.description]
-        df = pd.DataFrame(results, columns=colnames)
-        
-        numeric_cols = ["pay_amt_state_shr", "pay_amt_centre_shr", "annual_family_income"]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-        
-        df = df.dropna(subset=["pay_amt_state_shr", "pay_amt_centre_shr"], how="all")
-        df['payment_amt_share'] = df[['pay_amt_state_shr', 'pay_amt_centre_shr']].sum(axis=1)
-        
-        income_data = df['annual_family_income'].dropna()
-        mean_income = income_data.mean()
-        median_income = income_data.median()
-        
-        counts, bins = np.histogram(income_data, bins=20)
-        
-        density = stats.gaussian_kde(income_data)
-        xs = np.linspace(income_data.min(), income_data.max(), 200)
-        ys = density(xs)
-        
-        data = {
-            "stats": {
-                "mean": int(mean_income),
-                "median": int(median_income)
-            },
-            "histogram": {
-                "bins": bins.tolist(),
-                "counts": counts.tolist()
-            },
-            "kde": {
-                "x": xs.tolist(),
-                "y": ys.tolist()
-            }
-        }
-        
-        return jsonify(data)
-    
+        filters = parse_filters(request.args, reserved=('widgets',))
+    except FilterError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return conditional_response(preview_version, lambda: preview_json(names, filters),
+                                CACHE_MAX_AGE, CACHE_STALE_WHILE_REVALIDATE)
+
+def preview_json(names, filters):
+    try:
+        prewarmed = None if filters else prewarmer.get(names)
+        if prewarmed is not None:
+            payload = {"exact": True, "metrics": prewarmed}
+        else:
+            sample = previews.peek('nsp_fresh')
+            if sample is None:
+                response = jsonify({"warming": True})
+                response.headers['Retry-After'] = str(PREVIEW_RETRY_AFTER)
+                return response, 503
+            with timed('aggregate'):
+                payload = {"exact": sample.exact, "sample": sample.info(), "metrics": sample.payloads(names, filters)}
+        with timed('jsonify'):
+            return payload_response(payload, request.headers)
+    except DatabaseUnavailable:
+        return db_error_response()
     except Exception as e:
         logger.error(f"Error: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
 
-@app.route('/api/top-districts-payments', methods=['GET'])
-def top_districts_payments():
-    conn = get_connection('nsp_fresh')
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
+# ----------------- Payment Slices -----------------
+# Counts and state/centre share sums by any combination of state,
+# institute_district, scheme, category and gender (e.g. ?by=category&by=gender),
+# read from the payment cube of the cached applicant frame whatever the
+# metric source. Drill-down filters apply as usual.
+def cube_version():
+    base = datasets.version('nsp_fresh')
+    if base is None or masters.version() is None:
+        return None
+    return f"cube|{base}|{masters.version()}"
+
+@app.route('/api/payment-slice', methods=['GET'])
+def payment_slice():
+    try:
+        fields = parse_slice(request.args)
+        limit = parse_limit(request.args)
+        filters = parse_filters(request.args, reserved=('by', 'limit'))
+    except FilterError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return conditional_response(cube_version, lambda: payment_slice_json(fields, filters, limit),
+                                CACHE_MAX_AGE, CACHE_STALE_WHILE_REVALIDATE)
+
+def payment_slice_json(fields, filters, limit=None):
     try:
-        cur = conn.cursor()
-        query = """
-            SELECT r.application_id,
-                r.permanent_address,
-                d.district_name,
-                s.state_name, 
-                r.gender, 
-                cat.category_name, 
-                r.category_id,
-                pay.pay_amt_state_shr,
-                pay.pay_amt_centre_shr,
-                r.annual_family_income,
-                r.marital_status,
-                marr.marital_status_name, 
-                r.fresh_renewal,
-                q.c_institution_id,
-                dis.district_name as institute_district,                  
-                sch.scheme_id, 
-                mst.scheme_name
-            FROM data_applicant_registration_details r 
-            join mst_districts d 
-            on d.district_id = r.permanent_district_id
-            join mst_states s on s.state_id = d.state_id 
-            join mst_category cat on cat.category_id = r.category_id
-            join mst_marital_status marr on marr.marital_id = r.marital_status
-            join data_applicant_qualifications q on q.application_id = r.application_id
-            join data_applicant_applied_schemes sch on sch.application_id = r.application_id 
-            join mst_schemes mst on mst.scheme_id = sch.scheme_id 
-            join mst_institution inst on inst.institution_id = q.c_institution_id
-            join mst_districts dis on dis.district_id= inst.district_id
-            join data_applicant_payments_calculation pay on pay.application_id = r.application_id
-            limit 1000
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        colnames = [desc[0] for desc in cur.description]
-        df = pd.DataFrame(results, columns=colnames)
-        
-        numeric_cols = ["pay_amt_state_shr", "pay_amt_centre_shr", "annual_family_income"]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-        
-        df = df.dropna(subset=["pay_amt_state_shr", "pay_amt_centre_shr"], how="all")
-        df['payment_amt_share'] = df[['pay_amt_state_shr', 'pay_amt_centre_shr']].sum(axis=1)
-        
-        district_payments = df.groupby('institute_district')['payment_amt_share'].sum().sort_values(ascending=False).head(8)
-        total = district_payments.sum()
-        data = [{"district": k, "payment": int(v), "percentage": round(v / total * 100, 1)} for k, v in district_payments.items()]
-        
-        return jsonify(data)
-    
+        indexed = datasets.get('nsp_fresh')
+        with timed('aggregate'):
+            payload = slice_payload(indexed.cube_for(filters), fields, limit)
+        with timed('jsonify'):
+            return payload_response(payload, request.headers)
+    except DatabaseUnavailable:
+        return db_error_response()
     except Exception as e:
         logger.error(f"Error: {e}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
+
+# ----------------- Export -----------------
+# Streams the joined applicant dataset (CSV or Parquet) chunk by chunk from
+# a server-side cursor; the pooled connections are returned when the
+# response is closed, including when the client disconnects mid-download.
+EXPORT_CHUNK_SIZE = int(os.getenv('NSP_EXPORT_CHUNK_SIZE', '50000'))
+
+@app.route('/api/export', methods=['GET'])
+def export_dataset():
+    try:
+        export_format = parse_format(request.args)
+        columns = parse_columns(request.args)
+        filters, sources, _ = request_scope(reserved=('format', 'columns'))
+    except FilterError as e:
+        return jsonify({"error": str(e)}), 400
+
+    connections, scope = [], []
+    def close_connections():
+        for conn in connections:
             conn.close()
 
+    try:
+        for db_key in sources or ['nsp_fresh']:
+            conn = get_connection(db_key)
+            if not conn:
+                raise DatabaseUnavailable(db_key)
+            connections.append(conn)
+            scope.append((db_key, conn, federation.masters.get(db_key, masters).get(conn)))
+    except DatabaseUnavailable:
+        close_connections()
+        return db_error_response()
+
+    stream = export_stream(export_format, scope, columns, filters, EXPORT_CHUNK_SIZE)
+    # Parquet pages are compressed already; CSV is compressed as it streams.
+    encoding = negotiate(accept_encoding=request.headers.get('Accept-Encoding'))[1] if export_format == 'csv' else None
+    response = Response(compress_stream(stream, encoding) if encoding else stream, mimetype=EXPORT_FORMATS[export_format])
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Content-Disposition'] = f"attachment; filename=nsp_applicants.{export_format}"
+    response.call_on_close(close_connections)
+    return response
+
+@app.route('/api/top-states', methods=['GET'])
+def top_states():
+    return metric_response('top-states')
+
+@app.route('/api/gender-distribution', methods=['GET'])
+def gender_distribution():
+    return metric_response('gender-distribution')
+
+@app.route('/api/categories', methods=['GET'])
+def categories():
+    return metric_response('categories')
+
+@app.route('/api/funding-breakdown', methods=['GET'])
+def funding_breakdown():
+    return metric_response('funding-breakdown')
+
+@app.route('/api/income-distribution', methods=['GET'])
+def income_distribution():
+    return metric_response('income-distribution')
+
+@app.route('/api/top-districts-payments', methods=['GET'])
+def top_districts_payments():
+    return metric_response('top-districts-payments')
+
 @app.route('/api/top-schemes-payments', methods=['GET'])
 def top_schemes_payments():
-    conn = get_connection('nsp_fresh')
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
-    try:
-        cur = conn.cursor()
-        query = """
-            SELECT r.application_id,
-                r.permanent_address,
-                d.district_name,
-                s.state_name, 
-                r.gender, 
-                cat.category_name, 
-                r.category_id,
-                pay.pay_amt_state_shr,
-                pay.pay_amt_centre_shr,
-                r.annual_family_income,
-                r.marital_status,
-                marr.marital_status_name, 
-                r.fresh_renewal,
-                q.c_institution_id,
-                dis.district_name as institute_district,                  
-                sch.scheme_id, 
-                mst.scheme_name
-            FROM data_applicant_registration_details r 
-            join mst_districts d 
-            on d.district_id = r.permanent_district_id
-            join mst_states s on s.state_id = d.state_id 
-            join mst_category cat on cat.category_id = r.category_id
-            join mst_marital_status marr on marr.marital_id = r.marital_status
-            join data_applicant_qualifications q on q.application_id = r.application_id
-            join data_applicant_applied_schemes sch on sch.application_id = r.application_id 
-            join mst_schemes mst on mst.scheme_id = sch.scheme_id 
-            join mst_institution inst on inst.institution_id = q.c_institution_id
-            join mst_districts dis on dis.district_id= inst.district_id
-            join data_applicant_payments_calculation pay on pay.application_id = r.application_id
-            limit 1000
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        colnames = [desc[0] for desc in cur.description]
-        df = pd.DataFrame(results, columns=colnames)
-        
-        numeric_cols = ["pay_amt_state_shr", "pay_amt_centre_shr", "annual_family_income"]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-        
-        df = df.dropna(subset=["pay_amt_state_shr", "pay_amt_centre_shr"], how="all")
-        df['payment_amt_share'] = df[['pay_amt_state_shr', 'pay_amt_centre_shr']].sum(axis=1)
-        
-        scheme_payments = df.groupby('scheme_name')['payment_amt_share'].sum().sort_values(ascending=False).head(8)
-        total = scheme_payments.sum()
-        data = [{"scheme": k, "payment": int(v), "percentage": round(v / total * 100, 1)} for k, v in scheme_payments.items()]
-        
-        return jsonify(data)
-    
-    except Exception as e:
-        logger.error(f"Error: {e}")
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
+    return metric_response('top-schemes-payments')
 
 @app.route('/api/category-payments', methods=['GET'])
 def category_payments():
-    conn = get_connection('nsp_fresh')
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
-    try:
-        cur = conn.cursor()
-        query = """
-            SELECT r.application_id,
-                r.permanent_address,
-                d.district_name,
-                s.state_name, 
-                r.gender, 
-                cat.category_name, 
-                r.category_id,
-                pay.pay_amt_state_shr,
-                pay.pay_amt_centre_shr,
-                r.annual_family_income,
-                r.marital_status,
-                marr.marital_status_name, 
-                r.fresh_renewal,
-                q.c_institution_id,
-                dis.district_name as institute_district,                  
-                sch.scheme_id, 
-                mst.scheme_name
-            FROM data_applicant_registration_details r 
-            join mst_districts d 
-            on d.district_id = r.permanent_district_id
-            join mst_states s on s.state_id = d.state_id 
-            join mst_category cat on cat.category_id = r.category_id
-            join mst_marital_status marr on marr.marital_id = r.marital_status
-            join data_applicant_qualifications q on q.application_id = r.application_id
-            join data_applicant_applied_schemes sch on sch.application_id = r.application_id 
-            join mst_schemes mst on mst.scheme_id = sch.scheme_id 
-            join mst_institution inst on inst.institution_id = q.c_institution_id
-            join mst_districts dis on dis.district_id= inst.district_id
-            join data_applicant_payments_calculation pay on pay.application_id = r.application_id
-            limit 1000
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        colnames = [desc[0] for desc in cur.description]
-        df = pd.DataFrame(results, columns=colnames)
-        
-        numeric_cols = ["pay_amt_state_shr", "pay_amt_centre_shr", "annual_family_income"]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-        
-        df = df.dropna(subset=["pay_amt_state_shr", "pay_amt_centre_shr"], how="all")
-        df['payment_amt_share'] = df[['pay_amt_state_shr', 'pay_amt_centre_shr']].sum(axis=1)
-        
-        category_payments = df.groupby('category_name')['payment_amt_share'].sum().sort_values(ascending=False)
-        data = [{"category": k, "payment": int(v)} for k, v in category_payments.items()]
-        
-        return jsonify(data)
-    
-    except Exception as e:
-        logger.error(f"Error: {e}")
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
+    return metric_response('category-payments')
 
 @app.route('/api/gender-payments', methods=['GET'])
 def gender_payments():
-    conn = get_connection('nsp_fresh')
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
-    try:
-        cur = conn.cursor()
-        query = """
-            SELECT r.application_id,
-                r.permanent_address,
-                d.district_name,
-                s.state_name, 
-                r.gender, 
-                cat.category_name, 
-                r.category_id,
-                pay.pay_amt_state_shr,
-                pay.pay_amt_centre_shr,
-                r.annual_family_income,
-                r.marital_status,
-                marr.marital_status_name, 
-                r.fresh_renewal,
-                q.c_institution_id,
-                dis.district_name as institute_district,                  
-                sch.scheme_id, 
-                mst.scheme_name
-            FROM data_applicant_registration_details r 
-            join mst_districts d 
-            on d.district_id = r.permanent_district_id
-            join mst_states s on s.state_id = d.state_id 
-            join mst_category cat on cat.category_id = r.category_id
-            join mst_marital_status marr on marr.marital_id = r.marital_status
-            join data_applicant_qualifications q on q.application_id = r.application_id
-            join data_applicant_applied_schemes sch on sch.application_id = r.application_id 
-            join mst_schemes mst on mst.scheme_id = sch.scheme_id 
-            join mst_institution inst on inst.institution_id = q.c_institution_id
-            join mst_districts dis on dis.district_id= inst.district_id
-            join data_applicant_payments_calculation pay on pay.application_id = r.application_id
-            limit 1000
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        colnames = [desc[0] for desc in cur.description]
-        df = pd.DataFrame(results, columns=colnames)
-        
-        numeric_cols = ["pay_amt_state_shr", "pay_amt_centre_shr", "annual_family_income"]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-        
-        df = df.dropna(subset=["pay_amt_state_shr", "pay_amt_centre_shr"], how="all")
-        df['payment_amt_share'] = df[['pay_amt_state_shr', 'pay_amt_centre_shr']].sum(axis=1)
-        
-        gender_payments = df.groupby('gender')['payment_amt_share'].sum().sort_values(ascending=False)
-        data = [{"gender": k, "payment": int(v)} for k, v in gender_payments.items()]
-        
-        return jsonify(data)
-    
-    except Exception as e:
-        logger.error(f"Error: {e}")
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
+    return metric_response('gender-payments')
 
 @app.route('/api/top-schemes-applications', methods=['GET'])
 def top_schemes_applications():
-    conn = get_connection('nsp_fresh')
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
-    try:
-        cur = conn.cursor()
-        query = """
-            SELECT r.application_id,
-                r.permanent_address,
-                d.district_name,
-                s.state_name, 
-                r.gender, 
-                cat.category_name, 
-                r.category_id,
-                pay.pay_amt_state_shr,
-                pay.pay_amt_centre_shr,
-                r.annual_family_income,
-                r.marital_status,
-                marr.marital_status_name, 
-                r.fresh_renewal,
-                q.c_institution_id,
-                dis.district_name as institute_district,                  
-                sch.scheme_id, 
-                mst.scheme_name
-            FROM data_applicant_registration_details r 
-            join mst_districts d 
-            on d.district_id = r.permanent_district_id
-            join mst_states s on s.state_id = d.state_id 
-            join mst_category cat on cat.category_id = r.category_id
-            join mst_marital_status marr on marr.marital_id = r.marital_status
-            join data_applicant_qualifications q on q.application_id = r.application_id
-            join data_applicant_applied_schemes sch on sch.application_id = r.application_id 
-            join mst_schemes mst on mst.scheme_id = sch.scheme_id 
-            join mst_institution inst on inst.institution_id = q.c_institution_id
-            join mst_districts dis on dis.district_id= inst.district_id
-            join data_applicant_payments_calculation pay on pay.application_id = r.application_id
-            limit 1000
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        colnames = [desc[0] for desc in cur.description]
-        df = pd.DataFrame(results, columns=colnames)
-        
-        numeric_cols = ["pay_amt_state_shr", "pay_amt_centre_shr", "annual_family_income"]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-        
-        df = df.dropna(subset=["pay_amt_state_shr", "pay_amt_centre_shr"], how="all")
-        df['payment_amt_share'] = df[['pay_amt_state_shr', 'pay_amt_centre_shr']].sum(axis=1)
-        
-        scheme_counts = df['scheme_name'].value_counts().head(8)
-        data = [{"scheme": k, "applications": int(v)} for k, v in scheme_counts.items()]
-        
-        return jsonify(data)
-    
-    except Exception as e:
-        logger.error(f"Error: {e}")
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
+    return metric_response('top-schemes-applications')
 
 @app.route('/api/summary', methods=['GET'])
 def summary():
-    conn = get_connection('nsp_fresh')
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
-    
-    try:
-        cur = conn.cursor()
-        query = """
-            SELECT r.application_id,
-                r.permanent_address,
-                d.district_name,
-                s.state_name, 
-                r.gender, 
-                cat.category_name, 
-                r.category_id,
-                pay.pay_amt_state_shr,
-                pay.pay_amt_centre_shr,
-                r.annual_family_income,
-                r.marital_status,
-                marr.marital_status_name, 
-                r.fresh_renewal,
-                q.c_institution_id,
-                dis.district_name as institute_district,                  
-                sch.scheme_id, 
-                mst.scheme_name
-            FROM data_applicant_registration_details r 
-            join mst_districts d 
-            on d.district_id = r.permanent_district_id
-            join mst_states s on s.state_id = d.state_id 
-            join mst_category cat on cat.category_id = r.category_id
-            join mst_marital_status marr on marr.marital_id = r.marital_status
-            join data_applicant_qualifications q on q.application_id = r.application_id
-            join data_applicant_applied_schemes sch on sch.application_id = r.application_id 
-            join mst_schemes mst on mst.scheme_id = sch.scheme_id 
-            join mst_institution inst on inst.institution_id = q.c_institution_id
-            join mst_districts dis on dis.district_id= inst.district_id
-            join data_applicant_payments_calculation pay on pay.application_id = r.application_id
-            limit 1000
-        """
-        cur.execute(query)
-        results = cur.fetchall()
-        colnames = [desc[0] for desc in cur.description]
-        df = pd.DataFrame(results, columns=colnames)
-        
-        numeric_cols = ["pay_amt_state_shr", "pay_amt_centre_shr", "annual_family_income"]
-        for col in numeric_cols:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors="coerce")
-        
-        df = df.dropna(subset=["pay_amt_state_shr", "pay_amt_centre_shr"], how="all")
-        df['payment_amt_share'] = df[['pay_amt_state_shr', 'pay_amt_centre_shr']].sum(axis=1)
-        
-        total_applications = len(df)
-        total_funding = df['payment_amt_share'].sum()
-        avg_payment = df['payment_amt_share'].mean()
-        
-        data = {
-            "total_applications": int(total_applications),
-            "total_funding": int(total_funding),
-            "avg_payment": int(avg_payment)
-        }
-        
-        return jsonify(data)
-    
-    except Exception as e:
-        logger.error(f"Error: {e}")
-        return jsonify({"error": str(e)}), 500
-    finally:
-        if conn:
-            conn.close()
+    return metric_response('summary')
+
+@app.route('/api/top-districts-institutions', methods=['GET'])
+def top_districts_institutions():
+    return metric_response('top-districts-institutions')
+
+@app.route('/api/top-schemes-institutions', methods=['GET'])
+def top_schemes_institutions():
+    return metric_response('top-schemes-institutions')
 
 if __name__ == "__main__":
+    try:
+        masters.refresh()
+    except DatabaseUnavailable:
+        logger.warning("Master tables not loaded at startup; they load on first use")
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,258 @@
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+
+from distinct import DistinctFrames, grain
+from filters import FILTER_FIELDS, FilterError, IndexedFrame
+from metrics import METRICS, grain_columns, rank_pairs, rows_result
+
+# ----------------- Payment Cube -----------------
+# Application counts and state/centre share sums for every occupied
+# combination of the dashboard dimensions, built in one vectorised pass:
+# each row's dimension codes are packed into one int64 key (mixed radix),
+# the keys are sorted once and np.add.reduceat sums each run of equal
+# keys. Any slice (one dimension, or e.g. category x gender) then groups
+# the cells, not the rows, with np.bincount over the packed slice key.
+# Each cell holds one set of sums per grain (distinct.py): over the first
+# row of each application, of each (application, institute district), ...
+# so a slice reads the set that counts every application once per label.
+CUBE_DIMENSIONS = ['state_name', 'institute_district', 'scheme_name', 'category_name', 'gender']
+CUBE_MEASURES = ('count', 'payment', 'funding', 'summary')
+CUBE_GRAINS = [combo for size in range(3) for combo in combinations(grain(CUBE_DIMENSIONS), size)]
+# Dense slices (bincount over every possible slice key) up to this many keys.
+DENSE_SLICE_LIMIT = 1 << 22
+# Slice dimensions by their filter name, e.g. ?by=category&by=gender.
+SLICE_FIELDS = {field: spec.column for field, spec in FILTER_FIELDS.items() if spec.column in CUBE_DIMENSIONS}
+
+
+def dimension_codes(values):
+    """(codes, labels) with code 0 reserved for missing labels."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, labels = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, labels = pd.factorize(values)
+        labels = pd.Index(labels)
+    return codes.astype(np.int64) + 1, labels
+
+
+def pack(codes, radixes):
+    key = np.zeros(len(codes[0]) if codes else 0, dtype=np.int64)
+    for dim_codes, radix in zip(codes, radixes):
+        key = key * radix + dim_codes
+    return key
+
+
+def unpack(key, radixes):
+    codes = []
+    for radix in reversed(radixes):
+        key, dim_codes = np.divmod(key, radix)
+        codes.append(dim_codes)
+    return codes[::-1]
+
+
+class PaymentCube:
+    def __init__(self, labels: dict, codes: dict, measures: dict, base_grain=()):
+        self.labels = labels
+        self.codes = codes
+        # {grain: (applications, state_share, centre_share)} per cell
+        self.measures = measures
+        # Fan-out dimensions pinned to one value by where().
+        self.base_grain = base_grain
+
+    def __len__(self):
+        return len(next(iter(self.codes.values())))
+
+    @classmethod
+    def from_frame(cls, df, distinct=None):
+        labels, row_codes = {}, []
+        for dim in CUBE_DIMENSIONS:
+            codes, labels[dim] = dimension_codes(df[dim])
+            row_codes.append(codes)
+        radixes = [len(labels[dim]) + 1 for dim in CUBE_DIMENSIONS]
+
+        key = pack(row_codes, radixes)
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]]) if len(key) else np.zeros(0, dtype=np.int64)
+
+        def sums(values):
+            return np.add.reduceat(values[order], starts) if len(starts) else np.zeros(0)
+
+        state_share = df['pay_amt_state_shr'].fillna(0).to_numpy(dtype=float)
+        centre_share = df['pay_amt_centre_shr'].fillna(0).to_numpy(dtype=float)
+        distinct = distinct or DistinctFrames(df)
+        measures = {}
+        for cube_grain in CUBE_GRAINS:
+            if distinct.unique and measures:
+                # No application repeats, so every grain counts every row.
+                measures[cube_grain] = measures[()]
+                continue
+            first = distinct.first_rows(cube_grain).astype(float)
+            measures[cube_grain] = (
+                sums(first).astype(np.int64), sums(first * state_share), sums(first * centre_share)
+            )
+
+        cell_codes = unpack(key[starts], radixes)
+        return cls(labels, dict(zip(CUBE_DIMENSIONS, cell_codes)), measures)
+
+    # ----------------- Selection -----------------
+    @staticmethod
+    def filter_grain(filters):
+        """Fan-out dimensions the cells must be counted per to answer
+        ``filters``, or None if cells cannot answer them. Registration
+        dimensions select whole applications; a fan-out dimension only with
+        a single value (an application can match several)."""
+        pinned = []
+        for field, values in (filters or {}).items():
+            dim = FILTER_FIELDS[field].column
+            if dim not in CUBE_DIMENSIONS:
+                return None
+            if dim in grain(CUBE_DIMENSIONS):
+                if len(values) > 1:
+                    return None
+                pinned.append(dim)
+        return grain(pinned)
+
+    @staticmethod
+    def covers(filters):
+        return PaymentCube.filter_grain(filters) is not None
+
+    def where(self, filters):
+        """The cells matching drill-down ``filters`` on cube dimensions."""
+        mask = np.ones(len(self), dtype=bool)
+        for field, values in (filters or {}).items():
+            dim = FILTER_FIELDS[field].column
+            wanted = self.labels[dim].get_indexer(list(values))
+            mask &= np.isin(self.codes[dim], wanted[wanted >= 0] + 1)
+        return PaymentCube(
+            self.labels,
+            {dim: codes[mask] for dim, codes in self.codes.items()},
+            {key: tuple(values[mask] for values in measure) for key, measure in self.measures.items()},
+            grain(self.base_grain + PaymentCube.filter_grain(filters)),
+        )
+
+    def measure(self, dims=()):
+        return self.measures[grain(self.base_grain + tuple(dims))]
+
+    # ----------------- Slices -----------------
+    def totals(self):
+        applications, state_share, centre_share = self.measure()
+        return int(applications.sum()), float(state_share.sum()), float(centre_share.sum())
+
+    def slice(self, dims):
+        """Applications, state/centre share and payment by ``dims`` over the
+        occupied cells, one row per label combination (missing labels left
+        out, as groupby does)."""
+        cell_applications, cell_state_share, cell_centre_share = self.measure(dims)
+        present = np.logical_and.reduce([self.codes[dim] > 0 for dim in dims])
+        radixes = [len(self.labels[dim]) + 1 for dim in dims]
+        key = pack([self.codes[dim][present] for dim in dims], radixes)
+
+        size = int(np.prod(radixes))
+        if size <= DENSE_SLICE_LIMIT:
+            groups, slots = np.arange(size), key
+        else:
+            groups, slots = np.unique(key, return_inverse=True)
+        applications = np.bincount(slots, weights=cell_applications[present], minlength=len(groups))
+        occupied = applications > 0
+
+        out = {
+            dim: self.labels[dim].take(codes - 1)
+            for dim, codes in zip(dims, unpack(groups[occupied], radixes))
+        }
+        out['applications'] = applications[occupied].astype(np.int64)
+        out['state_share'] = np.bincount(slots, weights=cell_state_share[present], minlength=len(groups))[occupied]
+        out['centre_share'] = np.bincount(slots, weights=cell_centre_share[present], minlength=len(groups))[occupied]
+        out['payment'] = out['state_share'] + out['centre_share']
+        return pd.DataFrame(out)
+
+    def result(self, name: str):
+        metric = METRICS[name]
+        if metric.measure == 'funding':
+            _, state_share, centre_share = self.totals()
+            return state_share, centre_share
+        if metric.measure == 'summary':
+            applications, state_share, centre_share = self.totals()
+            return applications, state_share + centre_share
+
+        sliced = self.slice([metric.dimension])
+        values = sliced['applications' if metric.measure == 'count' else 'payment']
+        return rank_pairs(zip(sliced[metric.dimension], values), metric.limit)
+
+
+def parse_slice(args):
+    """Slice fields from ?by=category&by=gender (or ?by=category,gender)."""
+    fields = [part.strip() for value in args.getlist('by') for part in value.split(',') if part.strip()]
+    if not fields:
+        raise FilterError(f"Missing 'by' (one or more of {', '.join(SLICE_FIELDS)})")
+    unknown = [field for field in fields if field not in SLICE_FIELDS]
+    if unknown:
+        raise FilterError(f"Unknown slice dimensions: {', '.join(unknown)}")
+    return list(dict.fromkeys(fields))
+
+
+def parse_limit(args):
+    """Row cap from ?limit=N; none when absent or 0."""
+    value = args.get('limit', '').strip()
+    if not value:
+        return None
+    if not value.isdigit():
+        raise FilterError(f"Invalid limit: {value} (expected a non-negative integer)")
+    return int(value) or None
+
+
+def slice_payload(cube, fields, limit: int = None):
+    sliced = cube.slice([SLICE_FIELDS[field] for field in fields])
+    sliced = sliced.sort_values('payment', ascending=False, kind='stable')
+    if limit:
+        sliced = sliced.head(limit)
+    return [
+        {
+            **{field: row[SLICE_FIELDS[field]] for field in fields},
+            "applications": int(row['applications']),
+            "state_share": int(row['state_share']),
+            "centre_share": int(row['centre_share']),
+            "payment": int(row['payment']),
+        }
+        for row in sliced.to_dict('records')
+    ]
+
+
+# ----------------- Cubed Frame -----------------
+class CubedFrame(IndexedFrame):
+    """The cached applicant frame with its payment cube, built on first use.
+    Filters the cube cells can answer select cells; any other filter builds
+    a cube over the selected rows."""
+
+    def __init__(self, frame):
+        super().__init__(frame)
+        self._cube = None
+        self.distinct = DistinctFrames(frame)
+
+    @property
+    def cube(self):
+        if self._cube is None:
+            self._cube = PaymentCube.from_frame(self.frame, self.distinct)
+        return self._cube
+
+    def distinct_for(self, filters=None):
+        return self.distinct.take(self.selection(filters)) if filters else self.distinct
+
+    def cube_for(self, filters=None):
+        if not filters:
+            return self.cube
+        if PaymentCube.covers(filters):
+            return self.cube.where(filters)
+        distinct = self.distinct_for(filters)
+        return PaymentCube.from_frame(distinct.frame, distinct)
+
+    def results(self, names, filters=None):
+        cube = self.cube_for(filters) if any(METRICS[name].measure in CUBE_MEASURES for name in names) else None
+        rows = [name for name in names if METRICS[name].measure not in CUBE_MEASURES]
+        distinct = self.distinct_for(filters) if rows else None
+        return {
+            name: cube.result(name) if METRICS[name].measure in CUBE_MEASURES
+            else rows_result(distinct.get(grain_columns(name)), name)
+            for name in names
+        }
@@ -0,0 +1,265 @@
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from dataset_engine import APPLICANT_COLUMNS, APPLICANT_JOINS, APPLICANT_TABLE, applicant_query, build_frame
+from distinct import DistinctFrames
+from distribution import FINE_BINS_PER_BIN, binned_kde
+from filters import IndexedFrame
+from instrumentation import timed
+from master_data import current_masters
+from metrics import HISTOGRAM_BINS, KDE_POINTS, METRICS, build_payload, empty_income_payload, grain_columns
+from sql_metrics import HAS_PAYMENT
+
+logger = logging.getLogger(__name__)
+
+# ----------------- Stratified Preview -----------------
+# A small stratified sample of applications by (state, scheme), drawn in
+# the database: one query counts every stratum's applications and picks
+# ``per_stratum`` of them at random (a window over the applications, so
+# only the picks leave the server), then the picked applications' rows
+# are fetched by id. A metric is then a stratified estimate, each sampled
+# application weighted N_h / n_h, with a 95% confidence interval from the
+# within-stratum variance. Strata kept whole contribute no error; when all
+# of them are, the preview is exact. An application's stratum is its home
+# state and the lowest scheme_id it applied to.
+PREVIEW_PER_STRATUM = 50
+# Picked applications fetched per query (well under SQLite's bound
+# parameter limit).
+ID_BATCH = 500
+STRATA = ['state_name', 'scheme_name']
+Z_95 = stats.norm.ppf(0.975)
+
+
+class PreviewSample(IndexedFrame):
+    def __init__(self, frame, strata, heads, per_stratum: int = PREVIEW_PER_STRATUM):
+        super().__init__(frame)
+        self.per_stratum = per_stratum
+        # population (N_h) and sampled (n_h) applications per stratum
+        self.strata = strata
+        # Stratum of each row, through its application's head row.
+        keys = pd.MultiIndex.from_frame(heads[STRATA].astype(object))
+        stratum = pd.Series(pd.MultiIndex.from_frame(strata[STRATA].astype(object)).get_indexer(keys),
+                            index=heads['application_id'].to_numpy())
+        self.codes = stratum.reindex(frame['application_id'].to_numpy()).to_numpy()
+        self.distinct = DistinctFrames(frame)
+
+    @property
+    def exact(self):
+        return bool((self.strata['sampled'] == self.strata['population']).all())
+
+    def info(self):
+        return {
+            "exact": self.exact,
+            "strata": len(self.strata),
+            "per_stratum": self.per_stratum,
+            "sampled_applications": int(self.strata['sampled'].sum()),
+            "population_applications": int(self.strata['population'].sum()),
+        }
+
+    # ----------------- Estimates -----------------
+    def totals(self, rows, values, labels=None):
+        """Stratified estimates of the totals of ``values`` over ``rows``
+        (sample rows, one per application and label), per label: a frame of
+        estimate and 95% half-width indexed by label."""
+        codes = self.codes[rows.index.to_numpy()]
+        if labels is None:
+            label_codes, uniques = np.zeros(len(rows), dtype=np.int64), pd.Index([0])
+        else:
+            label_codes, uniques = pd.factorize(labels)
+        # Sums of y and y^2 per (label, stratum) cell.
+        strata = len(self.strata)
+        cells, slots = np.unique(label_codes * strata + codes, return_inverse=True)
+        y = np.bincount(slots, weights=values, minlength=len(cells))
+        y2 = np.bincount(slots, weights=np.square(values), minlength=len(cells))
+        label, stratum = np.divmod(cells, strata)
+
+        population = self.strata['population'].to_numpy(dtype=float)[stratum]
+        sampled = self.strata['sampled'].to_numpy(dtype=float)[stratum]
+        # Applications outside ``rows`` contribute y = 0 to their stratum.
+        spread = (y2 - np.square(y) / sampled) / np.maximum(sampled - 1, 1)
+        estimate = np.bincount(label, weights=population / sampled * y, minlength=len(uniques))
+        variance = np.bincount(label, weights=np.square(population) * (1 - sampled / population)
+                               * np.maximum(spread, 0) / sampled, minlength=len(uniques))
+        return pd.DataFrame({'estimate': estimate, 'error': Z_95 * np.sqrt(variance)}, index=pd.Index(uniques))
+
+    def estimate(self, name: str, distinct):
+        """(result as frame_result returns it, {key: (low, high)} intervals)."""
+        metric = METRICS[name]
+        if metric.measure in ('funding', 'summary'):
+            rows = distinct.get()
+            if metric.measure == 'funding':
+                columns = {'state_share': rows['pay_amt_state_shr'], 'centre_share': rows['pay_amt_centre_shr']}
+            else:
+                columns = {'total_applications': np.ones(len(rows)), 'total_funding': rows['payment_amt_share']}
+            estimates = {key: self.totals(rows, np.nan_to_num(np.asarray(values, dtype=float)))
+                         for key, values in columns.items()}
+            result = tuple(float(frame['estimate'].sum()) for frame in estimates.values())
+            return result, {key: interval(frame) for key, frame in estimates.items()}
+
+        rows = distinct.get(grain_columns(name))
+        rows = rows[rows[metric.dimension].notna()]
+        if metric.measure == 'institutions':
+            # Distinct counts do not scale with the weights: the institutions
+            # seen in the sample are a lower bound.
+            seen = rows.groupby(metric.dimension, observed=True)['c_institution_id'].nunique()
+            seen = seen[seen > 0].sort_values(ascending=False).head(metric.limit)
+            return [(k, float(v)) for k, v in seen.items()], {k: (float(v), None) for k, v in seen.items()}
+
+        values = np.ones(len(rows)) if metric.measure == 'count' else rows['payment_amt_share'].to_numpy(dtype=float)
+        estimates = self.totals(rows, values, rows[metric.dimension].to_numpy()).sort_values('estimate', ascending=False)
+        if metric.limit:
+            estimates = estimates.head(metric.limit)
+        result = [(k, float(v)) for k, v in estimates['estimate'].items()]
+        return result, {k: (max(v - e, 0.0), v + e) for k, (v, e) in estimates[['estimate', 'error']].iterrows()}
+
+    def weights(self, rows):
+        codes = self.codes[rows.index.to_numpy()]
+        return (self.strata['population'] / self.strata['sampled']).to_numpy(dtype=float)[codes]
+
+    def income_payload(self, distinct):
+        rows = distinct.get()
+        rows = rows[rows['annual_family_income'].notna()]
+        return weighted_income_payload(rows['annual_family_income'].to_numpy(dtype=float), self.weights(rows),
+                                       self.totals(rows, np.ones(len(rows))))
+
+    def payloads(self, names, filters=None):
+        """{name: payload with confidence intervals} for ``names``."""
+        distinct = self.distinct.take(self.selection(filters)) if filters else self.distinct
+        return {
+            name: self.income_payload(distinct) if METRICS[name].measure == 'income'
+            else preview_payload(name, *self.estimate(name, distinct))
+            for name in names
+        }
+
+
+def interval(estimates):
+    value, error = float(estimates['estimate'].sum()), float(np.sqrt(np.square(estimates['error']).sum()))
+    return max(value - error, 0.0), value + error
+
+
+def rounded(bounds):
+    return [int(bound) if bound is not None else None for bound in bounds]
+
+
+def preview_payload(name: str, result, intervals):
+    # The widget's usual payload, plus a "<key>_ci" [low, high] per value.
+    metric = METRICS[name]
+    payload = build_payload(name, result)
+    if metric.measure == 'funding':
+        low = sum(bounds[0] for bounds in intervals.values())
+        high = sum(bounds[1] for bounds in intervals.values())
+        intervals = dict(intervals, total=(low, high))
+    if isinstance(payload, dict):
+        payload.update({f"{key}_ci": rounded(bounds) for key, bounds in intervals.items()})
+        return payload
+    for row in payload:
+        row[f"{metric.value_key}_ci"] = rounded(intervals[row[metric.label]])
+    return payload
+
+
+def weighted_income_payload(incomes, weights, count):
+    if not len(incomes):
+        return empty_income_payload()
+    order = np.argsort(incomes, kind='stable')
+    incomes, weights = incomes[order], weights[order]
+    cumulative = np.cumsum(weights) / weights.sum()
+
+    def percentile(q):
+        return int(incomes[min(np.searchsorted(cumulative, q), len(incomes) - 1)])
+
+    mean = float(np.average(incomes, weights=weights))
+    counts, bins = np.histogram(incomes, bins=HISTOGRAM_BINS, weights=weights)
+    xs = np.linspace(incomes.min(), incomes.max(), KDE_POINTS)
+    if np.ptp(incomes) > 0 and len(incomes) > 1:
+        # Binned like IncomeDistribution's KDE, with Scott's rule over the
+        # effective sample size of the weights.
+        fine, edges = np.histogram(incomes, bins=HISTOGRAM_BINS * FINE_BINS_PER_BIN, weights=weights)
+        effective = weights.sum() ** 2 / np.square(weights).sum()
+        spread = np.sqrt(np.cov(incomes, aweights=weights))
+        ys = binned_kde(edges, fine, max(spread * effective ** (-1 / 5), edges[1] - edges[0]), xs)
+    else:
+        ys = np.zeros(KDE_POINTS)
+    return {
+        "stats": {
+            "mean": int(mean),
+            "median": percentile(0.5),
+            "p25": percentile(0.25),
+            "p75": percentile(0.75),
+            "p90": percentile(0.9),
+        },
+        "stats_ci": {"count": rounded(interval(count))},
+        "histogram": {"bins": bins.tolist(), "counts": np.rint(counts).astype(int).tolist()},
+        "kde": {"x": xs.tolist(), "y": ys.tolist()},
+    }
+
+
+# ----------------- Sampling -----------------
+# One row per paid application: its home state and lowest scheme. The master
+# tables are joined only to leave out the rows resolving would drop for
+# want of a master row, so strata count the same applications the rows do.
+STRATUM_HEADS = f"""SELECT r.application_id, d.state_id, min(sch.scheme_id) AS scheme_id
+    {APPLICANT_TABLE}{APPLICANT_JOINS}    join mst_districts d on d.district_id = r.permanent_district_id
+    join mst_states st on st.state_id = d.state_id
+    join mst_category c on c.category_id = r.category_id
+    join mst_marital_status m on m.marital_id = r.marital_status
+    join mst_institution inst on inst.institution_id = q.c_institution_id
+    join mst_districts inst_d on inst_d.district_id = inst.district_id
+    join mst_schemes s on s.scheme_id = sch.scheme_id
+    WHERE {HAS_PAYMENT}
+    GROUP BY r.application_id, d.state_id"""
+
+
+def sample_query(per_stratum: int):
+    # Picks carry their stratum and its population, so one pass over the
+    # applications gives both N_h and the sample.
+    return f"""
+    SELECT application_id, state_id, scheme_id, population FROM (
+        SELECT application_id, state_id, scheme_id,
+            count(*) OVER (PARTITION BY state_id, scheme_id) AS population,
+            row_number() OVER (PARTITION BY state_id, scheme_id ORDER BY random()) AS pick
+        FROM ({STRATUM_HEADS}) heads
+    ) picks
+    WHERE pick <= {int(per_stratum)}
+"""
+
+
+def draw_preview(conn, per_stratum: int = PREVIEW_PER_STRATUM, batch_size: int = ID_BATCH, masters=None):
+    data = current_masters(conn, masters)
+    results = []
+    cur = conn.cursor()
+    try:
+        with timed('query'):
+            cur.execute(sample_query(per_stratum))
+        with timed('fetch'):
+            picks = pd.DataFrame(cur.fetchall(), columns=['application_id', 'state_id', 'scheme_id', 'population'])
+        ids = picks['application_id'].tolist()
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            where = f"r.application_id IN ({', '.join(['%s'] * len(batch))}) AND {HAS_PAYMENT}"
+            with timed('query'):
+                cur.execute(applicant_query(APPLICANT_COLUMNS, where=where), batch)
+            with timed('fetch'):
+                results.extend(cur.fetchall())
+    finally:
+        cur.close()
+
+    with timed('frame'):
+        frame = build_frame(results, APPLICANT_COLUMNS, data)
+    # Strata are labelled like the rows.
+    states = data.tables['states'].frame
+    picks['state_name'] = picks['state_id'].map(dict(zip(states['state_id'], states['state_name'])))
+    picks['scheme_name'] = data.labels('scheme_name', picks['scheme_id'])
+    picks = picks.dropna(subset=STRATA)
+    population = picks.drop_duplicates(['state_id', 'scheme_id']).groupby(STRATA)['population'].sum()
+    heads = picks[picks['application_id'].isin(frame['application_id'])][['application_id'] + STRATA]
+    frame = frame[frame['application_id'].isin(heads['application_id'])].reset_index(drop=True)
+
+    strata = population.reset_index()
+    strata['population'] = strata['population'].astype(np.int64)
+    strata['sampled'] = heads.groupby(STRATA).size().reindex(population.index, fill_value=0).to_numpy()
+    logger.info(f"Drew a preview of {int(strata['sampled'].sum())} of {int(strata['population'].sum())} "
+                f"applications over {len(strata)} strata")
+    return PreviewSample(frame, strata, heads.reset_index(drop=True), per_stratum)
@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# ----------------- Pre-warmed Metrics -----------------
+# A background thread recomputes the full (unfiltered) metric set every
+# ``interval`` seconds, or sooner when the data fingerprint changes or a
+# refresh is triggered, and swaps the finished payloads in as one object.
+# Requests read whatever set is current, stale or not, so they never wait
+# on the database; a stale read only nudges the thread to refresh.
+Prewarmed = namedtuple('Prewarmed', ['payloads', 'version', 'refreshed_at', 'duration'])
+
+
+def timestamp(ts):
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(ts)) if ts else None
+
+
+class Prewarmer:
+    def __init__(self, compute, version=None, fingerprint=None, on_change=None,
+                 interval: float = 60, check_interval: float = 10):
+        self._compute = compute
+        self._version = version
+        self._fingerprint = fingerprint
+        self._on_change = on_change
+        self.interval = interval
+        self.check_interval = check_interval
+        self._state = None
+        self._last_fingerprint = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self.refreshing = False
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_attempt = None
+
+    @property
+    def enabled(self):
+        return self.interval > 0
+
+    def start(self):
+        if not self.enabled:
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='nsp-prewarm', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def trigger(self):
+        self._wake.set()
+
+    # ----------------- Reads -----------------
+    def get(self, names):
+        """Payloads for ``names`` from the current set, or None before the
+        first refresh has finished."""
+        state = self._state
+        if state is None:
+            return None
+        if time.time() - state.refreshed_at >= self.interval and not self.refreshing:
+            self.trigger()
+        return {name: state.payloads[name] for name in names}
+
+    def version(self):
+        state = self._state
+        return state.version if state is not None else None
+
+    # ----------------- Refresh -----------------
+    def refresh(self, fingerprint=None):
+        self.refreshing = True
+        self.last_attempt = time.time()
+        started = time.monotonic()
+        try:
+            # The version is read first: if the data changes while computing,
+            # the payloads are at least as new as the version they carry,
+            # never older, and are recomputed straight away.
+            version = self._version() if self._version else None
+            payloads = self._compute()
+            moved = self._version is not None and self._version() != version
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.error(f"Pre-warming metrics failed: {e}")
+            return None
+        finally:
+            self.refreshing = False
+
+        self._state = Prewarmed(payloads, version, time.time(), time.monotonic() - started)
+        self._last_fingerprint = fingerprint
+        self.refreshes += 1
+        self.last_error = None
+        logger.info(f"Pre-warmed {len(payloads)} metrics in {self._state.duration:.2f}s")
+        if moved:
+            logger.info("Data changed while pre-warming; refreshing again")
+            self.trigger()
+        return self._state
+
+    def _read_fingerprint(self):
+        if self._fingerprint is None:
+            return None
+        try:
+            return self._fingerprint()
+        except Exception as e:
+            logger.warning(f"Could not read data fingerprint: {e}")
+            return None
+
+    def _run(self):
+        while not self._stop.is_set():
+            fingerprint = self._read_fingerprint()
+            state = self._state
+            changed = fingerprint is not None and fingerprint != self._last_fingerprint
+            due = state is None or self._wake.is_set() or time.time() - state.refreshed_at >= self.interval
+            if changed or due:
+                self._wake.clear()
+                if changed and state is not None and self._on_change:
+                    self._on_change()
+                self.refresh(fingerprint)
+            self._wake.wait(self.check_interval)
+
+    def health(self):
+        state = self._state
+        return {
+            "enabled": self.enabled,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "refreshing": self.refreshing,
+            "last_refresh": timestamp(state.refreshed_at) if state else None,
+            "last_refresh_seconds": round(state.duration, 3) if state else None,
+            "age_seconds": round(time.time() - state.refreshed_at, 1) if state else None,
+            "stale": state is None or time.time() - state.refreshed_at >= self.interval,
+            "version": state.version if state else None,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_attempt": timestamp(self.last_attempt),
+            "last_error": self.last_error,
+        }
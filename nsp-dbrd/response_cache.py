@@ -0,0 +1,99 @@
+import hashlib
+import logging
+import threading
+import time
+
+from flask import Response, make_response, request
+
+from serialization import VARY, representation
+
+logger = logging.getLogger(__name__)
+
+# ----------------- Data Version -----------------
+# A cheap fingerprint of the fact tables: the newest registration/payment
+# change and the newest application id. Index-only lookups on PostgreSQL,
+# and cached for a few seconds so polling clients do not each run them.
+VERSION_QUERY = """
+    SELECT (SELECT MAX(updated_on) FROM data_applicant_registration_details),
+           (SELECT MAX(updated_on) FROM data_applicant_payments_calculation),
+           (SELECT MAX(application_id) FROM data_applicant_registration_details)
+"""
+
+
+class DataVersion:
+    def __init__(self, connect, db_key: str = 'nsp_fresh', ttl: float = 10):
+        self._connect = connect
+        self.db_key = db_key
+        self.ttl = ttl
+        self._version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Current version string, or None when the database is unreachable."""
+        with self._lock:
+            if self._checked_at is not None and time.monotonic() - self._checked_at < self.ttl:
+                return self._version
+            conn = self._connect(self.db_key)
+            if not conn:
+                return None
+            try:
+                cur = conn.cursor()
+                cur.execute(VERSION_QUERY)
+                self._version = "|".join(str(value) for value in cur.fetchone())
+                self._checked_at = time.monotonic()
+            except Exception as e:
+                logger.warning(f"Could not read {self.db_key} data version: {e}")
+                return None
+            finally:
+                conn.close()
+            return self._version
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = None
+
+
+# ----------------- Conditional Responses -----------------
+def make_etag(version):
+    # Covers the full request URL and the negotiated representation, so
+    # every widget/filter combination and format revalidates independently.
+    return hashlib.sha1(f"{version}|{request.full_path}|{representation(request.headers)}".encode()).hexdigest()
+
+
+def set_cache_headers(response, etag: str, max_age: int, stale_while_revalidate: int):
+    response.set_etag(etag)
+    response.vary.update(VARY)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    # Written into the header itself: Werkzeug before 3.1 has no
+    # stale_while_revalidate property and would drop the directive.
+    if stale_while_revalidate:
+        response.headers['Cache-Control'] += f", stale-while-revalidate={stale_while_revalidate}"
+    return response
+
+
+def conditional_response(version, build, max_age: int = 60, stale_while_revalidate: int = 300):
+    """Answers 304 when the client's If-None-Match still matches the data
+    ``version()``; otherwise calls ``build()`` and tags the result.
+
+    ``version()`` may return None before ``build()`` (e.g. an expired cache
+    that ``build()`` reloads); it is asked again afterwards. Error responses
+    are never tagged or cached.
+    """
+    current = version()
+    if current is not None:
+        etag = make_etag(current)
+        if request.if_none_match.contains(etag):
+            return set_cache_headers(Response(status=304), etag, max_age, stale_while_revalidate)
+
+    response = make_response(build())
+    if response.status_code != 200:
+        response.cache_control.no_store = True
+        return response
+
+    current = current if current is not None else version()
+    if current is None:
+        response.cache_control.no_cache = True
+        return response
+    return set_cache_headers(response, make_etag(current), max_age, stale_while_revalidate)
@@ -0,0 +1,288 @@
+import logging
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataset_engine import DatabaseUnavailable, applicant_query, fact_columns, prepare_frame
+from distinct import first_rows, grain, whole_applications
+from instrumentation import timed
+from master_data import current_masters
+from metrics import METRICS, rank_pairs
+
+logger = logging.getLogger(__name__)
+
+# ----------------- Rollup Store -----------------
+# Keeps payment rollups keyed by every dashboard dimension and refreshes them
+# from applications whose registration or payment changed after the last
+# watermark.
+# A compact per-application ledger (group id + shares) lets a changed
+# application's previous contribution be subtracted before the new rows are
+# added, so a refresh costs O(changed rows) and a read costs O(groups).
+# Groups keep one set of sums per grain (distinct.py), counting each
+# application once, once per institute district and once per scheme.
+#
+# Each refresh re-reads rows stamped from ``lag`` seconds before the
+# watermark on, so rows committed late with an older stamp, or sharing the
+# watermark's stamp, are not missed; the ledger makes re-folding an
+# application idempotent. Deleted rows, and changes that move no
+# registration or payment stamp, are not seen incrementally: the rollups
+# are rebuilt from scratch every ``rebuild_interval`` seconds instead.
+ROLLUP_DIMENSIONS = ['state_name', 'district_name', 'institute_district', 'category_name', 'gender', 'scheme_name']
+ROLLUP_COLUMNS = ['application_id'] + ROLLUP_DIMENSIONS + [
+    'pay_amt_state_shr', 'pay_amt_centre_shr', 'registration_updated_on', 'payment_updated_on'
+]
+ROLLUP_GRAINS = [(), ('institute_district',), ('scheme_name',)]
+# Each table's stamp is matched in its own query so both updated_on indexes
+# are used; an OR across the join would scan it whole.
+CHANGED_IDS = """SELECT application_id FROM data_applicant_registration_details WHERE updated_on >= %s
+        UNION
+        SELECT application_id FROM data_applicant_payments_calculation WHERE updated_on >= %s"""
+CHUNK_SIZE = 50000
+
+
+def grain_prefix(rollup_grain):
+    # Rollup/ledger column prefix, e.g. 'scheme_name_applications'.
+    return "".join(f"{col}_" for col in rollup_grain)
+
+
+def overlap_start(watermark, lag: float):
+    # Stamps come back as datetimes from PostgreSQL and as text from the
+    # SQLite benchmark; the bound is passed back in the same form.
+    start = pd.Timestamp(watermark) - pd.Timedelta(seconds=lag)
+    return start.strftime('%Y-%m-%d %H:%M:%S') if isinstance(watermark, str) else start.to_pydatetime()
+
+
+class RollupState:
+    # Groups, per-grain sums and the ledger behind one rollup. A refresh
+    # folds into a copy (or, for a rebuild, a new state) and the store swaps
+    # it in only once the refresh has finished.
+    def __init__(self):
+        self.groups = {}
+        self.keys = []
+        # {grain: [applications, state_share, centre_share]} per group
+        self.measures = {
+            rollup_grain: [np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)] for rollup_grain in ROLLUP_GRAINS
+        }
+        self.ledger = pd.DataFrame({
+            'group_id': pd.Series(dtype=np.int64),
+            'pay_amt_state_shr': pd.Series(dtype=float),
+            'pay_amt_centre_shr': pd.Series(dtype=float),
+            **{grain_prefix(rollup_grain) + 'first': pd.Series(dtype=bool) for rollup_grain in ROLLUP_GRAINS},
+        }, index=pd.Index([], name='application_id'))
+
+    def copy(self):
+        state = RollupState()
+        state.groups = dict(self.groups)
+        state.keys = list(self.keys)
+        state.measures = {rollup_grain: [values.copy() for values in measures]
+                          for rollup_grain, measures in self.measures.items()}
+        # The ledger is replaced, never modified in place.
+        state.ledger = self.ledger
+        return state
+
+    def group_ids(self, chunk):
+        keys = list(chunk[ROLLUP_DIMENSIONS].itertuples(index=False, name=None))
+        ids = np.empty(len(keys), dtype=np.int64)
+        for i, key in enumerate(keys):
+            group_id = self.groups.get(key)
+            if group_id is None:
+                group_id = self.groups[key] = len(self.keys)
+                self.keys.append(key)
+            ids[i] = group_id
+
+        for measures in self.measures.values():
+            grow = len(self.keys) - len(measures[0])
+            if grow > 0:
+                measures[:] = [np.concatenate([values, np.zeros(grow, dtype=values.dtype)]) for values in measures]
+        return ids
+
+    def apply(self, ledger, sign: int):
+        n = len(self.keys)
+        group_ids = ledger['group_id'].to_numpy()
+        state_share = ledger['pay_amt_state_shr'].fillna(0).to_numpy()
+        centre_share = ledger['pay_amt_centre_shr'].fillna(0).to_numpy()
+        for rollup_grain, measures in self.measures.items():
+            first = ledger[grain_prefix(rollup_grain) + 'first'].to_numpy(dtype=float)
+            measures[0] += sign * np.bincount(group_ids, weights=first, minlength=n).astype(np.int64)
+            measures[1] += sign * np.bincount(group_ids, weights=first * state_share, minlength=n)
+            measures[2] += sign * np.bincount(group_ids, weights=first * centre_share, minlength=n)
+
+    def fold(self, raw, masters):
+        # Adds a chunk's applications and returns their ledger rows; the
+        # caller retracts their previous rows and rebuilds the ledger once
+        # per refresh (merge), so a refresh stays linear in its rows.
+        chunk = prepare_frame(masters.resolve(raw, ROLLUP_COLUMNS))
+        if not len(chunk):
+            return None
+        new = pd.DataFrame({
+            'group_id': self.group_ids(chunk),
+            'pay_amt_state_shr': chunk['pay_amt_state_shr'].to_numpy(),
+            'pay_amt_centre_shr': chunk['pay_amt_centre_shr'].to_numpy(),
+            **{grain_prefix(rollup_grain) + 'first': first_rows(chunk, rollup_grain) for rollup_grain in ROLLUP_GRAINS},
+        }, index=pd.Index(chunk['application_id'], name='application_id'))
+        self.apply(new, 1)
+        return new
+
+    def merge(self, changed, parts):
+        # Subtracts the previous contribution of every changed application
+        # and appends the new ledger rows, in one pass over the ledger.
+        old = self.ledger.index.isin(changed)
+        if old.any():
+            self.apply(self.ledger[old], -1)
+        self.ledger = pd.concat([self.ledger[~old]] + [part for part in parts if part is not None])
+
+    def build_rollup(self):
+        rollup = pd.DataFrame(self.keys, columns=ROLLUP_DIMENSIONS)
+        occupied = np.zeros(len(rollup), dtype=bool)
+        for rollup_grain, (applications, state_share, centre_share) in self.measures.items():
+            prefix = grain_prefix(rollup_grain)
+            rollup[prefix + 'applications'] = applications
+            rollup[prefix + 'state_share'] = state_share
+            rollup[prefix + 'centre_share'] = centre_share
+            occupied |= applications > 0
+        return rollup[occupied].reset_index(drop=True)
+
+
+class RollupStore:
+    def __init__(self, connect, db_key: str = 'nsp_fresh', refresh_interval: float = 60, masters=None,
+                 lag: float = 300, rebuild_interval: float = 3600):
+        self._connect = connect
+        self._masters = masters
+        self.db_key = db_key
+        self.refresh_interval = refresh_interval
+        self.lag = lag
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._background = threading.Lock()
+        self._state = RollupState()
+        self.watermark = None
+        self.rebuilt_at = None
+        self.refreshed_at = None
+        self.rollup = None
+        self._reset = False
+
+    def reset(self):
+        # The next refresh rebuilds from scratch; until it finishes, reads
+        # keep the current rollups.
+        self._reset = True
+
+    def _stale(self):
+        return (self._reset or self.refreshed_at is None
+                or time.monotonic() - self.refreshed_at >= self.refresh_interval)
+
+    def _rebuild_due(self):
+        return (self._reset or self.watermark is None or self.rebuilt_at is None
+                or (self.rebuild_interval > 0 and time.monotonic() - self.rebuilt_at >= self.rebuild_interval))
+
+    # ----------------- Refresh -----------------
+    def refresh(self, only_if_stale: bool = False):
+        with self._lock:
+            if only_if_stale and not self._stale():
+                return
+
+            conn = self._connect(self.db_key)
+            if not conn:
+                raise DatabaseUnavailable(self.db_key)
+
+            started = time.monotonic()
+            full = self._rebuild_due()
+            self._reset = False
+            if full:
+                state, ids, params = RollupState(), None, None
+            else:
+                since = overlap_start(self.watermark, self.lag)
+                state, ids, params = self._state.copy(), CHANGED_IDS, (since, since)
+            rows = 0
+            newest = None if full else self.watermark
+            changed, parts = [], []
+
+            def raw_chunks():
+                nonlocal rows
+                while True:
+                    with timed('fetch'):
+                        results = cur.fetchmany(CHUNK_SIZE)
+                    if not results:
+                        break
+                    rows += len(results)
+                    yield pd.DataFrame(results, columns=fact_columns(ROLLUP_COLUMNS))
+
+            cur = conn.cursor(name='nsp_rollup_refresh')
+            cur.itersize = CHUNK_SIZE
+            try:
+                masters = current_masters(conn, self._masters)
+                with timed('query'):
+                    cur.execute(applicant_query(ROLLUP_COLUMNS, ids=ids, order_by="r.application_id"), params)
+                for raw in whole_applications(raw_chunks()):
+                    with timed('aggregate'):
+                        changed.append(raw['application_id'].unique())
+                        parts.append(state.fold(raw, masters))
+                    stamps = pd.concat([raw['registration_updated_on'], raw['payment_updated_on']]).dropna()
+                    if len(stamps) and (newest is None or stamps.max() > newest):
+                        newest = stamps.max()
+            except Exception:
+                # The current rollups stay; a failed rebuild is retried next time.
+                self._reset = self._reset or full
+                raise
+            finally:
+                cur.close()
+                conn.close()
+
+            with timed('aggregate'):
+                state.merge(np.concatenate(changed) if changed else [], parts)
+                rollup = state.build_rollup()
+
+            # Only a finished refresh moves the watermark (chunks come in
+            # application order, not stamp order) and replaces the rollups
+            # readers see.
+            self._state = state
+            self.rollup = rollup
+            self.watermark = newest
+            self.refreshed_at = time.monotonic()
+            if full:
+                self.rebuilt_at = self.refreshed_at
+            logger.info(f"{'Rebuilt' if full else 'Refreshed'} {self.db_key} rollups from {rows} rows "
+                        f"({len(rollup)} groups) in {self.refreshed_at - started:.2f}s")
+
+    def _refresh_in_background(self):
+        if not self._background.acquire(blocking=False):
+            return  # a refresh is already on its way
+
+        def run():
+            try:
+                self.refresh(only_if_stale=True)
+            except Exception as e:
+                logger.error(f"Refreshing {self.db_key} rollups failed, serving the previous ones: {e}")
+            finally:
+                self._background.release()
+
+        threading.Thread(target=run, name=f'nsp-rollups-{self.db_key}', daemon=True).start()
+
+    def get(self):
+        # Only the first build blocks; after that a stale read returns the
+        # current rollups and refreshes them in the background.
+        if self.rollup is None:
+            self.refresh(only_if_stale=True)
+        elif self._stale():
+            self._refresh_in_background()
+        return self.rollup
+
+    # ----------------- Reads -----------------
+    def result(self, name: str):
+        metric = METRICS[name]
+        rollup = self.get()
+
+        if metric.measure == 'funding':
+            return float(rollup['state_share'].sum()), float(rollup['centre_share'].sum())
+        if metric.measure == 'summary':
+            return int(rollup['applications'].sum()), float((rollup['state_share'] + rollup['centre_share']).sum())
+        if metric.measure in ('income', 'institutions'):
+            raise KeyError(f"{name} is not served from rollups")
+
+        prefix = grain_prefix(grain([metric.dimension]))
+        if metric.measure == 'count':
+            grouped = rollup.groupby(metric.dimension)[prefix + 'applications'].sum()
+        else:
+            grouped = (rollup[prefix + 'state_share'] + rollup[prefix + 'centre_share']).groupby(rollup[metric.dimension]).sum()
+        return rank_pairs(grouped.items(), metric.limit)
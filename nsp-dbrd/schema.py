@@ -0,0 +1,14 @@
+# ----------------- Applicant Frame Schema -----------------
+# Master-table label columns already arrive as Categoricals from
+# master_data.MasterData.resolve (integer codes against the mst_* labels),
+# so groupby/value_counts work on codes and labels are only materialised
+# when results are serialised. The remaining low-cardinality flags have no
+# master table; their categories come from the data.
+FLAG_COLUMNS = ['gender', 'fresh_renewal']
+
+
+def apply_schema(df):
+    for column in FLAG_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df
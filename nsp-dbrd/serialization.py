@@ -0,0 +1,131 @@
+import gzip
+import json
+import zlib
+
+from flask import Response
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+try:
+    import orjson
+except ImportError:  # the standard library encoder is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # MessagePack is offered only when installed
+    msgpack = None
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow IPC is offered only when pyarrow is installed
+    pa = None
+
+# ----------------- Response Serialisation -----------------
+# Metric payloads are encoded in the representation the client asks for:
+# compact JSON by default (orjson when installed), MessagePack or an Arrow
+# IPC stream by Accept, then compressed with brotli or gzip by
+# Accept-Encoding once the body is worth compressing. Responses vary on
+# both headers, and their ETags cover the negotiated representation.
+#
+#   curl -H 'Accept: application/vnd.apache.arrow.stream' -H 'Accept-Encoding: br' /api/dashboard
+JSON_TYPE = 'application/json'
+MSGPACK_TYPE = 'application/msgpack'
+ARROW_TYPE = 'application/vnd.apache.arrow.stream'
+# Smaller bodies fit in one packet anyway.
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+# A fast brotli level: on the hot path CPU time matters more than the
+# last few bytes.
+BROTLI_QUALITY = 4
+VARY = ('Accept', 'Accept-Encoding')
+
+
+def encode_json(payload):
+    # Sorted keys, as jsonify writes them.
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()
+
+
+def encode_msgpack(payload):
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def encode_arrow(payload):
+    # A list of records becomes one row per record; any other payload
+    # (summary, income distribution, dashboard) a single row. Built column
+    # by column: Table.from_pylist needs pyarrow >= 7.
+    records = payload if isinstance(payload, list) else [payload]
+    columns = list(dict.fromkeys(key for record in records for key in record))
+    table = pa.Table.from_pydict({column: [record.get(column) for record in records] for column in columns})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# In order of preference when the client accepts several equally.
+ENCODERS = {JSON_TYPE: encode_json}
+if msgpack is not None:
+    ENCODERS[MSGPACK_TYPE] = encode_msgpack
+if pa is not None:
+    ENCODERS[ARROW_TYPE] = encode_arrow
+
+COMPRESSORS = {'gzip': lambda body: gzip.compress(body, GZIP_LEVEL)}
+if brotli is not None:
+    COMPRESSORS = {'br': lambda body: brotli.compress(body, quality=BROTLI_QUALITY), **COMPRESSORS}
+
+
+# ----------------- Negotiation -----------------
+def negotiate(accept: str = None, accept_encoding: str = None):
+    """(media type, content coding or None) for the request headers. JSON
+    whenever the client accepts nothing else we can write."""
+    mimetype = parse_accept_header(accept, MIMEAccept).best_match(list(ENCODERS), default=JSON_TYPE)
+    return mimetype, parse_accept_header(accept_encoding).best_match(list(COMPRESSORS))
+
+
+def representation(headers):
+    return "|".join(str(part) for part in negotiate(headers.get('Accept'), headers.get('Accept-Encoding')))
+
+
+def encode_payload(payload, mimetype: str = JSON_TYPE, encoding: str = None):
+    """(body, content coding actually applied)."""
+    body = ENCODERS[mimetype](payload)
+    if encoding is None or len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    return COMPRESSORS[encoding](body), encoding
+
+
+def payload_response(payload, headers, status: int = 200):
+    """Flask response for ``payload`` negotiated from the request ``headers``."""
+    mimetype, encoding = negotiate(headers.get('Accept'), headers.get('Accept-Encoding'))
+    body, encoding = encode_payload(payload, mimetype, encoding)
+    response = Response(body, status=status, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.update(VARY)
+    return response
+
+
+# ----------------- Streams -----------------
+def compress_stream(chunks, encoding: str):
+    """Compresses an iterable of str/bytes chunks as it is consumed, for
+    streamed responses."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, finish = compressor.process, compressor.finish
+    else:
+        # wbits=31: a gzip header and trailer around the deflate stream.
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = process(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield finish()
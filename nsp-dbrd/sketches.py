@@ -0,0 +1,216 @@
+import base64
+
+import numpy as np
+import pandas as pd
+
+# ----------------- Mergeable Sketches -----------------
+# Fixed-size summaries for the ranking and cardinality widgets, built chunk
+# by chunk. Like the distributions in distribution.py they merge across
+# cursor chunks, workers and databases, and serialise to plain dicts.
+# SpaceSaving keeps the heaviest labels of a weighted stream in
+# ``capacity`` counters: exact while the stream has no more labels than
+# that, otherwise every count is over-estimated by at most its error.
+# HyperLogLog counts distinct values in 2 ** ``precision`` registers with
+# about 1.04 / sqrt(2 ** precision) relative error (1.6% at 12).
+TOPK_CAPACITY = 1024
+HLL_PRECISION = 12
+
+
+class SpaceSaving:
+    def __init__(self, capacity: int = TOPK_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.total = 0.0
+
+    def __len__(self):
+        return len(self.counts)
+
+    @property
+    def full(self):
+        return len(self.counts) >= self.capacity
+
+    def minimum(self):
+        return min(self.counts.values()) if self.full else 0.0
+
+    def update(self, weights: dict):
+        """Adds {label: weight}, as Counter.update does; heaviest labels first
+        so that they claim the free counters."""
+        for label, weight in sorted(weights.items(), key=lambda kv: kv[1], reverse=True):
+            self.total += weight
+            if label in self.counts:
+                self.counts[label] += weight
+                continue
+            if self.full:
+                # The smallest counter is handed over; its count becomes the
+                # newcomer's error.
+                evicted = min(self.counts, key=self.counts.get)
+                floor = self.counts.pop(evicted)
+                del self.errors[evicted]
+            else:
+                floor = 0.0
+            self.counts[label] = floor + weight
+            self.errors[label] = floor
+        return self
+
+    def merge(self, other):
+        # A label missing from a full summary may have been counted up to
+        # that summary's minimum there.
+        floor, other_floor = self.minimum(), other.minimum()
+        counts, errors = {}, {}
+        for label in self.counts.keys() | other.counts.keys():
+            counts[label] = self.counts.get(label, floor) + other.counts.get(label, other_floor)
+            errors[label] = self.errors.get(label, floor) + other.errors.get(label, other_floor)
+        self.capacity = max(self.capacity, other.capacity)
+        kept = sorted(counts, key=counts.get, reverse=True)[:self.capacity]
+        self.counts = {label: counts[label] for label in kept}
+        self.errors = {label: errors[label] for label in kept}
+        self.total += other.total
+        return self
+
+    def most_common(self, n: int = None):
+        ranked = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)
+        return ranked[:n] if n else ranked
+
+    def to_dict(self):
+        return {"capacity": self.capacity, "total": self.total,
+                "counters": [[label, self.counts[label], self.errors[label]] for label in self.counts]}
+
+    @classmethod
+    def from_dict(cls, state: dict):
+        sketch = cls(state["capacity"])
+        sketch.total = state["total"]
+        for label, count, error in state["counters"]:
+            sketch.counts[label] = count
+            sketch.errors[label] = error
+        return sketch
+
+
+# ----------------- Distinct Counts -----------------
+def hash_values(values):
+    # pandas' hash is seeded identically in every process, so registers
+    # built on different workers or databases agree.
+    values = pd.Series(values).dropna().to_numpy()
+    return pd.util.hash_array(values) if len(values) else np.zeros(0, dtype=np.uint64)
+
+
+def bit_length(values):
+    values = values.copy()
+    lengths = np.zeros(len(values), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        wide = values >= np.uint64(1 << shift)
+        lengths[wide] += shift
+        values[wide] >>= np.uint64(shift)
+    return lengths + (values > 0)
+
+
+def register_updates(hashes, precision: int):
+    """(register index, rank) per hash: the top ``precision`` bits pick the
+    register, the rank is one more than the leading zeros of the rest."""
+    index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    rest = hashes << np.uint64(precision)
+    rank = np.minimum(64 - bit_length(rest) + 1, 64 - precision + 1)
+    return index, rank.astype(np.uint8)
+
+
+def estimate(registers):
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)), axis=-1)
+    zeros = np.count_nonzero(registers == 0, axis=-1)
+    # Linear counting is the better estimate for small cardinalities.
+    small = (raw <= 2.5 * m) & (zeros > 0)
+    return np.where(small, m * np.log(m / np.maximum(zeros, 1)), raw)
+
+
+def encode_registers(registers):
+    return base64.b64encode(registers.tobytes()).decode('ascii')
+
+
+def decode_registers(state: str):
+    return np.frombuffer(base64.b64decode(state), dtype=np.uint8).copy()
+
+
+class HyperLogLog:
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, values):
+        index, rank = register_updates(hash_values(values), self.precision)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge sketches with different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        return float(estimate(self.registers))
+
+    def to_dict(self):
+        return {"precision": self.precision, "registers": encode_registers(self.registers)}
+
+    @classmethod
+    def from_dict(cls, state: dict):
+        sketch = cls(state["precision"])
+        sketch.registers = decode_registers(state["registers"])
+        return sketch
+
+
+class GroupedHyperLogLog:
+    """One HyperLogLog per label, e.g. distinct institutions per district."""
+
+    def __init__(self, precision: int = HLL_PRECISION):
+        self.precision = precision
+        self.sketches = {}
+
+    def __len__(self):
+        return len(self.sketches)
+
+    def add(self, labels, values):
+        pairs = pd.DataFrame({'label': np.asarray(labels), 'value': np.asarray(values)}).dropna()
+        if not len(pairs):
+            return self
+        codes, uniques = pd.factorize(pairs['label'])
+        index, rank = register_updates(hash_values(pairs['value']), self.precision)
+        registers = np.zeros((len(uniques), 1 << self.precision), dtype=np.uint8)
+        np.maximum.at(registers, (codes, index), rank)
+        for label, label_registers in zip(uniques, registers):
+            sketch = self.sketches.get(label)
+            if sketch is None:
+                sketch = self.sketches[label] = HyperLogLog(self.precision)
+            np.maximum(sketch.registers, label_registers, out=sketch.registers)
+        return self
+
+    def merge(self, other):
+        for label, sketch in other.sketches.items():
+            if label in self.sketches:
+                self.sketches[label].merge(sketch)
+            else:
+                self.sketches[label] = HyperLogLog.from_dict(sketch.to_dict())
+        return self
+
+    def counts(self):
+        if not self.sketches:
+            return []
+        estimates = estimate(np.stack([sketch.registers for sketch in self.sketches.values()]))
+        return [(label, float(round(count))) for label, count in zip(self.sketches, estimates)]
+
+    def most_common(self, n: int = None):
+        ranked = sorted(self.counts(), key=lambda kv: kv[1], reverse=True)
+        return ranked[:n] if n else ranked
+
+    def to_dict(self):
+        return {"precision": self.precision,
+                "registers": {label: encode_registers(sketch.registers) for label, sketch in self.sketches.items()}}
+
+    @classmethod
+    def from_dict(cls, state: dict):
+        grouped = cls(state["precision"])
+        for label, registers in state["registers"].items():
+            sketch = grouped.sketches[label] = HyperLogLog(grouped.precision)
+            sketch.registers = decode_registers(registers)
+        return grouped
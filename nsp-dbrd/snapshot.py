@@ -0,0 +1,146 @@
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+from dataset_engine import APPLICANT_COLUMNS, NUMERIC_COLS, applicant_query, prepare_frame, resolve_rows
+from master_data import current_masters
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # snapshots are optional; the database paths work without pyarrow
+    pa = pq = None
+
+logger = logging.getLogger(__name__)
+
+# ----------------- Snapshot Schema -----------------
+# Columnar copy of the joined applicant dataset. Repeated labels are
+# dictionary-encoded by Parquet and read back as pandas categoricals;
+# reads are memory-mapped and pull only the columns a metric needs.
+CATEGORICAL_COLS = ['district_name', 'state_name', 'gender', 'category_name', 'marital_status_name',
+                    'fresh_renewal', 'institute_district', 'scheme_name']
+INTEGER_COLS = ['category_id', 'marital_status', 'c_institution_id', 'scheme_id']
+CHUNK_SIZE = 50000
+
+
+def applicant_schema(columns=APPLICANT_COLUMNS):
+    return pa.schema([
+        (col, pa.float64() if col in NUMERIC_COLS else pa.int64() if col in INTEGER_COLS else pa.string())
+        for col in columns
+    ])
+
+
+if pa is not None:
+    SNAPSHOT_SCHEMA = applicant_schema()
+
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow is required for applicant snapshots (pip install pyarrow)")
+
+
+def chunk_table(df, schema=None):
+    for col in df.columns.intersection(NUMERIC_COLS):
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype(float)
+    for col in df.columns.intersection(INTEGER_COLS):
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
+    for col in df.columns.difference(NUMERIC_COLS + INTEGER_COLS):
+        df[col] = df[col].astype("string")
+    return pa.Table.from_pandas(df, schema=schema or SNAPSHOT_SCHEMA, preserve_index=False)
+
+
+def write_snapshot(conn, path: str, chunk_size: int = CHUNK_SIZE, masters=None):
+    """Streams the applicant join into ``path`` one row group per chunk and
+    atomically replaces any previous snapshot. Returns the row count."""
+    require_pyarrow()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    rows = 0
+
+    cur = conn.cursor(name='nsp_snapshot_export')
+    cur.itersize = chunk_size
+    try:
+        data = current_masters(conn, masters)
+        cur.execute(applicant_query())
+        with pq.ParquetWriter(tmp_path, SNAPSHOT_SCHEMA, use_dictionary=CATEGORICAL_COLS) as writer:
+            while True:
+                results = cur.fetchmany(chunk_size)
+                if not results:
+                    break
+                table = chunk_table(resolve_rows(results, APPLICANT_COLUMNS, data))
+                writer.write_table(table)
+                rows += table.num_rows
+    finally:
+        cur.close()
+
+    os.replace(tmp_path, path)
+    return rows
+
+
+def read_snapshot(path: str, columns=None):
+    require_pyarrow()
+    table = pq.read_table(
+        path,
+        columns=columns,
+        memory_map=True,
+        read_dictionary=[col for col in (columns or CATEGORICAL_COLS) if col in CATEGORICAL_COLS]
+    )
+    return prepare_frame(table.to_pandas())
+
+
+# ----------------- Snapshot Store -----------------
+class SnapshotStore:
+    def __init__(self, directory: str, masters=None):
+        self.directory = directory
+        self._masters = masters
+        self._lock = threading.Lock()
+
+    def path(self, db_key: str):
+        return os.path.join(self.directory, f"{db_key}_applicants.parquet")
+
+    def available(self, db_key: str):
+        return pa is not None and os.path.exists(self.path(db_key))
+
+    def version(self, db_key: str):
+        return os.path.getmtime(self.path(db_key)) if self.available(db_key) else None
+
+    def write(self, conn, db_key: str):
+        with self._lock:
+            started = time.monotonic()
+            rows = write_snapshot(conn, self.path(db_key), masters=self._masters)
+            logger.info(f"Wrote {rows} applicant rows from {db_key} to {self.path(db_key)} "
+                        f"in {time.monotonic() - started:.2f}s")
+            return rows
+
+    def frame(self, db_key: str, columns=None):
+        return read_snapshot(self.path(db_key), columns)
+
+    def info(self, db_key: str):
+        path = self.path(db_key)
+        if not self.available(db_key):
+            return {"available": False}
+        metadata = pq.ParquetFile(path).metadata
+        return {
+            "available": True,
+            "rows": metadata.num_rows,
+            "bytes": os.path.getsize(path),
+            "written_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(os.path.getmtime(path))),
+        }
+
+
+if __name__ == "__main__":
+    import sys
+
+    from nsp_dash import get_connection, snapshots
+
+    db_key = sys.argv[1] if len(sys.argv) > 1 else 'nsp_fresh'
+    conn = get_connection(db_key)
+    if not conn:
+        sys.exit(f"Could not connect to {db_key}")
+    try:
+        snapshots.write(conn, db_key)
+    finally:
+        conn.close()
@@ -0,0 +1,455 @@
+import logging
+from collections import namedtuple
+
+import numpy as np
+
+from distribution import IncomeDistribution, income_bounds, rank_bounds, SKETCH_RELATIVE_ACCURACY
+from filters import IndexedFrame, compile_filters
+from instrumentation import timed
+from master_data import LABEL_KEYS, current_masters
+from metrics import METRICS, frame_results, build_payload, rank_pairs
+from sketches import GroupedHyperLogLog
+
+logger = logging.getLogger(__name__)
+
+# ----------------- Join Graph -----------------
+# Each metric joins only the tables its dimension and measure need, so
+# e.g. gender counts read data_applicant_registration_details alone.
+# Master tables are not joined: dimensions group by the fact-table id and
+# the ids are mapped to labels from the master-data cache afterwards. The
+# one exception is mst_institution, so that institute districts group by
+# district id and an applicant counts once per district, not per institution.
+JOINS = {
+    'qualification': ([], "join data_applicant_qualifications q on q.application_id = r.application_id"),
+    'institution': (['qualification'], "join mst_institution inst on inst.institution_id = q.c_institution_id"),
+    'scheme': ([], "join data_applicant_applied_schemes sch on sch.application_id = r.application_id"),
+    'payment': ([], "join data_applicant_payments_calculation pay on pay.application_id = r.application_id"),
+}
+
+DIMENSIONS = {
+    'state_name': ('r.permanent_district_id', []),
+    'gender': ('r.gender', []),
+    'category_name': ('r.category_id', []),
+    'institute_district': ('inst.district_id', ['institution']),
+    'scheme_name': ('sch.scheme_id', ['scheme']),
+}
+# Label column the grouped ids resolve through, where not the dimension's own.
+GROUP_LABELS = {'institute_district': 'district_name'}
+
+# Qualifications and applied schemes can hold several rows per application,
+# so a query joining either one aggregates distinct applications: counts
+# use COUNT(DISTINCT r.application_id), and payments and incomes are first
+# reduced to one row per application (and label) over narrow columns.
+# data_applicant_payments_calculation holds one row per application.
+FANOUT_JOINS = {'qualification', 'institution', 'scheme'}
+
+INCOME_CHUNK_SIZE = 50000
+
+# Every metric counts the same population as the applicant frame
+# (prepare_frame): applications with a payment row holding at least one
+# share. Each query joins the payment table and filters on HAS_PAYMENT.
+PAYMENT_EXPR = "COALESCE(pay.pay_amt_state_shr, 0) + COALESCE(pay.pay_amt_centre_shr, 0)"
+HAS_PAYMENT = "(pay.pay_amt_state_shr IS NOT NULL OR pay.pay_amt_centre_shr IS NOT NULL)"
+
+
+def required_joins(names):
+    """``names`` with the joins they depend on."""
+    required = set()
+    for name in names:
+        required |= {name} | required_joins(JOINS[name][0])
+    return required
+
+
+def resolve_joins(names, outer=()):
+    # Joins named in ``outer`` become left joins.
+    ordered = []
+
+    def visit(name):
+        if name in ordered:
+            return
+        requires, _ = JOINS[name]
+        for dep in requires:
+            visit(dep)
+        ordered.append(name)
+
+    for name in names:
+        visit(name)
+    return "\n    ".join(("left " if name in outer else "") + JOINS[name][1] for name in ordered)
+
+
+def per_application(measure: str, column: str = None):
+    """(select, group by, aggregate) reducing the joined rows of each
+    application to one row per application (and label) before aggregating."""
+    keys = ([column] if column else []) + ["r.application_id"]
+    if measure == 'funding':
+        select = "MAX(pay.pay_amt_state_shr) AS state_share, MAX(pay.pay_amt_centre_shr) AS centre_share"
+        return select, keys, "SUM(state_share) AS state_share, SUM(centre_share) AS centre_share"
+    if measure == 'summary':
+        return f"MAX({PAYMENT_EXPR}) AS payment", keys, "COUNT(*) AS applications, SUM(payment) AS funding"
+    if measure == 'income':
+        return "r.annual_family_income", keys + ["r.annual_family_income"], None
+    return f"{column} AS label, MAX({PAYMENT_EXPR}) AS payment", keys, "label, SUM(payment) AS value"
+
+
+def compile_metric(name: str, filters=None, masters=None, partial: bool = False):
+    """(query, params) for one metric, scoped by drill-down ``filters``.
+    ``partial`` drops the top-N cut so shards can be merged first."""
+    metric = METRICS[name]
+    joins, where, params = compile_filters(filters, masters)
+    joins = joins + ['payment']
+    where.append(HAS_PAYMENT)
+
+    column = None
+    if metric.measure == 'income':
+        where.append("r.annual_family_income IS NOT NULL")
+    elif metric.dimension:
+        column, dim_joins = DIMENSIONS[metric.dimension]
+        joins = dim_joins + joins
+        where.append(f"{column} IS NOT NULL")
+    if metric.measure == 'institutions':
+        joins = joins + ['qualification']
+        where.append("q.c_institution_id IS NOT NULL")
+    fanout = bool(FANOUT_JOINS.intersection(joins))
+
+    group_by, aggregate = None, None
+    if metric.measure == 'institutions':
+        # Partial results are the distinct (label, institution) pairs, for
+        # sketches that merge across databases.
+        if partial:
+            select = f"DISTINCT {column} AS label, q.c_institution_id"
+        else:
+            select = f"{column} AS label, COUNT(DISTINCT q.c_institution_id) AS value"
+    elif fanout and metric.measure != 'count':
+        select, group_by, aggregate = per_application(metric.measure, column)
+    elif metric.measure == 'funding':
+        select = "SUM(pay.pay_amt_state_shr) AS state_share, SUM(pay.pay_amt_centre_shr) AS centre_share"
+    elif metric.measure == 'summary':
+        select = f"COUNT(*) AS applications, SUM({PAYMENT_EXPR}) AS funding"
+    elif metric.measure == 'income':
+        select = "r.annual_family_income"
+    else:
+        if metric.measure == 'count':
+            value = "COUNT(DISTINCT r.application_id)" if fanout else "COUNT(*)"
+        else:
+            value = f"SUM({PAYMENT_EXPR})"
+        select = f"{column} AS label, {value} AS value"
+
+    query = f"SELECT {select}\n    FROM data_applicant_registration_details r"
+    if joins:
+        query += "\n    " + resolve_joins(joins)
+    if where:
+        query += "\n    WHERE " + " AND ".join(where)
+    if group_by:
+        query += "\n    GROUP BY " + ", ".join(group_by)
+    if aggregate:
+        query = f"SELECT {aggregate}\n    FROM ({query}) AS applications"
+    if metric.dimension and not (partial and metric.measure == 'institutions'):
+        # Ties rank by label (id), as rank_pairs ranks resolved labels.
+        query += "\n    GROUP BY label\n    ORDER BY value DESC, label"
+        if metric.limit and metric.dimension not in LABEL_KEYS and not partial:
+            query += f"\n    LIMIT {metric.limit}"
+    return query, params or None
+
+
+def fetch_income_bounds(conn, name: str = 'income-distribution', filters=None, masters=None):
+    # Over the metric's own population, so the histogram edges match the
+    # frame's.
+    return income_bounds(conn, *compile_metric(name, filters, masters))
+
+
+def fetch_income(conn, name: str, filters=None, masters=None, bounds=None):
+    # Only one column crosses the wire, streamed through a server-side
+    # cursor into a mergeable distribution instead of a Python list.
+    # Distributions merge only over the same ``bounds``.
+    query, params = compile_metric(name, filters, masters)
+    distribution = IncomeDistribution(*(bounds or fetch_income_bounds(conn, name, filters, masters)))
+    cur = conn.cursor(name='nsp_income_stream')
+    cur.itersize = INCOME_CHUNK_SIZE
+    try:
+        with timed('query'):
+            cur.execute(query, params)
+        while True:
+            with timed('fetch'):
+                results = cur.fetchmany(INCOME_CHUNK_SIZE)
+            if not results:
+                break
+            with timed('aggregate'):
+                distribution.add(np.array([row[0] for row in results], dtype=float))
+    finally:
+        cur.close()
+    return distribution
+
+
+def fetch_institutions(conn, name: str, filters=None, masters=None):
+    """GroupedHyperLogLog of the institutions per label of ``name``."""
+    metric = METRICS[name]
+    masters = current_masters(conn, masters)
+    sketches = GroupedHyperLogLog()
+    cur = conn.cursor(name='nsp_institution_stream')
+    cur.itersize = INCOME_CHUNK_SIZE
+    try:
+        with timed('query'):
+            cur.execute(*compile_metric(name, filters, masters, partial=True))
+        while True:
+            with timed('fetch'):
+                results = cur.fetchmany(INCOME_CHUNK_SIZE)
+            if not results:
+                break
+            with timed('aggregate'):
+                ids = [row[0] for row in results]
+                labels = masters.labels(GROUP_LABELS.get(metric.dimension, metric.dimension), ids)
+                sketches.add(labels, [row[1] for row in results])
+    finally:
+        cur.close()
+    return sketches
+
+
+def label_groups(rows, labels, limit: int = None):
+    # Several ids can share a label (e.g. all districts of a state); ids
+    # without a master row are dropped like the inner joins they replace.
+    totals = {}
+    for label, (_, value) in zip(labels, rows):
+        if label is not None:
+            totals[label] = totals.get(label, 0.0) + float(value)
+    return rank_pairs(totals.items(), limit)
+
+
+def totals_result(row):
+    return tuple(float(v or 0) for v in row)
+
+
+def grouped_result(name: str, rows, masters, partial: bool = False):
+    metric = METRICS[name]
+    if metric.dimension in LABEL_KEYS:
+        labels = masters.labels(GROUP_LABELS.get(metric.dimension, metric.dimension), [row[0] for row in rows])
+        return label_groups(rows, labels, None if partial else metric.limit)
+    return [(row[0], float(row[1])) for row in rows]
+
+
+def fetch_metric(conn, name: str, masters=None, filters=None, partial: bool = False, bounds=None):
+    metric = METRICS[name]
+    if filters:
+        masters = current_masters(conn, masters)
+    if metric.measure == 'income':
+        return fetch_income(conn, name, filters, masters, bounds)
+    if metric.measure == 'institutions' and partial:
+        return fetch_institutions(conn, name, filters, masters)
+
+    cur = conn.cursor()
+    with timed('query'):
+        cur.execute(*compile_metric(name, filters, masters, partial))
+    if metric.measure in ('funding', 'summary'):
+        with timed('fetch'):
+            return totals_result(cur.fetchone())
+    with timed('fetch'):
+        rows = cur.fetchall()
+    if metric.dimension in LABEL_KEYS:
+        masters = current_masters(conn, masters)
+    with timed('aggregate'):
+        return grouped_result(name, rows, masters, partial)
+
+
+# ----------------- Fused Metrics -----------------
+# The count, payment, funding and summary widgets are all sums over the same
+# join, grouped by different dimensions, so any set of them compiles to one
+# GROUPING SETS query: the fact tables are scanned once per dashboard, not
+# once per chart, and the rows are split back into per-widget results.
+# Dimension joins are outer joins, so a widget still counts applications
+# with no row in another widget's table (e.g. gender counts do not need a
+# qualification). Under fan-out,
+# window functions flag the first row of each application, and of each
+# (application, label) for fan-out dimensions, and the sums are taken over
+# the flagged rows. Backends without GROUPING SETS (the SQLite benchmark
+# target sets ``grouping_sets = False``) get one GROUP BY per set over a CTE.
+FUSED_MEASURES = ('count', 'payment', 'funding', 'summary')
+# Fact-table column each fan-out dimension is counted once per, with the application.
+GRAIN_KEYS = {'institute_district': 'inst.district_id', 'scheme_name': 'sch.scheme_id'}
+
+FusedQuery = namedtuple('FusedQuery', ['query', 'params', 'dimensions', 'columns'])
+
+
+def fusable(names):
+    return [name for name in names if METRICS[name].measure in FUSED_MEASURES]
+
+
+def grain_suffix(dimension: str = None):
+    return f"_{dimension}" if dimension in GRAIN_KEYS else ""
+
+
+def compile_fused(names, filters=None, masters=None, grouping_sets: bool = True):
+    """FusedQuery computing every metric of ``names`` (all FUSED_MEASURES)
+    in one scan. Each row is (grouping set, one key per dimension, sums)."""
+    metrics = [METRICS[name] for name in names]
+    dimensions = list(dict.fromkeys(metric.dimension for metric in metrics if metric.dimension))
+    totals = any(metric.measure in ('funding', 'summary') for metric in metrics)
+    payments = any(metric.measure != 'count' for metric in metrics)
+
+    filter_joins, where, params = compile_filters(filters, masters)
+    filter_joins = filter_joins + ['payment']
+    where.append(HAS_PAYMENT)
+    joins = [join for dim in dimensions for join in DIMENSIONS[dim][1]]
+    outer = required_joins(joins) - required_joins(filter_joins)
+    fanout = bool(FANOUT_JOINS.intersection(filter_joins + joins))
+
+    keys = [f"k{i}" for i in range(len(dimensions))]
+    select = [f"{DIMENSIONS[dim][0]} AS {key}" for dim, key in zip(dimensions, keys)]
+    grains = list(dict.fromkeys([grain_suffix(dim) for dim in dimensions] + ([""] if totals else [])))
+    if not fanout:
+        # Every row is its own application: one flag serves every grain.
+        grains = [""]
+        select.append("1 AS first")
+    else:
+        partitions = {suffix: "r.application_id" for suffix in grains}
+        for dim in dimensions:
+            if dim in GRAIN_KEYS:
+                partitions[grain_suffix(dim)] = f"r.application_id, {GRAIN_KEYS[dim]}"
+        select += [
+            f"CASE WHEN ROW_NUMBER() OVER (PARTITION BY {partition}) = 1 THEN 1 ELSE 0 END AS first{suffix}"
+            for suffix, partition in partitions.items()
+        ]
+    if payments:
+        select += [
+            f"{PAYMENT_EXPR} AS payment",
+            "COALESCE(pay.pay_amt_state_shr, 0) AS state_share",
+            "COALESCE(pay.pay_amt_centre_shr, 0) AS centre_share",
+        ]
+
+    columns, sums = [], []
+    for suffix in grains:
+        columns.append(f"applications{suffix}")
+        sums.append(f"SUM(first{suffix})")
+        if payments:
+            columns.append(f"payment{suffix}")
+            sums.append(f"SUM(first{suffix} * payment)")
+    if totals:
+        columns += ["state_share", "centre_share"]
+        sums += ["SUM(first * state_share)", "SUM(first * centre_share)"]
+    sums = ", ".join(f"{expr} AS {column}" for expr, column in zip(sums, columns))
+
+    rows = "SELECT " + ",\n        ".join(select) + "\n    FROM data_applicant_registration_details r"
+    rows += "\n    " + resolve_joins(filter_joins + joins, outer)
+    rows += "\n    WHERE " + " AND ".join(where)
+
+    sets = [[key] for key in keys] + ([[]] if totals else [])
+    everything = (1 << len(keys)) - 1
+    if not keys:
+        query = f"SELECT 0 AS grouping_set, {sums}\n    FROM ({rows}) AS fused"
+    elif grouping_sets:
+        grouping = ", ".join(f"({', '.join(grouped)})" for grouped in sets)
+        query = (f"SELECT GROUPING({', '.join(keys)}) AS grouping_set, {', '.join(keys)}, {sums}"
+                 f"\n    FROM ({rows}) AS fused\n    GROUP BY GROUPING SETS ({grouping})")
+    else:
+        parts = []
+        for grouped in sets:
+            mask = everything ^ sum(1 << (len(keys) - 1 - keys.index(key)) for key in grouped)
+            selected = ", ".join(key if key in grouped else f"NULL AS {key}" for key in keys)
+            part = f"SELECT {mask} AS grouping_set, {selected}, {sums}\n    FROM fused"
+            parts.append(part + (f"\n    GROUP BY {', '.join(grouped)}" if grouped else ""))
+        query = f"WITH fused AS ({rows})\n" + "\nUNION ALL\n".join(parts)
+    return FusedQuery(query, params or None, dimensions, columns)
+
+
+def ranked_result(name: str, pairs, masters, partial: bool = False):
+    # Ordered as compile_metric orders its rows: by value, ties by label id.
+    metric = METRICS[name]
+    ranked = rank_pairs(pairs)
+    if metric.dimension in LABEL_KEYS:
+        return grouped_result(name, ranked, masters, partial)
+    return ranked[:metric.limit] if metric.limit and not partial else ranked
+
+
+def fused_results(fused: FusedQuery, names, rows, masters, partial: bool = False):
+    """Splits the rows of ``fused`` back into {name: result}."""
+    n = len(fused.dimensions)
+    everything = (1 << n) - 1
+    groups = {dim: [] for dim in fused.dimensions}
+    totals = dict.fromkeys(fused.columns, 0)
+    for row in rows:
+        sums = {column: value or 0 for column, value in zip(fused.columns, row[1 + n:])}
+        if row[0] == everything:
+            totals = sums
+            continue
+        i = n - 1 - (everything ^ row[0]).bit_length() + 1
+        if row[1 + i] is not None:
+            groups[fused.dimensions[i]].append((row[1 + i], sums))
+
+    results = {}
+    for name in names:
+        metric = METRICS[name]
+        if metric.measure == 'funding':
+            results[name] = (float(totals['state_share']), float(totals['centre_share']))
+        elif metric.measure == 'summary':
+            results[name] = (float(totals['applications']), float(totals['payment']))
+        else:
+            suffix = grain_suffix(metric.dimension) if f"applications{grain_suffix(metric.dimension)}" in fused.columns else ""
+            value = f"applications{suffix}" if metric.measure == 'count' else f"payment{suffix}"
+            pairs = [(key, sums[value]) for key, sums in groups[metric.dimension]
+                     if sums[f"applications{suffix}"] > 0]
+            results[name] = ranked_result(name, pairs, masters, partial)
+    return results
+
+
+def fetch_metrics(conn, names, masters=None, filters=None, partial: bool = False, bounds=None):
+    """{name: result} for ``names``, with every fusable metric answered by
+    one fused query (when there are two or more). ``bounds`` maps income
+    metrics to agreed income ranges."""
+    results = {}
+    fused_names = fusable(names)
+    if len(fused_names) > 1:
+        masters = current_masters(conn, masters)
+        fused = compile_fused(fused_names, filters, masters, grouping_sets=getattr(conn, 'grouping_sets', True))
+        cur = conn.cursor()
+        with timed('query'):
+            cur.execute(fused.query, fused.params)
+        with timed('fetch'):
+            rows = cur.fetchall()
+        with timed('aggregate'):
+            results.update(fused_results(fused, fused_names, rows, masters, partial))
+    for name in names:
+        if name not in results:
+            results[name] = fetch_metric(conn, name, masters, filters, partial, (bounds or {}).get(name))
+    return {name: results[name] for name in names}
+
+
+# ----------------- Verification -----------------
+INCOME_QUANTILES = {"median": 50, "p25": 25, "p75": 75, "p90": 90}
+
+
+def income_matches(sql_payload, frame_payload, incomes):
+    # Histogram and mean are exact. Quantiles come from the sketch, within
+    # its relative accuracy of an income either side of the quantile's rank
+    # (the pandas path interpolates between the two).
+    if not sql_payload["stats"] or not frame_payload["stats"]:
+        return sql_payload["stats"] == frame_payload["stats"]
+    if sql_payload["histogram"]["counts"] != frame_payload["histogram"]["counts"]:
+        return False
+    if sql_payload["stats"]["mean"] != frame_payload["stats"]["mean"]:
+        return False
+    for key, q in INCOME_QUANTILES.items():
+        lower, upper = rank_bounds(incomes, q / 100)
+        value = sql_payload["stats"][key]
+        if not lower * (1 - SKETCH_RELATIVE_ACCURACY) - 1 <= value <= upper * (1 + SKETCH_RELATIVE_ACCURACY) + 1:
+            return False
+    return True
+
+
+def compare_with_frame(conn, df, names=None, masters=None, filters=None):
+    """Returns {metric: (sql_payload, frame_payload)} for every metric whose
+    pushed-down result, on its own or fused with ``names``, differs from the
+    pandas path over ``df``; both scoped by drill-down ``filters``."""
+    names = names or list(METRICS)
+    masters = current_masters(conn, masters)
+    mismatches = {}
+    frame = frame_results(IndexedFrame(df).select(filters), names)
+    fused = fetch_metrics(conn, names, masters, filters)
+    for name in names:
+        frame_payload = build_payload(name, frame[name])
+        for result in (fetch_metric(conn, name, masters, filters), fused[name]):
+            sql_payload = build_payload(name, result)
+            if METRICS[name].measure == 'income':
+                matches = income_matches(sql_payload, frame_payload, frame[name])
+            else:
+                matches = sql_payload == frame_payload
+            if not matches:
+                mismatches[name] = (sql_payload, frame_payload)
+    return mismatches
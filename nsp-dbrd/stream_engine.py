@@ -0,0 +1,102 @@
+import logging
+from collections import Counter
+
+import pandas as pd
+
+from dataset_engine import applicant_query, fact_columns, prepare_frame
+from distinct import DistinctFrames, whole_applications
+from distribution import IncomeDistribution
+from instrumentation import timed
+from master_data import current_masters
+from metrics import METRICS, rank_pairs
+from schema import apply_schema
+from sketches import GroupedHyperLogLog, SpaceSaving
+from sql_metrics import fetch_income_bounds
+
+logger = logging.getLogger(__name__)
+
+# ----------------- Full-Population Pipeline -----------------
+# Streams the applicant join through a server-side (named) cursor and folds
+# every chunk into running aggregates, so exact totals over the whole
+# database need O(chunk + groups) memory instead of a full DataFrame.
+# Rows come in application_id order and each chunk holds whole
+# applications, so repeated join rows are deduplicated within the chunk.
+# Dimensions with many labels are ranked by SpaceSaving sketches and
+# institutions are counted with HyperLogLog (sketches.py), so memory stays
+# constant however many labels the data has.
+CHUNK_SIZE = 50000
+
+DIMENSIONS = ['state_name', 'gender', 'category_name', 'institute_district', 'scheme_name']
+TOPK_DIMENSIONS = ['state_name', 'institute_district', 'scheme_name']
+INSTITUTION_DIMENSIONS = ['institute_district', 'scheme_name']
+STREAM_COLUMNS = ['application_id'] + DIMENSIONS + ['c_institution_id', 'pay_amt_state_shr', 'pay_amt_centre_shr',
+                                                    'annual_family_income']
+
+
+class RunningAggregates:
+    def __init__(self, income_range):
+        self.rows = 0
+        self.state_share = 0.0
+        self.centre_share = 0.0
+        self.counts = {dim: SpaceSaving() if dim in TOPK_DIMENSIONS else Counter() for dim in DIMENSIONS}
+        self.payments = {dim: SpaceSaving() if dim in TOPK_DIMENSIONS else Counter() for dim in DIMENSIONS}
+        self.institutions = {dim: GroupedHyperLogLog() for dim in INSTITUTION_DIMENSIONS}
+        self.income = IncomeDistribution(*income_range)
+
+    def __len__(self):
+        return self.rows
+
+    def fold(self, chunk):
+        distinct = DistinctFrames(chunk)
+        applications = distinct.get()
+        self.rows += len(applications)
+        self.state_share += float(applications['pay_amt_state_shr'].sum())
+        self.centre_share += float(applications['pay_amt_centre_shr'].sum())
+        for dim in DIMENSIONS:
+            rows = distinct.get([dim])
+            counts = rows[dim].value_counts()
+            self.counts[dim].update(counts[counts > 0].to_dict())
+            self.payments[dim].update(rows.groupby(dim, observed=True)['payment_amt_share'].sum().to_dict())
+        for dim in INSTITUTION_DIMENSIONS:
+            self.institutions[dim].add(chunk[dim], chunk['c_institution_id'])
+        self.income.add(applications['annual_family_income'].to_numpy(dtype=float))
+
+    def result(self, name: str):
+        metric = METRICS[name]
+
+        if metric.measure == 'funding':
+            return self.state_share, self.centre_share
+        if metric.measure == 'summary':
+            return self.rows, self.state_share + self.centre_share
+        if metric.measure == 'income':
+            return self.income
+
+        source = {'count': self.counts, 'payment': self.payments, 'institutions': self.institutions}[metric.measure]
+        return rank_pairs(source[metric.dimension].most_common(), metric.limit)
+
+
+def stream_aggregates(conn, chunk_size: int = CHUNK_SIZE, masters=None):
+    aggregates = RunningAggregates(fetch_income_bounds(conn))
+    data = current_masters(conn, masters)
+
+    def raw_chunks():
+        while True:
+            with timed('fetch'):
+                results = cur.fetchmany(chunk_size)
+            if not results:
+                break
+            yield pd.DataFrame(results, columns=fact_columns(STREAM_COLUMNS))
+
+    cur = conn.cursor(name='nsp_population_stream')
+    cur.itersize = chunk_size
+    try:
+        with timed('query'):
+            cur.execute(applicant_query(STREAM_COLUMNS, order_by="r.application_id"))
+        for raw in whole_applications(raw_chunks()):
+            with timed('frame'):
+                chunk = apply_schema(prepare_frame(data.resolve(raw, STREAM_COLUMNS)))
+            with timed('aggregate'):
+                aggregates.fold(chunk)
+    finally:
+        cur.close()
+    return aggregates
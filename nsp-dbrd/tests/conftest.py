@@ -0,0 +1,71 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The tests connect to generated SQLite files only; db_config needs the
+# passwords set all the same.
+for prefix in ('MAIN_DB', 'NSP_FRESH_DB', 'NSP_RENEWAL_DB'):
+    os.environ.setdefault(f'{prefix}_PASSWORD', '')
+
+from benchmark.generate import SQLiteTarget, generate  # noqa: E402
+from benchmark.sqlite_backend import SQLiteConnection  # noqa: E402
+from dataset_engine import load_dataset  # noqa: E402
+from db_pool import PoolRegistry  # noqa: E402
+from master_data import MasterData  # noqa: E402
+
+# A small generated database: every table the backend queries, with
+# fan-out (extra qualifications and schemes) and unpaid applications.
+FIXTURE_ROWS = 3000
+
+
+@pytest.fixture(scope='session')
+def bench_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('nsp') / 'bench.db')
+    generate(SQLiteTarget(path), FIXTURE_ROWS, seed=2425)
+    return path
+
+
+@pytest.fixture
+def conn(bench_db):
+    conn = SQLiteConnection(bench_db)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope='session')
+def masters(bench_db):
+    conn = SQLiteConnection(bench_db)
+    try:
+        return MasterData.load(conn)
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope='session')
+def frame(bench_db, masters):
+    conn = SQLiteConnection(bench_db)
+    try:
+        return load_dataset(conn, masters=masters)
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope='module')
+def dash(bench_db):
+    # The Flask app, its pools connected to the generated database.
+    import nsp_dash
+    pools = nsp_dash.pools
+    nsp_dash.pools = PoolRegistry(nsp_dash.DB_CONFIGS, factory=lambda config: SQLiteConnection(bench_db), maxconn=3)
+    yield nsp_dash
+    nsp_dash.pools.closeall()
+    nsp_dash.pools = pools
+
+
+@pytest.fixture
+def client(dash, monkeypatch):
+    # No background pre-warming: every response is computed on request.
+    monkeypatch.setattr(dash.prewarmer, 'interval', 0)
+    monkeypatch.setattr(dash, 'METRIC_SOURCE', 'sql')
+    return dash.app.test_client()
@@ -0,0 +1,36 @@
+import threading
+
+from dataset_engine import DatasetCache
+
+
+class Connection:
+    def close(self):
+        pass
+
+
+def test_serve_stale_reloads_in_background():
+    loads = []
+    release = threading.Event()
+
+    def loader(conn):
+        if loads:
+            release.wait(5)
+        loads.append(len(loads))
+        return [len(loads)]
+
+    cache = DatasetCache(lambda db_key: Connection(), ttl=3600, loader=loader, serve_stale=True)
+    assert cache.get('nsp_fresh') == [1]
+    version = cache.version('nsp_fresh')
+
+    # The redraw is held back: requests keep the previous value meanwhile.
+    cache.invalidate('nsp_fresh')
+    assert cache.get('nsp_fresh') == [1]
+    assert cache.get('nsp_fresh') == [1]
+    assert cache.version('nsp_fresh') == version
+
+    release.set()
+    for thread in threading.enumerate():
+        if thread.name == 'nsp-reload-nsp_fresh':
+            thread.join(5)
+    assert cache.get('nsp_fresh') == [2]
+    assert len(loads) == 2
@@ -0,0 +1,69 @@
+import gc
+
+import pytest
+
+from db_pool import ConnectionPool, PoolTimeout
+
+
+class Connection:
+    def __init__(self):
+        self.closed = 0
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+
+def make_pool(maxconn=2, **options):
+    opened = []
+
+    def factory(config):
+        opened.append(Connection())
+        return opened[-1]
+
+    return ConnectionPool('nsp_fresh', {}, minconn=0, maxconn=maxconn, timeout=0.05, factory=factory, **options), opened
+
+
+def test_checkout_and_return_reuses_connections():
+    pool, opened = make_pool()
+    first = pool.acquire()
+    second = pool.acquire()
+    assert pool.stats()['in_use'] == 2
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+
+    first.close()
+    first.close()  # closing twice returns it once
+    assert opened[0].rollbacks == 1
+    third = pool.acquire()
+    assert len(opened) == 2
+    second.close()
+    third.close()
+    stats = pool.stats()
+    assert (stats['size'], stats['idle'], stats['in_use'], stats['checkouts'], stats['timeouts']) == (2, 2, 0, 3, 1)
+
+
+def test_closed_connection_is_replaced():
+    pool, opened = make_pool(maxconn=1)
+    conn = pool.acquire()
+    opened[0].close()
+    conn.close()
+    assert pool.stats()['size'] == 0
+    pool.acquire().close()
+    assert len(opened) == 2
+
+
+def test_leaked_connection_is_returned():
+    pool, opened = make_pool(maxconn=1)
+
+    def leak():
+        pool.acquire()  # never closed
+
+    leak()
+    gc.collect()
+    assert pool.stats()['in_use'] == 0
+    pool.acquire().close()
+    assert len(opened) == 1
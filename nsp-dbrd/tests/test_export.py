@@ -0,0 +1,52 @@
+import io
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from dataset_engine import APPLICANT_COLUMNS, applicant_query, resolve_rows
+
+COLUMNS = ['application_id', 'state_name', 'scheme_name', 'pay_amt_state_shr']
+
+
+def joined_rows(conn, masters):
+    cur = conn.cursor()
+    cur.execute(applicant_query(APPLICANT_COLUMNS))
+    return resolve_rows(cur.fetchall(), APPLICANT_COLUMNS, masters)
+
+
+def export(client, query):
+    response = client.get(f'/api/export?{query}')
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response
+
+
+def test_csv_streams_every_row_in_chunks(dash, client, monkeypatch, conn, masters):
+    monkeypatch.setattr(dash, 'EXPORT_CHUNK_SIZE', 500)
+    response = export(client, 'format=csv')
+    assert response.is_streamed
+    assert response.headers['Content-Disposition'] == "attachment; filename=nsp_applicants.csv"
+    exported = pd.read_csv(io.StringIO(response.get_data(as_text=True)))
+    assert list(exported.columns) == APPLICANT_COLUMNS
+    assert len(exported) == len(joined_rows(conn, masters))
+
+
+def test_parquet_matches_csv_with_filters(dash, client, monkeypatch):
+    monkeypatch.setattr(dash, 'EXPORT_CHUNK_SIZE', 200)
+    query = f"columns={','.join(COLUMNS)}&state=BIHAR"
+    csv = pd.read_csv(io.StringIO(export(client, f'format=csv&{query}').get_data(as_text=True)))
+    parquet = pq.read_table(io.BytesIO(export(client, f'format=parquet&{query}').get_data())).to_pandas()
+
+    assert list(parquet.columns) == COLUMNS
+    assert len(parquet) == len(csv) > 0
+    assert set(parquet['state_name']) == {'BIHAR'}
+    assert sorted(parquet['application_id']) == sorted(csv['application_id'])
+
+
+def test_empty_export_keeps_header(client):
+    response = export(client, 'format=csv&columns=application_id,gender&state=NOWHERE')
+    assert response.get_data(as_text=True) == "application_id,gender\n"
+
+
+def test_bad_requests(client):
+    assert client.get('/api/export?format=xlsx').status_code == 400
+    assert client.get('/api/export?columns=application_id,password').status_code == 400
@@ -0,0 +1,17 @@
+from federation import finalize_result, merge_results
+from metrics import METRICS, frame_results
+from sql_metrics import fetch_metrics
+
+
+def test_merged_ties_rank_like_one_database():
+    partials = [[('WEST BENGAL', 3.0), ('ASSAM', 5.0)], [('BIHAR', 5.0), ('WEST BENGAL', 2.0)]]
+    assert merge_results('top-states', partials) == [('ASSAM', 5.0), ('BIHAR', 5.0), ('WEST BENGAL', 5.0)]
+
+
+def test_single_source_federation_matches_frame(conn, masters, frame):
+    names = [name for name in METRICS if METRICS[name].measure not in ('income', 'institutions')]
+    partials = fetch_metrics(conn, names, masters, partial=True)
+    expected = frame_results(frame, names)
+    for name in names:
+        assert finalize_result(name, partials[name]) == expected[name], name
+        assert merge_results(name, [partials[name]]) == expected[name], name
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from filters import INDEXES, FilterError, IndexedFrame, compile_filters, concurrent_index, parse_filters
+
+
+def test_parse_filters_orders_and_dedupes():
+    args = MultiDict([('gender', 'M'), ('state', 'BIHAR'), ('gender', ' F '), ('gender', 'M'), ('scheme_id', '76'),
+                      ('category', ''), ('widgets', 'summary')])
+    assert parse_filters(args, reserved=('widgets',)) == {
+        'state': ('BIHAR',), 'scheme_id': (76,), 'gender': ('F', 'M')}
+
+
+def test_parse_filters_rejects_unknown_and_invalid():
+    with pytest.raises(FilterError, match='Unknown filters: colour'):
+        parse_filters(MultiDict([('colour', 'red')]))
+    with pytest.raises(FilterError, match='Invalid scheme_id'):
+        parse_filters(MultiDict([('scheme_id', 'abc')]))
+
+
+def test_compile_filters(masters):
+    joins, where, params = compile_filters({'state': ('BIHAR',), 'scheme_id': (1, 2), 'gender': ('F',)}, masters)
+    assert joins == ['scheme']
+    assert where == [f"r.permanent_district_id IN ({', '.join(['%s'] * (len(params) - 3))})",
+                     "sch.scheme_id IN (%s, %s)", "r.gender IN (%s)"]
+    assert params[-3:] == [1, 2, 'F']
+    assert all(isinstance(param, int) for param in params[:-3])
+
+
+def test_unknown_label_matches_nothing(masters):
+    assert compile_filters({'state': ('ATLANTIS',)}, masters) == ([], ["1 = 0"], [])
+
+
+def test_indexed_frame_selects_like_a_mask(frame):
+    filters = {'state': ('BIHAR', 'ASSAM'), 'gender': ('F',)}
+    expected = frame[frame['state_name'].isin(['BIHAR', 'ASSAM']) & (frame['gender'] == 'F')]
+    selected = IndexedFrame(frame).select(filters)
+    assert len(selected) and np.array_equal(selected.index, expected.index)
+    assert not len(IndexedFrame(frame).select({'state': ('ATLANTIS',)}))
+
+
+def test_indexes_build_concurrently():
+    statements = [concurrent_index(statement) for statement in INDEXES]
+    assert all(statement.startswith("CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_") for statement in statements)
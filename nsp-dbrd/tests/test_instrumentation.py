@@ -0,0 +1,46 @@
+import re
+
+from instrumentation import LatencyHistograms, end_request, start_request, timed, timing_header
+
+
+def test_timed_adds_up_per_request():
+    with timed('query'):
+        pass  # outside a request: not recorded anywhere
+    start_request()
+    with timed('query'):
+        pass
+    with timed('query'):
+        pass
+    with timed('fetch'):
+        pass
+    timings = end_request()
+    assert set(timings) == {'query', 'fetch'}
+    assert end_request() == {}
+
+
+def test_timing_header_orders_phases():
+    header = timing_header({'fetch': 0.002, 'connect': 0.0004}, 0.015)
+    assert header == "connect;dur=0.4, fetch;dur=2.0, total;dur=15.0"
+
+
+def test_exposition_is_cumulative():
+    histograms = LatencyHistograms(buckets=[0.01, 0.1])
+    for seconds in (0.005, 0.05, 0.5):
+        histograms.observe('/api/summary', 'query', seconds)
+    lines = histograms.exposition().splitlines()
+    labels = 'endpoint="/api/summary",phase="query"'
+    assert f'nsp_phase_duration_seconds_bucket{{{labels},le="0.01"}} 1' in lines
+    assert f'nsp_phase_duration_seconds_bucket{{{labels},le="0.1"}} 2' in lines
+    assert f'nsp_phase_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in lines
+    assert f'nsp_phase_duration_seconds_count{{{labels}}} 3' in lines
+
+
+def test_requests_feed_metrics_and_timing_header(dash, client, monkeypatch):
+    monkeypatch.setattr(dash, 'TIMING_HEADER', True)
+    response = client.get('/api/summary')
+    assert response.status_code == 200
+    assert re.fullmatch(r'(\w+;dur=[\d.]+, )*total;dur=[\d.]+', response.headers['X-Timing'])
+    assert 'query;dur=' in response.headers['X-Timing']
+
+    exposition = client.get('/metrics').get_data(as_text=True)
+    assert 'nsp_phase_duration_seconds_count{endpoint="/api/summary",phase="total"}' in exposition
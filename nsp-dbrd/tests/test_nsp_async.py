@@ -0,0 +1,159 @@
+import asyncio
+import json
+import re
+from functools import partial
+from urllib.parse import parse_qsl
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import nsp_async
+from benchmark.sqlite_backend import SQLiteConnection
+from filters import IndexedFrame, parse_filters
+from metrics import METRICS, frame_results
+from sql_metrics import compile_fused, income_matches
+
+
+def test_asyncpg_placeholders():
+    assert nsp_async.asyncpg_query("a = %s AND b IN (%s, %s)") == "a = $1 AND b IN ($2, $3)"
+    assert nsp_async.asyncpg_query("SELECT 1") == "SELECT 1"
+
+
+# ----------------- Fake asyncpg pool -----------------
+# Just enough of asyncpg's pool/connection API, over the generated SQLite
+# database, for AsyncMetrics' queries.
+class FakeStatement:
+    def __init__(self, cur):
+        self._cur = cur
+
+    def get_attributes(self):
+        return [type('Attribute', (), {'name': desc[0]}) for desc in self._cur.description]
+
+    async def fetch(self):
+        return self._cur.fetchall()
+
+
+class FakeCursor:
+    def __init__(self, cur):
+        self._cur = cur
+
+    async def fetch(self, n):
+        return self._cur.fetchmany(n)
+
+
+class FakeTransaction:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self, path):
+        self._conn = SQLiteConnection(path)
+
+    def _execute(self, query, params):
+        cur = self._conn.cursor()
+        cur.execute(re.sub(r'\$\d+', '%s', query), params)
+        return cur
+
+    async def prepare(self, query):
+        return FakeStatement(self._execute(query, ()))
+
+    async def fetch(self, query, *params):
+        return self._execute(query, params).fetchall()
+
+    async def fetchrow(self, query, *params):
+        return self._execute(query, params).fetchone()
+
+    async def cursor(self, query, *params):
+        return FakeCursor(self._execute(query, params))
+
+    def transaction(self):
+        return FakeTransaction()
+
+
+class FakePool:
+    def __init__(self, path):
+        self.path = path
+
+    def acquire(self):
+        pool = self
+
+        class Acquire:
+            async def __aenter__(self):
+                self.conn = FakeConnection(pool.path)
+                return self.conn
+
+            async def __aexit__(self, *exc):
+                self.conn._conn.close()
+                return False
+
+        return Acquire()
+
+
+@pytest.fixture
+def async_metrics(bench_db, monkeypatch):
+    metrics = nsp_async.AsyncMetrics()
+    metrics.pool = FakePool(bench_db)
+    monkeypatch.setattr(nsp_async, 'metrics', metrics)
+    # The SQLite benchmark has no GROUPING SETS.
+    monkeypatch.setattr(nsp_async, 'compile_fused', partial(compile_fused, grouping_sets=False))
+    return metrics
+
+
+def get(path, query=''):
+    """(status, JSON body) of a GET through the ASGI app."""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request'}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode(), 'headers': []}
+    asyncio.run(nsp_async.app(scope, receive, send))
+    body = b"".join(message.get('body', b"") for message in messages[1:])
+    return messages[0]['status'], json.loads(body)
+
+
+def test_routing_errors(async_metrics):
+    assert get('/api/nothing')[0] == 404
+    assert get('/api/dashboard', 'widgets=summary,nothing') == (400, {"error": "Unknown widgets: nothing"})
+    assert get('/api/summary', 'limit=x')[0] == 400
+
+
+@pytest.mark.parametrize('query', ['', 'state=BIHAR&gender=F'])
+def test_dashboard_matches_flask_app(dash, async_metrics, frame, monkeypatch, query):
+    filters = parse_filters(MultiDict(parse_qsl(query)))
+    monkeypatch.setattr(dash, 'METRIC_SOURCE', 'sql')
+    expected = json.loads(json.dumps(dash.evaluate_metrics(list(METRICS), filters)))
+    status, payloads = get('/api/dashboard', query)
+    assert status == 200
+
+    incomes = frame_results(IndexedFrame(frame).select(filters), ['income-distribution'])['income-distribution']
+    for name in METRICS:
+        if METRICS[name].measure == 'income':
+            assert income_matches(payloads[name], expected[name], incomes), name
+        else:
+            assert payloads[name] == expected[name], name
+    assert get('/api/top-states', query) == (200, expected['top-states'])
+
+
+def test_concurrent_requests_share_one_computation(async_metrics, monkeypatch):
+    calls = []
+
+    async def compute(names, filters=None):
+        calls.append(names)
+        await asyncio.sleep(0.01)
+        return {name: name for name in names}
+
+    monkeypatch.setattr(async_metrics, 'compute', compute)
+
+    async def requests():
+        return await asyncio.gather(*(async_metrics.coalesced(['summary'], {'state': ('BIHAR',)}) for _ in range(5)))
+
+    assert asyncio.run(requests()) == [{'summary': 'summary'}] * 5
+    assert calls == [['summary']]
@@ -0,0 +1,58 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from filters import IndexedFrame
+from metrics import METRICS, frame_results
+from payment_cube import CUBE_MEASURES, CubedFrame, PaymentCube, parse_limit
+
+NAMES = [name for name, metric in METRICS.items() if metric.measure in CUBE_MEASURES]
+
+SCHEMES = ('NATIONAL MEANS CUM MERIT SCHOLARSHIP', 'POST MATRIC SCHOLARSHIP FOR SC STUDENTS')
+
+FILTERS = [
+    None,
+    {'state': ('BIHAR',)},
+    {'scheme': SCHEMES[:1], 'gender': ('F',)},
+    {'institute_district': ('BR DISTRICT 1',), 'category': ('OBC', 'SC')},
+    # The cube cells cannot answer these; the selected rows are cubed.
+    {'scheme': SCHEMES},
+    {'scheme_id': (1,)},
+]
+
+
+@pytest.fixture(scope='module')
+def cubed(frame):
+    return CubedFrame(frame)
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_cube_matches_frame(cubed, frame, filters):
+    expected = frame_results(IndexedFrame(frame).select(filters), NAMES)
+    assert cubed.results(NAMES, filters) == expected
+
+
+def test_covers():
+    assert PaymentCube.covers({'state': ('BIHAR', 'ASSAM'), 'scheme': SCHEMES[:1]})
+    assert not PaymentCube.covers({'scheme': SCHEMES})
+    assert not PaymentCube.covers({'scheme_id': (1,)})
+
+
+def test_slice_matches_groupby(cubed, frame):
+    applications = frame.drop_duplicates('application_id')
+    expected = applications.groupby(['category_name', 'gender'], observed=True).agg(
+        applications=('application_id', 'size'), payment=('payment_amt_share', 'sum'))
+    sliced = cubed.cube.slice(['category_name', 'gender']).set_index(['category_name', 'gender'])
+    assert sliced['applications'].sort_index().to_dict() == expected['applications'].sort_index().to_dict()
+    assert sliced['payment'].sort_index().round(2).to_dict() == expected['payment'].sort_index().round(2).to_dict()
+
+
+@pytest.mark.parametrize('limit, expected', [('', None), ('0', None), ('5', 5)])
+def test_parse_limit(limit, expected):
+    assert parse_limit(MultiDict({'limit': limit})) == expected
+
+
+@pytest.mark.parametrize('limit', ['-3', 'ten', '2.5'])
+def test_slice_limit_must_be_non_negative(client, limit):
+    response = client.get(f'/api/payment-slice?by=category&limit={limit}')
+    assert response.status_code == 400
+    assert response.get_json() == {"error": f"Invalid limit: {limit} (expected a non-negative integer)"}
@@ -0,0 +1,56 @@
+import time
+from functools import partial
+
+import pytest
+
+from dataset_engine import DatasetCache
+from filters import IndexedFrame
+from metrics import METRICS, build_payload, frame_results
+from preview import draw_preview
+
+NAMES = [name for name, metric in METRICS.items() if metric.measure not in ('income', 'institutions')]
+
+
+def without_intervals(payload):
+    if isinstance(payload, dict):
+        return {key: value for key, value in payload.items() if not key.endswith('_ci')}
+    return [without_intervals(row) for row in payload]
+
+
+@pytest.mark.parametrize('filters', [None, {'state': ['BIHAR']}])
+def test_whole_strata_preview_is_exact(conn, masters, frame, filters):
+    sample = draw_preview(conn, per_stratum=len(frame), masters=masters)
+    assert sample.exact
+    expected = frame_results(IndexedFrame(frame).select(filters), NAMES)
+    payloads = sample.payloads(NAMES, filters)
+    for name in NAMES:
+        assert without_intervals(payloads[name]) == build_payload(name, expected[name]), name
+
+
+def test_sample_keeps_per_stratum_picks(conn, masters, frame):
+    exact = draw_preview(conn, per_stratum=len(frame), masters=masters)
+    sample = draw_preview(conn, per_stratum=2, masters=masters)
+    assert not sample.exact
+    assert (sample.strata['sampled'] <= 2).all()
+    assert sample.info()['population_applications'] == exact.info()['population_applications']
+    assert sample.frame['application_id'].nunique() == sample.info()['sampled_applications']
+
+
+def test_preview_warms_without_blocking(dash, client, monkeypatch):
+    previews = DatasetCache(dash.get_connection, ttl=3600, serve_stale=True,
+                            loader=partial(draw_preview, per_stratum=5, masters=dash.masters))
+    monkeypatch.setattr(dash, 'previews', previews)
+
+    # The first filtered request starts the draw and answers at once.
+    response = client.get('/api/preview?state=BIHAR&widgets=summary')
+    assert response.status_code == 503
+    assert response.get_json() == {"warming": True}
+    assert response.headers['Retry-After'] == str(dash.PREVIEW_RETRY_AFTER)
+
+    for _ in range(50):
+        if previews.version('nsp_fresh') is not None:
+            break
+        time.sleep(0.1)
+    response = client.get('/api/preview?state=BIHAR&widgets=summary')
+    assert response.status_code == 200
+    assert response.get_json()['sample']['per_stratum'] == 5
@@ -0,0 +1,23 @@
+from prewarm import Prewarmer
+
+
+def test_version_is_read_before_computing():
+    versions = iter(['v1', 'v2', 'v2', 'v2'])
+    computed = []
+
+    def compute():
+        computed.append(True)
+        return {'summary': {'total_applications': len(computed)}}
+
+    prewarmer = Prewarmer(compute, version=lambda: next(versions))
+    state = prewarmer.refresh()
+    # The data moved to v2 while computing: the payloads keep the older
+    # version and a refresh is due at once.
+    assert state.version == 'v1'
+    assert prewarmer._wake.is_set()
+
+    prewarmer._wake.clear()
+    state = prewarmer.refresh()
+    assert state.version == 'v2'
+    assert not prewarmer._wake.is_set()
+    assert prewarmer.get(['summary']) == {'summary': {'total_applications': 2}}
@@ -0,0 +1,68 @@
+import pytest
+
+
+def test_first_response_is_tagged(dash, client, monkeypatch):
+    # Before the master tables are loaded.
+    monkeypatch.setattr(dash.masters, '_data', None)
+    response = client.get('/api/summary')
+    assert response.status_code == 200
+    assert response.headers.get('ETag')
+    assert not response.cache_control.no_cache
+
+
+@pytest.fixture
+def versioned():
+    # A bare app around conditional_response, its version set by the test.
+    from flask import Flask, jsonify
+
+    from response_cache import conditional_response
+
+    app = Flask(__name__)
+    state = {"version": "v1", "builds": 0, "status": 200}
+
+    @app.route('/api/widget')
+    def widget():
+        def build():
+            state["builds"] += 1
+            return jsonify({"builds": state["builds"]}), state["status"]
+        return conditional_response(lambda: state["version"], build, max_age=60, stale_while_revalidate=300)
+
+    return app.test_client(), state
+
+
+def test_etag_revalidates_with_304(versioned):
+    client, state = versioned
+    response = client.get('/api/widget')
+    etag = response.headers['ETag']
+    assert response.cache_control.max_age == 60 and response.cache_control.public
+    assert 'stale-while-revalidate=300' in response.headers['Cache-Control']
+
+    response = client.get('/api/widget', headers={'If-None-Match': etag})
+    assert response.status_code == 304 and response.headers['ETag'] == etag
+    assert 'stale-while-revalidate=300' in response.headers['Cache-Control']
+    assert state["builds"] == 1
+
+    # The ETag covers the data version, the URL and the representation.
+    assert client.get('/api/widget?state=BIHAR', headers={'If-None-Match': etag}).status_code == 200
+    assert client.get('/api/widget', headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'}).status_code == 200
+    state["version"] = "v2"
+    response = client.get('/api/widget', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+
+
+def test_unversioned_and_error_responses_are_not_cached(versioned):
+    client, state = versioned
+    state["version"] = None
+    response = client.get('/api/widget')
+    assert 'ETag' not in response.headers and response.cache_control.no_cache
+
+    state["version"], state["status"] = "v1", 500
+    response = client.get('/api/widget')
+    assert 'ETag' not in response.headers and response.cache_control.no_store
+
+
+def test_dashboard_revalidates(client):
+    response = client.get('/api/dashboard?state=BIHAR')
+    assert response.status_code == 200
+    response = client.get('/api/dashboard?state=BIHAR', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
@@ -0,0 +1,116 @@
+import shutil
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from benchmark.sqlite_backend import SQLiteConnection
+from rollup_store import RollupStore
+from metrics import METRICS
+
+NAMES = [name for name, metric in METRICS.items() if metric.measure not in ('income', 'institutions')]
+
+
+@pytest.fixture
+def db_path(bench_db, tmp_path):
+    # Each test edits its own copy of the generated database.
+    path = str(tmp_path / 'rollup.db')
+    shutil.copy(bench_db, path)
+    return path
+
+
+def rollup_store(path, **options):
+    return RollupStore(lambda db_key: SQLiteConnection(path), **options)
+
+
+def results(store):
+    return {name: store.result(name) for name in NAMES}
+
+
+def execute(path, query, params=()):
+    with sqlite3.connect(path) as db:
+        db.execute(query, params)
+
+
+def first_applications(path, n):
+    with sqlite3.connect(path) as db:
+        rows = db.execute("SELECT application_id FROM data_applicant_payments_calculation "
+                          "WHERE pay_amt_state_shr IS NOT NULL ORDER BY application_id LIMIT ?", (n,)).fetchall()
+    return [application_id for (application_id,) in rows]
+
+
+def stamp(watermark, seconds):
+    return (pd.Timestamp(watermark) + pd.Timedelta(seconds=seconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def test_incremental_fold_matches_rebuild(db_path):
+    store = rollup_store(db_path, rebuild_interval=0)
+    store.refresh()
+    watermark = store.watermark
+    tied, late, moved = first_applications(db_path, 3)
+
+    # A payment stamped exactly at the watermark, a registration committed
+    # late with a stamp inside the overlap window, and a regular update.
+    execute(db_path, "UPDATE data_applicant_payments_calculation SET pay_amt_state_shr = pay_amt_state_shr + 1000, "
+                     "updated_on = ? WHERE application_id = ?", (watermark, tied))
+    execute(db_path, "UPDATE data_applicant_registration_details SET gender = CASE gender WHEN 'M' THEN 'F' ELSE 'M' END, "
+                     "updated_on = ? WHERE application_id = ?", (stamp(watermark, -60), late))
+    execute(db_path, "UPDATE data_applicant_payments_calculation SET pay_amt_state_shr = NULL, pay_amt_centre_shr = NULL, "
+                     "updated_on = ? WHERE application_id = ?", (stamp(watermark, 60), moved))
+    store.refresh()
+    assert store.rebuilt_at < store.refreshed_at
+
+    rebuilt = rollup_store(db_path)
+    rebuilt.refresh()
+    assert results(store) == results(rebuilt)
+
+    # Re-reading the same overlap window changes nothing.
+    store.refresh()
+    assert results(store) == results(rebuilt)
+
+
+def test_periodic_rebuild_drops_deleted_rows(db_path):
+    store = rollup_store(db_path, rebuild_interval=3600)
+    store.refresh()
+    before = results(store)
+    deleted, = first_applications(db_path, 1)
+    execute(db_path, "DELETE FROM data_applicant_payments_calculation WHERE application_id = ?", (deleted,))
+
+    # A deletion moves no stamp, so an incremental refresh keeps it...
+    store.refresh()
+    assert results(store) == before
+
+    # ...until the next full rebuild.
+    store.rebuilt_at -= store.rebuild_interval
+    store.refresh()
+    rebuilt = rollup_store(db_path)
+    rebuilt.refresh()
+    assert results(store) == results(rebuilt) != before
+
+
+def test_stale_reads_do_not_wait_for_refresh(db_path):
+    release = threading.Event()
+
+    def connect(db_key):
+        if store.refreshed_at is not None:
+            release.wait(5)
+        return SQLiteConnection(db_path)
+
+    store = RollupStore(connect, refresh_interval=0)
+    before = results(store)
+    rollup = store.rollup
+    store.reset()
+
+    # A stale read (and a reset) keeps serving the current rollups while
+    # the rebuild waits on its connection.
+    assert store.get() is rollup
+    assert results(store) == before
+    release.set()
+    for _ in range(50):
+        if store.rollup is not rollup:
+            break
+        time.sleep(0.1)
+    assert store.rollup is not rollup
+    assert results(store) == before
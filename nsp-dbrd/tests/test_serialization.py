@@ -0,0 +1,67 @@
+import gzip
+import json
+
+import pyarrow as pa
+import pytest
+from werkzeug.datastructures import Headers
+
+from serialization import (ARROW_TYPE, COMPRESS_MIN_BYTES, JSON_TYPE, MSGPACK_TYPE, ENCODERS, compress_stream,
+                           encode_payload, negotiate, payload_response)
+
+ROWS = [{"state": f"STATE {i}", "applications": i} for i in range(200)]
+
+
+@pytest.mark.parametrize('accept, expected', [
+    (None, JSON_TYPE),
+    ('*/*', JSON_TYPE),
+    ('text/html', JSON_TYPE),
+    (ARROW_TYPE, ARROW_TYPE),
+    (f'{JSON_TYPE};q=0.5, {ARROW_TYPE}', ARROW_TYPE),
+    (f'{ARROW_TYPE};q=0.1, {JSON_TYPE}', JSON_TYPE),
+])
+def test_negotiate_media_type(accept, expected):
+    assert negotiate(accept)[0] == expected
+
+
+def test_negotiate_encoding():
+    assert negotiate(None, 'gzip, deflate')[1] == 'gzip'
+    assert negotiate(None, 'identity')[1] is None
+    assert negotiate(None, None)[1] is None
+
+
+def test_msgpack_offered_only_when_installed():
+    assert (negotiate(MSGPACK_TYPE)[0] == MSGPACK_TYPE) == (MSGPACK_TYPE in ENCODERS)
+
+
+def test_encode_payload():
+    body, encoding = encode_payload(ROWS, JSON_TYPE, 'gzip')
+    assert encoding == 'gzip' and json.loads(gzip.decompress(body)) == ROWS
+
+    # Small bodies go out uncompressed.
+    body, encoding = encode_payload(ROWS[:2], JSON_TYPE, 'gzip')
+    assert encoding is None and len(body) < COMPRESS_MIN_BYTES and json.loads(body) == ROWS[:2]
+
+    body, _ = encode_payload(ROWS, ARROW_TYPE)
+    assert pa.ipc.open_stream(body).read_all().to_pylist() == ROWS
+
+
+def test_payload_response_headers():
+    response = payload_response(ROWS, Headers({'Accept': ARROW_TYPE, 'Accept-Encoding': 'gzip'}))
+    assert response.mimetype == ARROW_TYPE
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert set(response.vary) == {'Accept', 'Accept-Encoding'}
+
+
+def test_compress_stream():
+    chunks = ['state,applications\n'] + [f"{row['state']},{row['applications']}\n".encode() for row in ROWS]
+    body = gzip.decompress(b''.join(compress_stream(chunks, 'gzip')))
+    assert body.decode().splitlines()[1:] == [f"{row['state']},{row['applications']}" for row in ROWS]
+
+
+def test_arrow_single_row_and_missing_keys():
+    body, _ = encode_payload({"total_applications": 3, "stats": {"mean": 1}}, ARROW_TYPE)
+    assert pa.ipc.open_stream(body).read_all().to_pylist() == [{"total_applications": 3, "stats": {"mean": 1}}]
+
+    body, _ = encode_payload([{"state": "BIHAR"}, {"state": "ASSAM", "applications": 2}], ARROW_TYPE)
+    assert pa.ipc.open_stream(body).read_all().to_pylist() == [
+        {"state": "BIHAR", "applications": None}, {"state": "ASSAM", "applications": 2}]
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+CALLERS = 8
+
+
+def concurrent(flights, key, fn):
+    # Runs CALLERS concurrent flights.do(key, fn); returns results or errors.
+    outcomes = [None] * CALLERS
+
+    def call(i):
+        try:
+            outcomes[i] = flights.do(key, fn)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    return threads, outcomes
+
+
+def wait_for_followers(flights, release):
+    deadline = time.monotonic() + 5
+    while flights.stats()['coalesced'] < CALLERS - 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+
+
+def test_concurrent_calls_share_one_computation():
+    flights, release, runs = SingleFlight(), threading.Event(), []
+
+    def compute():
+        runs.append(1)
+        release.wait(5)
+        return {'total': 42}
+
+    threads, outcomes = concurrent(flights, 'summary', compute)
+    wait_for_followers(flights, release)
+    for thread in threads:
+        thread.join()
+
+    assert len(runs) == 1
+    assert all(outcome is outcomes[0] for outcome in outcomes)
+    assert flights.stats() == {"in_flight": 0, "executed": 1, "coalesced": CALLERS - 1}
+
+
+def test_errors_reach_every_caller():
+    flights, release = SingleFlight(), threading.Event()
+
+    def fail():
+        release.wait(5)
+        raise RuntimeError("database went away")
+
+    threads, outcomes = concurrent(flights, 'summary', fail)
+    wait_for_followers(flights, release)
+    for thread in threads:
+        thread.join()
+
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    # Nothing is kept: the next call runs again.
+    assert flights.do('summary', lambda: 'ok') == 'ok'
+    assert flights.stats()['executed'] == 2
+
+
+def test_distinct_keys_do_not_coalesce():
+    flights = SingleFlight()
+    assert flights.do('a', lambda: 1) == 1
+    assert flights.do('b', lambda: 2) == 2
+    with pytest.raises(ValueError):
+        flights.do('c', lambda: int('x'))
+    assert flights.stats() == {"in_flight": 0, "executed": 3, "coalesced": 0}
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+
+from distribution import SKETCH_RELATIVE_ACCURACY, QuantileSketch, rank_bounds
+from sketches import GroupedHyperLogLog, HyperLogLog, SpaceSaving
+
+SHARDS = 4
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(2425)
+
+
+def merged(sketches):
+    first, *rest = sketches
+    for sketch in rest:
+        first.merge(sketch)
+    return first
+
+
+def test_quantile_sketch_merge_within_accuracy(rng):
+    incomes = np.round(rng.lognormal(11.5, 0.6, 20000), -2)
+    incomes[:50] = 0
+    shards = []
+    for part in np.array_split(rng.permutation(incomes), SHARDS):
+        sketch = QuantileSketch()
+        sketch.add(part)
+        shards.append(QuantileSketch.from_dict(sketch.to_dict()))
+    sketch = merged(shards)
+
+    whole = QuantileSketch()
+    whole.add(incomes)
+    assert sketch.buckets == whole.buckets and sketch.count == len(incomes)
+    for q in (0.001, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99):
+        lower, upper = rank_bounds(incomes, q)
+        assert lower * (1 - SKETCH_RELATIVE_ACCURACY) <= sketch.quantile(q) <= upper * (1 + SKETCH_RELATIVE_ACCURACY)
+
+    with pytest.raises(ValueError):
+        sketch.merge(QuantileSketch(accuracy=0.05))
+
+
+def test_space_saving_merge_bounds(rng):
+    labels = rng.zipf(1.3, 50000) % 5000
+    shards = []
+    for part in np.array_split(labels, SHARDS):
+        values, counts = np.unique(part, return_counts=True)
+        shards.append(SpaceSaving(capacity=200).update(dict(zip(values.tolist(), counts.astype(float).tolist()))))
+    sketch = merged(shards)
+
+    values, counts = np.unique(labels, return_counts=True)
+    truth = dict(zip(values.tolist(), counts.tolist()))
+    assert sketch.total == len(labels) and len(sketch) <= 200
+    for label, count in sketch.counts.items():
+        # Over-estimated by at most the label's error.
+        assert count - sketch.errors[label] <= truth[label] <= count
+    # Every label heavier than total / capacity per shard is kept.
+    heavy = [label for label, count in truth.items() if count > len(labels) / 200 * SHARDS]
+    assert heavy and set(heavy) <= set(sketch.counts)
+    top = [label for label, _ in sketch.most_common(5)]
+    assert top == sorted(truth, key=truth.get, reverse=True)[:5]
+
+
+def test_space_saving_exact_below_capacity():
+    shards = [SpaceSaving(capacity=10).update({'a': 3, 'b': 1}), SpaceSaving(capacity=10).update({'b': 4, 'c': 2})]
+    sketch = merged(shards)
+    assert sketch.most_common() == [('b', 5), ('a', 3), ('c', 2)]
+    assert set(sketch.errors.values()) == {0.0}
+
+
+def test_hyperloglog_merge_error(rng):
+    ids = rng.choice(10 ** 9, 60000, replace=False)
+    shards = []
+    for start in range(SHARDS):
+        # Overlapping slices: every id falls in one or two shards.
+        part = ids[start * 12000:start * 12000 + 24000]
+        shards.append(HyperLogLog.from_dict(HyperLogLog().add(part).to_dict()))
+    sketch = merged(shards)
+
+    whole = HyperLogLog().add(ids[:SHARDS * 12000 + 12000])
+    assert np.array_equal(sketch.registers, whole.registers)
+    error = 1.04 / np.sqrt(len(sketch.registers))
+    assert abs(sketch.count() - 60000) <= 3 * error * 60000
+    assert abs(HyperLogLog().add(ids[:100]).count() - 100) <= 2
+
+    with pytest.raises(ValueError):
+        sketch.merge(HyperLogLog(precision=10))
+
+
+def test_grouped_hyperloglog_merge(rng):
+    labels = rng.choice(['BR DISTRICT 1', 'BR DISTRICT 2', 'WB DISTRICT 1'], 30000)
+    institutions = rng.integers(0, 5000, 30000)
+    sketch = merged([GroupedHyperLogLog().add(labels[i::SHARDS], institutions[i::SHARDS]) for i in range(SHARDS)])
+    error = 1.04 / np.sqrt(1 << sketch.precision)
+    for label, count in sketch.counts():
+        truth = len(np.unique(institutions[labels == label]))
+        assert abs(count - truth) <= 3 * error * truth
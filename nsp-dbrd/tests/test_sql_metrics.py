@@ -0,0 +1,91 @@
+import os
+import re
+
+import pytest
+
+from benchmark.generate import PostgresTarget, generate
+from conftest import FIXTURE_ROWS
+from master_data import MasterData
+from metrics import METRICS
+from sql_metrics import compare_with_frame, compile_fused, fusable, fused_results
+
+# A scratch PostgreSQL database (its benchmark tables are replaced) to run
+# the GROUPING SETS queries on; those tests are skipped without one.
+POSTGRES_DSN = os.getenv('NSP_TEST_POSTGRES_DSN')
+
+FILTERS = [
+    None,
+    {'state': ('BIHAR',)},
+    {'gender': ('F',)},
+    {'category': ('OBC', 'SC')},
+    {'scheme_id': (1,)},
+    {'state': ('WEST BENGAL',), 'gender': ('M',)},
+    {'institute_district': ('BR DISTRICT 1',)},
+]
+
+
+@pytest.mark.parametrize('filters', FILTERS, ids=str)
+def test_sql_matches_frame(conn, masters, frame, filters):
+    assert compare_with_frame(conn, frame, masters=masters, filters=filters) == {}
+
+
+def test_unpaid_applications_are_not_counted(conn, masters, frame):
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM data_applicant_payments_calculation "
+                "WHERE pay_amt_state_shr IS NULL AND pay_amt_centre_shr IS NULL")
+    assert cur.fetchone()[0] > 0
+    assert compare_with_frame(conn, frame, ['summary', 'top-states', 'gender-distribution'], masters) == {}
+
+
+def test_fused_query_without_grouping_sets(masters):
+    names = fusable(list(METRICS))
+    fused = compile_fused(names, {'gender': ('F',)}, masters, grouping_sets=False)
+    assert 'GROUPING SETS' not in fused.query
+    assert fused.query.count('UNION ALL') == len(fused.dimensions)
+    assert fused.dimensions == list(dict.fromkeys(METRICS[name].dimension for name in names if METRICS[name].dimension))
+
+
+def test_grouping_sets_query(masters):
+    names = fusable(list(METRICS))
+    fused = compile_fused(names, {'gender': ('F',)}, masters)
+    fallback = compile_fused(names, {'gender': ('F',)}, masters, grouping_sets=False)
+    keys = [f"k{i}" for i in range(len(fused.dimensions))]
+
+    assert fused.query.startswith(f"SELECT GROUPING({', '.join(keys)}) AS grouping_set, {', '.join(keys)}, ")
+    assert fused.query.endswith(f"GROUP BY GROUPING SETS ({', '.join(f'({key})' for key in keys)}, ())")
+    assert (fused.columns, fused.params, fused.dimensions) == (fallback.columns, fallback.params, fallback.dimensions)
+    rows = re.search(r"FROM \((SELECT .*)\) AS fused", fused.query, re.S).group(1)
+    assert fallback.query.startswith(f"WITH fused AS ({rows})\n")
+
+    # GROUPING(k0, ..., kn) sets the bit of every key a set leaves out, k0
+    # the most significant; the fallback spells the same masks out.
+    everything = (1 << len(keys)) - 1
+    masks = [int(mask) for mask in re.findall(r"SELECT (\d+) AS grouping_set", fallback.query)]
+    assert masks == [everything ^ (1 << (len(keys) - 1 - i)) for i in range(len(keys))] + [everything]
+
+
+@pytest.fixture(scope='module')
+def postgres():
+    if not POSTGRES_DSN:
+        pytest.skip("NSP_TEST_POSTGRES_DSN is not set")
+    import psycopg2
+
+    # The same generated data as the SQLite fixture.
+    generate(PostgresTarget(POSTGRES_DSN), FIXTURE_ROWS, seed=2425, replace=True)
+    conn = psycopg2.connect(POSTGRES_DSN)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('filters', FILTERS, ids=str)
+def test_grouping_sets_on_postgres(postgres, frame, filters):
+    masters = MasterData.load(postgres)
+    names = fusable(list(METRICS))
+    results = []
+    for grouping_sets in (True, False):
+        fused = compile_fused(names, filters, masters, grouping_sets=grouping_sets)
+        cur = postgres.cursor()
+        cur.execute(fused.query, fused.params)
+        results.append(fused_results(fused, names, cur.fetchall(), masters))
+    assert results[0] == results[1]
+    assert compare_with_frame(postgres, frame, masters=masters, filters=filters) == {}